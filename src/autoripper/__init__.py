@@ -77,6 +77,10 @@ SETTINGS_FILE = os.path.join(
     APPDIR,
     'settings.json',
 )
+CONTROL_SOCKET = os.path.join(
+    APPDIR,
+    'control.sock',
+)
 
 LOG = logging.getLogger(__name__)
 LOG.setLevel(logging.DEBUG)
@@ -0,0 +1,449 @@
+"""
+Disc changer (autoloader/robot) integration
+
+A batch job cycles discs from the slots of a changer through its drives
+with no prompts. Robot moves are run in background threads and the next
+disc is loaded as soon as a drive ejects, so unloading, loading and the
+scan of the next disc overlap with the final write of the previous rip.
+
+Changers are driven through a pluggable ChangerDriver; adapters for
+command-line tools (e.g., mtx) and simple serial protocols are provided,
+along with a simulated changer for testing.
+
+"""
+
+import logging
+import shlex
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import run
+
+from PyQt5 import QtCore
+
+try:
+    import serial
+except Exception:
+    serial = None
+
+COMMAND_TIMEOUT = 120.0  # Seconds allowed for a single robot move
+LOAD_TIMEOUT = 180.0  # Seconds for a loaded disc to be seen by watchdog
+
+
+class ChangerError(Exception):
+    pass
+
+
+class ChangerDriver:
+    """
+    Base class for changer drivers
+
+    Subclasses implement load() and unload(); the batch job holds the
+    driver's lock around every call so drivers need not be thread safe.
+
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+
+    def load(self, slot: int, drive: int) -> None:
+        """
+        Move disc from slot into drive
+
+        Raises:
+            ChangerError: If the move failed
+
+        """
+
+        raise NotImplementedError
+
+    def unload(self, drive: int, slot: int) -> None:
+        """
+        Move disc from drive back to slot
+
+        Raises:
+            ChangerError: If the move failed
+
+        """
+
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class CommandChanger(ChangerDriver):
+    """
+    Drive changer through external commands
+
+    Commands are templates formatted with slot and drive; e.g.,
+    'mtx -f /dev/sg3 load {slot} {drive}'.
+
+    """
+
+    def __init__(
+        self,
+        load: str,
+        unload: str,
+        timeout: float = COMMAND_TIMEOUT,
+    ):
+        super().__init__()
+        self.load_cmd = load
+        self.unload_cmd = unload
+        self.timeout = timeout
+
+    def _run(self, template: str, slot: int, drive: int) -> None:
+        cmd = shlex.split(template.format(slot=slot, drive=drive))
+        self.log.debug("Running changer command: %s", cmd)
+        try:
+            proc = run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=self.timeout,
+            )
+        except Exception as err:
+            raise ChangerError(f"Changer command failed: {err}")
+        if proc.returncode != 0:
+            raise ChangerError(
+                f"Changer command exited {proc.returncode}: "
+                f"{proc.stderr.strip()}"
+            )
+
+    def load(self, slot: int, drive: int) -> None:
+        self._run(self.load_cmd, slot, drive)
+
+    def unload(self, drive: int, slot: int) -> None:
+        self._run(self.unload_cmd, slot, drive)
+
+
+class SerialChanger(ChangerDriver):
+    """
+    Drive changer through a line-based serial protocol
+
+    Requires the optional pyserial package.
+
+    """
+
+    def __init__(
+        self,
+        port: str,
+        baudrate: int = 9600,
+        load: str = 'LOAD {slot} {drive}',
+        unload: str = 'UNLOAD {drive} {slot}',
+        ok: str = 'OK',
+        timeout: float = COMMAND_TIMEOUT,
+    ):
+        super().__init__()
+        if serial is None:
+            raise ChangerError(
+                "The 'pyserial' package is required for serial changers"
+            )
+        self.load_cmd = load
+        self.unload_cmd = unload
+        self.ok = ok
+        self.port = serial.Serial(port, baudrate, timeout=timeout)
+
+    def _send(self, template: str, slot: int, drive: int) -> None:
+        cmd = template.format(slot=slot, drive=drive)
+        self.log.debug("Sending changer command: %s", cmd)
+        self.port.reset_input_buffer()
+        self.port.write(cmd.encode() + b'\r\n')
+        reply = self.port.readline().decode(errors='ignore').strip()
+        if not reply.startswith(self.ok):
+            raise ChangerError(f"Changer replied '{reply}' to '{cmd}'")
+
+    def load(self, slot: int, drive: int) -> None:
+        self._send(self.load_cmd, slot, drive)
+
+    def unload(self, drive: int, slot: int) -> None:
+        self._send(self.unload_cmd, slot, drive)
+
+    def close(self) -> None:
+        self.port.close()
+
+
+class SimulatedChanger(ChangerDriver):
+    """
+    In-memory changer for testing
+
+    Keyword arguments:
+        delay (float): Seconds each move takes
+        on_load (callable): Called with (slot, drive) after a load;
+            e.g., to emit HANDLE_INSERT for a simulated disc
+        fail (set): Slots whose load should fail
+
+    """
+
+    def __init__(self, delay: float = 0.0, on_load=None, fail=()):
+        super().__init__()
+        self.delay = delay
+        self.on_load = on_load
+        self.fail = set(fail)
+        self.drives = {}
+        self.history = []
+
+    def load(self, slot: int, drive: int) -> None:
+        time.sleep(self.delay)
+        self.history.append(('load', slot, drive))
+        if slot in self.fail:
+            raise ChangerError(f"Simulated failure loading slot {slot}")
+        if drive in self.drives:
+            raise ChangerError(f"Drive {drive} is not empty")
+        self.drives[drive] = slot
+        if self.on_load is not None:
+            self.on_load(slot, drive)
+
+    def unload(self, drive: int, slot: int) -> None:
+        time.sleep(self.delay)
+        self.history.append(('unload', slot, drive))
+        if self.drives.pop(drive, None) != slot:
+            raise ChangerError(f"Drive {drive} does not hold slot {slot}")
+
+
+class ChangerBatch(QtCore.QObject):
+    """
+    Cycle discs from changer slots through drives without prompts
+
+    """
+
+    # Slot number and dev device it was loaded into
+    LOADED = QtCore.pyqtSignal(int, str)
+    # Slot number and whether it was processed without changer error
+    SLOT_DONE = QtCore.pyqtSignal(int, bool)
+    # Emitted once all slots are processed
+    FINISHED = QtCore.pyqtSignal()
+
+    def __init__(
+        self,
+        watchdog,
+        driver: ChangerDriver,
+        drives: dict[int, str],
+        slots,
+        *args,
+        load_timeout: float = LOAD_TIMEOUT,
+        **kwargs,
+    ):
+        """
+        Arguments:
+            watchdog (BaseWatchdog): Watchdog handling disc inserts
+            driver (ChangerDriver): Driver for the changer
+            drives (dict): Changer drive numbers mapped to dev devices
+            slots (iterable): Slot numbers to process, in order
+
+        Keyword arguments:
+            load_timeout (float): Seconds for the watchdog to report a
+                loaded disc before it is ejected; e.g., an empty slot or
+                a disc that is never recognized
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+
+        self.watchdog = watchdog
+        self.driver = driver
+        self.drives = dict(drives)
+        self.devs = {dev: drive for drive, dev in self.drives.items()}
+        self.load_timeout = load_timeout
+
+        self._slots = list(slots)
+        self._loaded = {}  # Drive number to slot loaded in it
+        self._unloading = set()
+        self._timers = {}  # Drive number to load timeout timer
+        self._seen = set()  # Drives whose disc was seen by the watchdog
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(len(self.drives), 1),
+            thread_name_prefix='changer',
+        )
+        self._running = False
+        self._prompts = None
+
+    @property
+    def remaining(self) -> int:
+        return len(self._slots)
+
+    def start(self) -> None:
+        """
+        Load a disc into every drive
+
+        """
+
+        self.log.info(
+            "Starting changer batch of %d slot(s) over %d drive(s)",
+            len(self._slots),
+            len(self.drives),
+        )
+        self._running = True
+        self._prompts = self.watchdog.prompts
+        self.watchdog.prompts = False
+        self.watchdog.HANDLE_INSERT.connect(self._inserted)
+        self.watchdog.DISC_EJECTED.connect(self._ejected)
+        self.watchdog.RIP_FINISHED.connect(self._rip_finished)
+        for drive in self.drives:
+            self._pool.submit(self._load_next, drive)
+
+    def stop(self) -> None:
+        """
+        Stop loading new discs; discs in drives are left in place
+
+        """
+
+        if not self._running:
+            return
+        self._running = False
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+        self.watchdog.HANDLE_INSERT.disconnect(self._inserted)
+        self.watchdog.DISC_EJECTED.disconnect(self._ejected)
+        self.watchdog.RIP_FINISHED.disconnect(self._rip_finished)
+        self.watchdog.prompts = self._prompts
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    @QtCore.pyqtSlot(str, str)
+    def _inserted(self, dev: str, disc_type: str):
+        # Watchdog saw the disc; it either rips or declines (and ejects)
+        drive = self.devs.get(dev, None)
+        if drive is None:
+            return
+        with self._lock:
+            self._seen.add(drive)
+        self._cancel_timer(drive)
+
+    def _cancel_timer(self, drive: int) -> None:
+        with self._lock:
+            timer = self._timers.pop(drive, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _load_timeout(self, drive: int, slot: int) -> None:
+        with self._lock:
+            stuck = (
+                self._running
+                and self._loaded.get(drive, None) == slot
+                and drive not in self._unloading
+                and drive not in self._seen
+            )
+        if not stuck:
+            return
+        self.log.warning(
+            "Disc from slot %d was not picked up by %s within %.0f s; "
+            "ejecting",
+            slot,
+            self.drives[drive],
+            self.load_timeout,
+        )
+        self.watchdog.eject(self.drives[drive])
+
+    @QtCore.pyqtSlot(str)
+    def _ejected(self, dev: str):
+        drive = self.devs.get(dev, None)
+        if drive is None:
+            return
+        self._cancel_timer(drive)
+        with self._lock:
+            if drive in self._unloading or drive not in self._loaded:
+                return
+            self._unloading.add(drive)
+        self._pool.submit(self._swap, drive)
+
+    @QtCore.pyqtSlot(str)
+    def _rip_finished(self, dev: str):
+        # Handlers normally eject on their own; make sure drive is cycled
+        # if a rip ended without an eject
+        drive = self.devs.get(dev, None)
+        if drive is None:
+            return
+        with self._lock:
+            pending = drive in self._loaded and drive not in self._unloading
+        if pending:
+            self.watchdog.eject(dev)
+
+    def _swap(self, drive: int) -> None:
+        """
+        Unload a drive and load the next slot into it
+
+        """
+
+        with self._lock:
+            slot = self._loaded.get(drive, None)
+
+        ok = True
+        try:
+            with self.driver.lock:
+                self.driver.unload(drive, slot)
+        except Exception as err:
+            ok = False
+            self.log.error(
+                "Failed to unload drive %d to slot %d: %s",
+                drive,
+                slot,
+                err,
+            )
+
+        with self._lock:
+            self._loaded.pop(drive, None)
+            self._unloading.discard(drive)
+        self.SLOT_DONE.emit(slot, ok)
+
+        if ok:
+            self._load_next(drive)
+        else:
+            self._check_finished()
+
+    def _load_next(self, drive: int) -> None:
+        while self._running:
+            with self._lock:
+                if not self._slots:
+                    break
+                slot = self._slots.pop(0)
+                self._seen.discard(drive)
+                # Set before the move so an eject of a disc declined as
+                # soon as it is seen still cycles the drive
+                self._loaded[drive] = slot
+
+            try:
+                with self.driver.lock:
+                    self.driver.load(slot, drive)
+            except Exception as err:
+                with self._lock:
+                    self._loaded.pop(drive, None)
+                self.log.error(
+                    "Failed to load slot %d into drive %d: %s",
+                    slot,
+                    drive,
+                    err,
+                )
+                self.SLOT_DONE.emit(slot, False)
+                continue
+
+            timer = threading.Timer(
+                self.load_timeout,
+                self._load_timeout,
+                (drive, slot),
+            )
+            timer.daemon = True
+            with self._lock:
+                self._timers[drive] = timer
+            timer.start()
+            self.log.info(
+                "Loaded slot %d into %s",
+                slot,
+                self.drives[drive],
+            )
+            self.LOADED.emit(slot, self.drives[drive])
+            return
+
+        self._check_finished()
+
+    def _check_finished(self) -> None:
+        with self._lock:
+            done = not self._slots and not self._loaded
+        if done and self._running:
+            self.log.info("Changer batch finished")
+            self.FINISHED.emit()
+            self.stop()
@@ -0,0 +1,537 @@
+"""
+Incremental checksums of rip output
+
+Output files are hashed while they are written, by tailing them each time
+a rip reports progress, so the data is read back from the local page
+cache rather than from the network share. When the rip finishes, the
+remaining tail is hashed and a checksum manifest is written next to each
+output file, so archival verification needs no extra read pass.
+
+Encoders and muxers rewrite headers once a file is complete (e.g., FLAC
+STREAMINFO, Matroska segment size and SeekHead), so the first HEAD bytes
+of a file are hashed on their own once the file is complete, and the
+rest as it is written. The digest in a manifest is the hash of those two
+digests (see file_digest()), not the plain hash of the file, so
+manifests are named <file>.<algorithm>-split and are checked with
+check_manifest() rather than sha256sum/xxhsum.
+
+Output files of a rip are found from the files the rip's processes (or
+its worker process and that worker's children) have open (Linux). If a
+rip has no known processes, the output directory is scanned for files
+created since the rip started, but only while no other such rip is
+running, as files could not be told apart. When the rip finishes, the
+directories its files were found in are scanned for files that were
+never seen open, e.g., a track written between two progress updates.
+
+"""
+
+import logging
+import os
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen
+
+from PyQt5 import QtCore
+
+from .priority import children
+from .sink import FileSink, SinkError
+
+try:
+    import xxhash
+except Exception:
+    xxhash = None
+
+CHUNK = 4 * 2**20  # Bytes read per chunk when hashing
+HEAD = 2**20  # Bytes at start of file hashed once the file is complete
+MIN_INTERVAL = 2.0  # Seconds between tails of the files of a rip
+SCAN_DEPTH = 3  # Directory levels below outdir scanned for new files
+EXTENSIONS = ('.mkv', '.flac', '.mp3', '.ogg', '.opus', '.wav', '.m4a')
+
+ALGORITHMS = ('sha256', 'xxh64')
+SUFFIX = '-split'  # Appended to algorithm for extension of manifests
+
+
+def new_hash(algorithm: str, data: bytes = b''):
+    if algorithm == 'xxh64':
+        if xxhash is None:
+            raise ValueError("The 'xxhash' package is required for xxh64")
+        return xxhash.xxh64(data)
+    return hashlib.new(algorithm, data)
+
+
+def combine(algorithm: str, head: bytes, body) -> str:
+    """
+    Digest of a file from its head bytes and the hash of the rest
+
+    Arguments:
+        algorithm (str): Hash algorithm
+        head (bytes): First HEAD bytes of the file
+        body: Hash object fed the bytes after the first HEAD
+
+    Returns:
+        str: Hex digest
+
+    """
+
+    out = new_hash(algorithm)
+    out.update(new_hash(algorithm, head).digest())
+    out.update(body.digest())
+    return out.hexdigest()
+
+
+def file_digest(path: str, algorithm: str) -> str:
+    """
+    Digest of a file as written to manifests, in a single read pass
+
+    """
+
+    body = new_hash(algorithm)
+    with open(path, mode='rb') as iid:
+        head = iid.read(HEAD)
+        while True:
+            data = iid.read(CHUNK)
+            if not data:
+                break
+            body.update(data)
+    return combine(algorithm, head, body)
+
+
+def check_manifest(manifest: str) -> bool:
+    """
+    Check a file against its manifest
+
+    Arguments:
+        manifest (str): Path of manifest; the file it describes is
+            expected in the same directory
+
+    Returns:
+        bool: True if the digest matches
+
+    """
+
+    algorithm = os.path.splitext(manifest)[1][1:].removesuffix(SUFFIX)
+    with open(manifest, mode='r') as iid:
+        digest, name = iid.readline().rstrip('\n').split('  ', 1)
+    path = os.path.join(os.path.dirname(manifest), name)
+    return file_digest(path, algorithm) == digest
+
+
+def open_files(pid: int, root: str) -> list[str]:
+    """
+    Get files below root that a process has open
+
+    Arguments:
+        pid (int): Process id
+        root (str): Directory files must be below
+
+    """
+
+    root = os.path.join(os.path.realpath(root), '')
+    fd_dir = f"/proc/{pid}/fd"
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return []
+
+    out = []
+    for fd in fds:
+        try:
+            path = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if path.startswith(root) and os.path.isfile(path):
+            out.append(path)
+    return out
+
+
+def new_files(root: str, since: float, depth: int = SCAN_DEPTH) -> list[str]:
+    """
+    Find output files below root modified since a time
+
+    """
+
+    out = []
+    stack = [(root, 0)]
+    while stack:
+        path, level = stack.pop()
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if level < depth:
+                        stack.append((entry.path, level + 1))
+                elif (
+                    entry.name.lower().endswith(EXTENSIONS)
+                    and entry.stat().st_mtime >= since
+                ):
+                    out.append(entry.path)
+            except OSError:
+                continue
+    return out
+
+
+class FileHasher:
+    """
+    Hash a file incrementally as it grows
+
+    Bytes after the first HEAD are hashed as they are written; the head
+    is read when the digest is taken, so headers rewritten once the file
+    is complete are hashed as finally written.
+
+    """
+
+    def __init__(self, path: str, algorithm: str):
+        self.path = path
+        self.algorithm = algorithm
+        self.inode = os.stat(path).st_ino
+        self.offset = HEAD  # Next byte to hash
+        self._body = new_hash(algorithm)
+
+    def update(self) -> None:
+        """
+        Hash bytes written since last update
+
+        """
+
+        if not os.path.exists(self.path) and not self._relocate():
+            return
+
+        try:
+            with open(self.path, mode='rb') as iid:
+                iid.seek(self.offset)
+                while True:
+                    data = iid.read(CHUNK)
+                    if not data:
+                        break
+                    self._body.update(data)
+                    self.offset += len(data)
+        except FileNotFoundError:
+            pass
+
+    def verify(self) -> bool:
+        """
+        Check that the bytes already hashed are still there
+
+        Returns:
+            bool: False if the file shrank, so must be hashed again
+
+        """
+
+        try:
+            size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            return True
+        return size >= self.offset
+
+    def rehash(self) -> None:
+        """
+        Hash whole file again from the start
+
+        """
+
+        self.offset = HEAD
+        self._body = new_hash(self.algorithm)
+        self.update()
+
+    def _relocate(self) -> bool:
+        """
+        Find file by inode if renamed within its directory
+
+        """
+
+        dirname = os.path.dirname(self.path)
+        try:
+            entries = list(os.scandir(dirname))
+        except OSError:
+            return False
+        for entry in entries:
+            try:
+                if entry.inode() == self.inode:
+                    self.path = entry.path
+                    return True
+            except OSError:
+                continue
+        return False
+
+    def hexdigest(self) -> str:
+        with open(self.path, mode='rb') as iid:
+            head = iid.read(HEAD)
+        return combine(self.algorithm, head, self._body)
+
+    def write_manifest(self, sink: FileSink | None = None) -> str:
+        """
+        Write checksum file next to the output file
+
+        Lines are formatted as for sha256sum/xxhsum, but the digest is
+        that of file_digest(); check with check_manifest().
+
+        Arguments:
+            sink (FileSink): Sink to write through; default writes
+                directly
+
+        Returns:
+            str: Path of manifest
+
+        """
+
+        manifest = f"{self.path}.{self.algorithm}{SUFFIX}"
+        text = f"{self.hexdigest()}  {os.path.basename(self.path)}\n"
+        if sink is None:
+            with open(manifest, mode='w') as oid:
+                oid.write(text)
+        else:
+            sink.write_file(manifest, text)
+        return manifest
+
+
+class RipHashes:
+    """
+    Hashers for all output files of one rip
+
+    """
+
+    def __init__(self, dev: str, outdir: str, algorithm: str):
+        self.dev = dev
+        self.outdir = outdir
+        self.algorithm = algorithm
+        self.started = time.time()
+        self.pids = set()
+        self.host = None  # Pid of worker process running the rip
+        self.files = {}
+        self.last = 0.0
+
+    @property
+    def scoped(self) -> bool:
+        """
+        Whether files of the rip can be told from those of other rips
+
+        """
+
+        return bool(self.pids) or self.host is not None
+
+    def discover(
+        self,
+        claimed,
+        exclusive: bool = True,
+        final: bool = False,
+    ) -> None:
+        """
+        Start hashing new output files of the rip
+
+        Arguments:
+            claimed (set): Files already claimed by any rip
+
+        Keyword arguments:
+            exclusive (bool): If no other unscoped rip is running, so
+                the output directory can be scanned when the processes
+                of this rip are not known
+            final (bool): If the rip finished; its processes are gone,
+                so the directories of its files are scanned for any
+                that were never seen open
+
+        """
+
+        pids = set(self.pids)
+        if self.host is not None:
+            pids.add(self.host)
+            pids.update(children(self.host))
+
+        paths = []
+        for pid in pids:
+            paths.extend(open_files(pid, self.outdir))
+        dirs = {os.path.dirname(hasher.path) for hasher in self.files.values()}
+        if final and dirs:
+            for dirname in dirs:
+                paths.extend(new_files(dirname, self.started, depth=0))
+        elif (final or not pids) and exclusive:
+            paths = new_files(self.outdir, self.started)
+
+        for path in paths:
+            if path in self.files or path in claimed:
+                continue
+            try:
+                self.files[path] = FileHasher(path, self.algorithm)
+            except OSError:
+                continue
+            claimed.add(path)
+
+    def update(self) -> None:
+        for hasher in self.files.values():
+            hasher.update()
+
+
+class Checksummer(QtCore.QObject):
+    """
+    Hash rip output while it is written and write manifests at the end
+
+    """
+
+    # Dev device and list of manifests written
+    MANIFESTS = QtCore.pyqtSignal(str, list)
+
+    def __init__(
+        self,
+        watchdog,
+        progress,
+        outdirs: dict,
+        *args,
+        algorithm: str = 'sha256',
+        sink: FileSink | None = None,
+        **kwargs,
+    ):
+        """
+        Arguments:
+            watchdog (BaseWatchdog): Watchdog running the rips
+            progress (ProgressDialog): Progress dialog used by handlers
+            outdirs (dict): Output directory for each disc type; values
+                may be callables so that settings changes are honored
+
+        Keyword arguments:
+            algorithm (str): Hash algorithm; one of ALGORITHMS
+            sink (FileSink): Sink manifests are written through; a
+                FileSink with default timeouts is created if not given
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+
+        new_hash(algorithm)  # Fail early if not available
+        self.watchdog = watchdog
+        self.algorithm = algorithm
+        self.outdirs = outdirs
+        self.sink = FileSink() if sink is None else sink
+
+        self._rips = {}
+        self._claimed = set()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='checksum',
+        )
+
+        progress.MKV_ADD_DISC.connect(self._mkv_add_disc)
+        progress.CD_ADD_DISC.connect(self._cd_add_disc)
+        progress.MKV_NEW_PROCESS.connect(self._new_process)
+        progress.MKV_CUR_TRACK.connect(self._tick)
+        progress.CD_CUR_TRACK.connect(self._tick)
+        progress.CD_TRACK_SIZE.connect(self._tick)
+        watchdog.RIP_FINISHED.connect(self._finished)
+
+    def _outdir(self, disc_type: str) -> str:
+        outdir = self.outdirs[disc_type]
+        return outdir() if callable(outdir) else outdir
+
+    def _start(self, dev: str, disc_type: str) -> None:
+        with self._lock:
+            self._rips[dev] = RipHashes(
+                dev,
+                self._outdir(disc_type),
+                self.algorithm,
+            )
+
+    @QtCore.pyqtSlot(str, dict, bool)
+    def _mkv_add_disc(self, dev: str, info: dict, full_disc: bool):
+        self._start(dev, 'video')
+
+    @QtCore.pyqtSlot(str)
+    def _cd_add_disc(self, dev: str):
+        self._start(dev, 'audio')
+
+    @QtCore.pyqtSlot(str, Popen, str)
+    def _new_process(self, dev: str, proc: Popen, pipe: str):
+        rip = self._rips.get(dev, None)
+        if rip is not None:
+            rip.pids.add(proc.pid)
+
+    def _tick(self, dev: str, *args):
+        rip = self._rips.get(dev, None)
+        if rip is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if dev in self._pending or now - rip.last < MIN_INTERVAL:
+                return
+            rip.last = now
+            self._pending.add(dev)
+        self._pool.submit(self._update, rip)
+
+    def _exclusive(self, rip: RipHashes) -> bool:
+        return all(
+            other.scoped
+            for other in self._rips.values()
+            if other is not rip
+        )
+
+    def _update(self, rip: RipHashes) -> None:
+        try:
+            with self._lock:
+                rip.host = self.watchdog.worker_pid(rip.dev)
+                rip.discover(self._claimed, self._exclusive(rip))
+            rip.update()
+        except Exception:
+            self.log.exception("%s - Failed to update checksums", rip.dev)
+        finally:
+            with self._lock:
+                self._pending.discard(rip.dev)
+
+    @QtCore.pyqtSlot(str)
+    def _finished(self, dev: str):
+        with self._lock:
+            rip = self._rips.pop(dev, None)
+        if rip is not None:
+            self._pool.submit(self._finalize, rip)
+
+    def _finalize(self, rip: RipHashes) -> None:
+        """
+        Hash remaining data and write manifests
+
+        Run in the hashing thread after any pending update of the rip
+
+        """
+
+        with self._lock:
+            rip.discover(self._claimed, self._exclusive(rip), final=True)
+
+        manifests = []
+        for hasher in rip.files.values():
+            try:
+                hasher.update()
+                if not hasher.verify():
+                    self.log.info(
+                        "%s - %s shrank, hashing again",
+                        rip.dev,
+                        hasher.path,
+                    )
+                    hasher.rehash()
+                manifests.append(hasher.write_manifest(self.sink))
+            except (OSError, SinkError) as err:
+                self.log.error(
+                    "%s - Failed to write checksum of %s: %s",
+                    rip.dev,
+                    hasher.path,
+                    err,
+                )
+
+        with self._lock:
+            self._claimed.difference_update(rip.files)
+            self._claimed.difference_update(
+                hasher.path for hasher in rip.files.values()
+            )
+
+        self.log.info(
+            "%s - Wrote %d checksum manifest(s)",
+            rip.dev,
+            len(manifests),
+        )
+        self.MANIFESTS.emit(rip.dev, manifests)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self.sink.close()
@@ -0,0 +1,402 @@
+"""
+Local control API
+
+JSON-RPC 2.0 server on a Unix socket for querying and driving the ripper
+without the GUI. Each request and response is a single line of JSON.
+Requests that change state are forwarded through Qt signals so they are
+run in the same thread, and through the same slots, as the tray menu and
+progress dialog. Settings changes block until applied so the version
+returned to the client is that of the new settings.
+
+Example:
+    $ echo '{"jsonrpc": "2.0", "id": 1, "method": "list_rips"}' \\
+        | socat - UNIX-CONNECT:/path/to/control.sock
+
+"""
+
+import logging
+import os
+import json
+import socket
+import socketserver
+import threading
+
+from PyQt5 import QtCore
+
+from . import CONTROL_SOCKET
+from .settings import SettingsError, validate
+
+JSONRPC = '2.0'
+
+# Standard JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class ControlError(RuntimeError):
+    pass
+
+
+class RPCError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Handle one client connection; may send many requests
+
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            response = self.server.control.dispatch(line)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Default backlog of 5 refuses connections (EAGAIN) when many
+    # clients connect at once
+    request_queue_size = socket.SOMAXCONN
+
+
+class ControlServer(QtCore.QObject):
+    """
+    Serve the control API for a watchdog and progress dialog
+
+    """
+
+    CANCEL = QtCore.pyqtSignal(str)
+    EJECT = QtCore.pyqtSignal(str)
+    PAUSE = QtCore.pyqtSignal()
+    RESUME = QtCore.pyqtSignal()
+    # Section of settings (video/audio), values to update, and a dict
+    # the slot fills with the new version or an error
+    SETTINGS = QtCore.pyqtSignal(str, dict, dict)
+
+    def __init__(
+        self,
+        watchdog,
+        progress,
+        *args,
+        settings=None,
+        path: str = CONTROL_SOCKET,
+        **kwargs,
+    ):
+        """
+        Arguments:
+            watchdog (BaseWatchdog): Watchdog handling disc inserts
+            progress (ProgressDialog): Progress dialog used by handlers
+
+        Keyword arguments:
+            settings (SettingsService): Settings to query and update
+            path (str): Path of the Unix socket to serve on
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+
+        self.watchdog = watchdog
+        self.progress = progress
+        self.settings = settings
+        self.path = path
+
+        self._server = None
+        self._thread = None
+
+        self.CANCEL.connect(self.progress.cancel_rip)
+        self.EJECT.connect(self.watchdog.eject)
+        self.PAUSE.connect(self.watchdog.pause)
+        self.RESUME.connect(self.watchdog.resume)
+        # Blocks the emitting request thread until the GUI thread applied
+        # the change; never emit from the GUI thread itself
+        self.SETTINGS.connect(
+            self._update_settings,
+            QtCore.Qt.BlockingQueuedConnection,
+        )
+
+        self.methods = {
+            'list_drives': self.list_drives,
+            'list_rips': self.list_rips,
+            'cancel': self.cancel,
+            'eject': self.eject,
+            'pause': self.pause,
+            'resume': self.resume,
+            'get_settings': self.get_settings,
+            'set_settings': self.set_settings,
+        }
+
+    def start(self) -> None:
+        """
+        Start serving in a background thread
+
+        """
+
+        self._remove_stale()
+
+        # Bind under a restrictive umask so the socket is never
+        # accessible to other users, not even briefly
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.control = self
+
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            daemon=True,
+        )
+        self._thread.start()
+        self.log.info("Control API listening on %s", self.path)
+
+    def _remove_stale(self) -> None:
+        """
+        Remove socket left by an instance that is no longer running
+
+        Raises:
+            ControlError: If another instance is serving on the socket
+
+        """
+
+        if not os.path.exists(self.path):
+            return
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(self.path)
+            return
+        finally:
+            sock.close()
+
+        raise ControlError(
+            f"Control socket {self.path} is in use by another instance"
+        )
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def dispatch(self, line: bytes) -> dict:
+        """
+        Run a single JSON-RPC request
+
+        Arguments:
+            line (bytes): Raw request
+
+        Returns:
+            dict: JSON-RPC response
+
+        """
+
+        rid = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RPCError(PARSE_ERROR, 'Parse error')
+
+            if not isinstance(request, dict):
+                raise RPCError(INVALID_REQUEST, 'Invalid request')
+
+            rid = request.get('id', None)
+            method = self.methods.get(request.get('method', None), None)
+            if method is None:
+                raise RPCError(METHOD_NOT_FOUND, 'Method not found')
+
+            params = request.get('params', {})
+            if isinstance(params, list):
+                result = method(*params)
+            elif isinstance(params, dict):
+                result = method(**params)
+            else:
+                raise RPCError(INVALID_PARAMS, 'Invalid params')
+        except RPCError as err:
+            return self._error(rid, err.code, err.message)
+        except TypeError as err:
+            return self._error(rid, INVALID_PARAMS, str(err))
+        except Exception as err:
+            self.log.exception("Control request failed")
+            return self._error(rid, INTERNAL_ERROR, str(err))
+
+        return {'jsonrpc': JSONRPC, 'id': rid, 'result': result}
+
+    def _error(self, rid, code: int, message: str) -> dict:
+        return {
+            'jsonrpc': JSONRPC,
+            'id': rid,
+            'error': {'code': code, 'message': message},
+        }
+
+    def list_drives(self) -> list[dict]:
+        active = dict(self.watchdog.active())
+        return [
+            {'dev': dev, 'busy': dev in active}
+            for dev in self.watchdog.drives()
+        ]
+
+    def list_rips(self) -> dict:
+        rips = self.progress.snapshot()
+        for dev, disc_type in self.watchdog.active():
+            rips.setdefault(dev, {'type': disc_type})
+        return {
+            'paused': self.watchdog.paused,
+            'queued': [
+                {'dev': dev, 'type': disc_type}
+                for dev, disc_type in self.watchdog.queued
+            ],
+            'rips': rips,
+        }
+
+    def cancel(self, dev: str) -> bool:
+        self.log.info("%s - Cancel requested through control API", dev)
+        self.CANCEL.emit(dev)
+        return True
+
+    def eject(self, dev: str) -> bool:
+        self.log.info("%s - Eject requested through control API", dev)
+        self.EJECT.emit(dev)
+        return True
+
+    def pause(self) -> bool:
+        self.PAUSE.emit()
+        return True
+
+    def resume(self) -> bool:
+        self.RESUME.emit()
+        return True
+
+    def get_settings(self, section: str | None = None) -> dict:
+        current = self._settings().snapshot.to_dict()
+        if section is None:
+            return current
+        if section not in current:
+            raise RPCError(INVALID_PARAMS, f"No settings for '{section}'")
+        return {section: current[section]}
+
+    def set_settings(self, section: str, **values) -> int:
+        service = self._settings()
+        try:
+            validate({section: values})
+        except SettingsError as err:
+            raise RPCError(INVALID_PARAMS, str(err))
+        reply = {}
+        self.SETTINGS.emit(section, values, reply)
+        if 'error' in reply:
+            raise RPCError(INVALID_PARAMS, reply['error'])
+        return reply.get('version', service.version)
+
+    def _settings(self):
+        if self.settings is None:
+            raise RPCError(INTERNAL_ERROR, 'Settings are not available')
+        return self.settings
+
+    @QtCore.pyqtSlot(str, dict, dict)
+    def _update_settings(self, section: str, values: dict, reply: dict):
+        try:
+            self.settings.update(section, values)
+        except SettingsError as err:
+            self.log.error("Failed to update settings: %s", err)
+            reply['error'] = str(err)
+            return
+        reply['version'] = self.settings.version
+
+
+class ControlClient:
+    """
+    Minimal client for the control API
+
+    Example:
+        >>> with ControlClient() as client:
+        ...     client.call('list_rips')
+
+    """
+
+    def __init__(self, path: str = CONTROL_SOCKET, timeout: float = 10.0):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._rfile = None
+        self._id = 0
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def connect(self) -> None:
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(self.timeout)
+        self._sock.connect(self.path)
+        self._rfile = self._sock.makefile('rb')
+
+    def close(self) -> None:
+        if self._sock is None:
+            return
+        self._rfile.close()
+        self._sock.close()
+        self._sock = None
+        self._rfile = None
+
+    def call(self, method: str, **params):
+        """
+        Call a method on the server
+
+        Arguments:
+            method (str): Name of the method
+
+        Keyword arguments:
+            Passed as the params of the request
+
+        Returns:
+            The result of the call
+
+        Raises:
+            RPCError: If the server returned an error
+
+        """
+
+        self._id += 1
+        request = {
+            'jsonrpc': JSONRPC,
+            'id': self._id,
+            'method': method,
+            'params': params,
+        }
+        self._sock.sendall(json.dumps(request).encode() + b'\n')
+        response = json.loads(self._rfile.readline())
+        if response.get('id', None) != self._id:
+            raise RPCError(
+                INTERNAL_ERROR,
+                f"Response id {response.get('id', None)} does not match "
+                f"request id {self._id}",
+            )
+        if 'error' in response:
+            raise RPCError(
+                response['error']['code'],
+                response['error']['message'],
+            )
+        return response['result']
@@ -0,0 +1,855 @@
+"""
+Asyncio core for device events, rip queue, subprocesses and timers
+
+Everything runs as tasks on a single asyncio event loop: device events
+are read from udev by a file descriptor reader rather than a polling
+thread, rips are taken from a queue by a fixed number of workers, and
+external programs are run with asyncio subprocesses. Thousands of
+drives therefore cost a coroutine each, not a thread each.
+
+With the GUI, a QtBridge runs the core and forwards its events as Qt
+signals; it uses qasync to share Qt's event loop when that package is
+installed and otherwise runs the asyncio loop in one background thread.
+Without the GUI, the core runs under asyncio.run(); see cli().
+
+"""
+
+import logging
+import argparse
+import asyncio
+import contextlib
+import inspect
+import random
+import shlex
+import signal
+import threading
+import time
+
+from PyQt5 import QtCore
+from PyQt5 import QtWidgets
+
+try:
+    import qasync
+except Exception:
+    qasync = None
+
+try:
+    import pyudev
+except Exception:
+    pyudev = None
+
+from .watchdogs import KEY, CHANGE, STATUS, EJECT, READY
+from .watchdogs.classify import DiscClassifier
+
+CONCURRENCY = 4  # Rips run at the same time
+KILL_AFTER = 5.0  # Seconds between terminate and kill of a subprocess
+
+# Kinds of device events
+INSERT = 'insert'
+EJECTED = 'ejected'
+DECLINED = 'declined'  # Disc inserted, but nothing on it to rip
+FINISHED = 'finished'
+
+
+class DeviceEvent:
+    """
+    Disc inserted into or ejected from a drive
+
+    """
+
+    __slots__ = ('kind', 'dev', 'disc_type')
+
+    def __init__(self, kind: str, dev: str, disc_type: str | None = None):
+        self.kind = kind
+        self.dev = dev
+        self.disc_type = disc_type
+
+    def __repr__(self):
+        return f"DeviceEvent({self.kind!r}, {self.dev!r}, {self.disc_type!r})"
+
+
+async def run_command(
+    cmd: list[str],
+    on_line=None,
+    timeout: float | None = None,
+    kill_after: float = KILL_AFTER,
+) -> int:
+    """
+    Run a command, passing each line of its output to on_line
+
+    The process is terminated (then killed) if the timeout passes or the
+    calling task is cancelled.
+
+    Arguments:
+        cmd (list): Command and arguments
+        on_line (callable): Called with each line of stdout/stderr
+        timeout (float): Seconds the command may run
+        kill_after (float): Seconds to wait after terminate before kill
+
+    Returns:
+        int: Return code of the process
+
+    Raises:
+        asyncio.TimeoutError: If the timeout passed
+
+    """
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    try:
+        await asyncio.wait_for(_pump(proc, on_line), timeout)
+        return await proc.wait()
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        await _terminate(proc, kill_after)
+        raise
+
+
+async def _pump(proc, on_line) -> None:
+    async for line in proc.stdout:
+        if on_line is not None:
+            on_line(line.decode(errors='replace').rstrip())
+
+
+async def _terminate(proc, kill_after: float) -> None:
+    if proc.returncode is not None:
+        return
+    proc.terminate()
+    try:
+        await asyncio.wait_for(proc.wait(), kill_after)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+
+
+def every(interval: float, func, *args) -> asyncio.Task:
+    """
+    Call func every interval seconds until the returned task is cancelled
+
+    func may be a plain function or a coroutine function
+
+    """
+
+    async def _loop():
+        while True:
+            await asyncio.sleep(interval)
+            result = func(*args)
+            if inspect.isawaitable(result):
+                await result
+
+    return asyncio.ensure_future(_loop())
+
+
+class EventSource:
+    """
+    Base class for sources of device events
+
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger(__name__)
+
+    def events(self):
+        """
+        Asynchronous iterator of DeviceEvent
+
+        """
+
+        raise NotImplementedError
+
+    async def eject(self, dev: str) -> None:
+        raise NotImplementedError
+
+
+class UdevSource(EventSource):
+    """
+    Device events from udev (Linux)
+
+    Drives with a disc in them at start are reported as inserts. Each
+    inserted disc is probed in a task of its own, so discs in different
+    drives are classified at the same time.
+
+    """
+
+    def __init__(self, probe=None, scan: bool = True):
+        """
+        Keyword arguments:
+            probe (callable): Called with dev device of a drive with a
+                disc in it; returns disc type or None if nothing to rip.
+                Run in an executor as it reads from the drive. Default
+                classifies the disc with DiscClassifier
+            scan (bool): Report discs already in drives at start
+
+        """
+
+        super().__init__()
+        if pyudev is None:
+            raise RuntimeError("The 'pyudev' package is required")
+        self.context = pyudev.Context()
+        self.scan = scan
+        self._probe = probe or self._classify
+        self._classifier = DiscClassifier()
+        self._queue = None
+        self._probes = {}  # dev to task probing the disc in the drive
+
+    def _classify(self, dev: str) -> str | None:
+        # Runs in executor threads, concurrently during the startup scan,
+        # so it cannot share the Context the monitor uses on the loop
+        context = pyudev.Context()
+        device = pyudev.Devices.from_device_file(context, dev)
+        props = device.properties
+        if props.get('ID_CDROM_MEDIA', '') != '1':
+            return None
+        if props.get(STATUS, '') not in ('', 'complete'):
+            return None
+        return self._classifier.classify(dev, props).handler
+
+    def drives(self) -> list[str]:
+        return sorted(
+            device.device_node
+            for device in self.context.list_devices(
+                subsystem='block',
+                ID_CDROM='1',
+            )
+            if device.device_node
+        )
+
+    async def events(self):
+        loop = asyncio.get_running_loop()
+        monitor = pyudev.Monitor.from_netlink(self.context)
+        monitor.filter_by(subsystem='block')
+        # Start monitor first so inserts during the scan are not lost
+        monitor.start()
+
+        self._queue = asyncio.Queue()
+        loop.add_reader(monitor.fileno(), self._readable, loop, monitor)
+        try:
+            if self.scan:
+                for dev in self.drives():
+                    self._spawn(loop, dev, decline=False)
+            while True:
+                yield await self._queue.get()
+        finally:
+            loop.remove_reader(monitor.fileno())
+            probes = list(self._probes.values())
+            for task in probes:
+                task.cancel()
+            await asyncio.gather(*probes, return_exceptions=True)
+
+    def _readable(self, loop, monitor) -> None:
+        while True:
+            device = monitor.poll(timeout=0)
+            if device is None:
+                return
+            self._parse(loop, device)
+
+    def _parse(self, loop, device) -> None:
+        props = device.properties
+        dev = props.get(KEY, None)
+        if dev is None:
+            return
+
+        if props.get(EJECT, '') or props.get(READY, '') == '0':
+            self._classifier.invalidate(dev)
+            task = self._probes.pop(dev, None)
+            if task is not None:
+                task.cancel()
+            self._queue.put_nowait(DeviceEvent(EJECTED, dev))
+            return
+
+        if props.get(CHANGE, '') != '1':
+            return
+        if props.get(STATUS, '') not in ('', 'complete'):
+            return
+        self._spawn(loop, dev, decline=True)
+
+    def _spawn(self, loop, dev: str, decline: bool) -> None:
+        """
+        Probe disc in drive in a task of its own
+
+        Keyword arguments:
+            decline (bool): Report a disc with nothing to rip as
+                DECLINED; not set for the startup scan, where the drive
+                may simply be empty
+
+        """
+
+        task = self._probes.pop(dev, None)
+        if task is not None:
+            task.cancel()
+        task = loop.create_task(self._insert(loop, dev, decline))
+        self._probes[dev] = task
+
+        def _done(_):
+            if self._probes.get(dev, None) is task:
+                del self._probes[dev]
+
+        task.add_done_callback(_done)
+
+    async def _insert(self, loop, dev: str, decline: bool) -> None:
+        try:
+            disc_type = await loop.run_in_executor(None, self._probe, dev)
+        except Exception as err:
+            self.log.warning("%s - Failed to probe drive: %s", dev, err)
+            return
+        if disc_type is not None:
+            self._queue.put_nowait(DeviceEvent(INSERT, dev, disc_type))
+        elif decline:
+            self.log.info("%s - Nothing to rip", dev)
+            self._queue.put_nowait(DeviceEvent(DECLINED, dev))
+
+    async def eject(self, dev: str) -> None:
+        await run_command(['eject', dev])
+
+
+class SimulatedSource(EventSource):
+    """
+    Simulated drives that have discs inserted at random intervals
+
+    Each drive is a coroutine waiting on a timer or its eject event, so
+    any number of drives run on one loop.
+
+    """
+
+    def __init__(
+        self,
+        count: int,
+        delay: tuple[float, float] = (0.1, 1.0),
+        disc_types: tuple[str, ...] = ('video', 'audio'),
+        seed: int | None = None,
+    ):
+        """
+        Arguments:
+            count (int): Number of simulated drives
+
+        Keyword arguments:
+            delay (tuple): Range of seconds between eject and next insert
+            disc_types (tuple): Disc types inserted, chosen at random
+            seed (int): Seed for random number generator
+
+        """
+
+        super().__init__()
+        self.devs = [f"/dev/sim{i}" for i in range(count)]
+        self.delay = delay
+        self.disc_types = disc_types
+        self._random = random.Random(seed)
+        self._ejected = {}
+        self._queue = None
+
+    async def events(self):
+        self._queue = asyncio.Queue()
+        self._ejected = {dev: asyncio.Event() for dev in self.devs}
+        tasks = [asyncio.ensure_future(self._drive(dev)) for dev in self.devs]
+        try:
+            while True:
+                yield await self._queue.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _drive(self, dev: str) -> None:
+        ejected = self._ejected[dev]
+        while True:
+            await asyncio.sleep(self._random.uniform(*self.delay))
+            ejected.clear()
+            disc_type = self._random.choice(self.disc_types)
+            self._queue.put_nowait(DeviceEvent(INSERT, dev, disc_type))
+            await ejected.wait()
+            self._queue.put_nowait(DeviceEvent(EJECTED, dev))
+
+    async def eject(self, dev: str) -> None:
+        event = self._ejected.get(dev, None)
+        if event is not None:
+            event.set()
+
+
+class CommandRipper:
+    """
+    Rip a disc by running a command
+
+    The command is a template formatted with dev and disc_type; e.g.,
+    'makemkvcon mkv dev:{dev} all /output'.
+
+    """
+
+    def __init__(self, template: str, timeout: float | None = None):
+        self.log = logging.getLogger(__name__)
+        self.template = template
+        self.timeout = timeout
+
+    async def __call__(self, dev: str, disc_type: str) -> bool:
+        cmd = shlex.split(self.template.format(dev=dev, disc_type=disc_type))
+        try:
+            code = await run_command(
+                cmd,
+                on_line=lambda line: self.log.debug("%s - %s", dev, line),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            self.log.error("%s - Rip timed out", dev)
+            return False
+        except OSError as err:
+            self.log.error("%s - Failed to run rip command: %s", dev, err)
+            return False
+        return code == 0
+
+
+class SimulatedRipper:
+    """
+    Rip that sleeps for a random time and fails at random
+
+    """
+
+    def __init__(
+        self,
+        duration: tuple[float, float] = (0.5, 2.0),
+        failure_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.duration = duration
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    async def __call__(self, dev: str, disc_type: str) -> bool:
+        await asyncio.sleep(self._random.uniform(*self.duration))
+        return self._random.random() >= self.failure_rate
+
+
+class RipQueue:
+    """
+    Queue of rips served by a fixed number of workers
+
+    """
+
+    def __init__(self, rip, concurrency: int = CONCURRENCY):
+        """
+        Arguments:
+            rip (callable): Coroutine function called with (dev,
+                disc_type) returning True if the rip succeeded
+
+        Keyword arguments:
+            concurrency (int): Number of rips run at the same time
+
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.rip = rip
+        self.concurrency = concurrency
+        self.on_finished = None
+
+        self._pending = {}  # dev to disc type of queued rips
+        self._active = {}  # dev to task of running rips
+        self._queue = None
+        self._gate = None
+        self._workers = []
+
+    @property
+    def queued(self) -> list[tuple[str, str]]:
+        return list(self._pending.items())
+
+    @property
+    def active(self) -> list[str]:
+        return list(self._active)
+
+    @property
+    def paused(self) -> bool:
+        return self._gate is not None and not self._gate.is_set()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._gate = asyncio.Event()
+        self._gate.set()
+        self._workers = [
+            asyncio.ensure_future(self._worker())
+            for _ in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def put(self, dev: str, disc_type: str) -> bool:
+        """
+        Queue rip of disc; ignored if the drive is queued or ripping
+
+        """
+
+        if dev in self._pending or dev in self._active:
+            return False
+        self._pending[dev] = disc_type
+        self._queue.put_nowait(dev)
+        return True
+
+    def discard(self, dev: str) -> None:
+        """
+        Drop queued rip and cancel running rip of drive
+
+        """
+
+        self._pending.pop(dev, None)
+        task = self._active.get(dev, None)
+        if task is not None:
+            task.cancel()
+
+    def pause(self) -> None:
+        self._gate.clear()
+
+    def resume(self) -> None:
+        self._gate.set()
+
+    async def _worker(self) -> None:
+        while True:
+            dev = await self._queue.get()
+            await self._gate.wait()
+            disc_type = self._pending.pop(dev, None)
+            if disc_type is None:
+                continue  # Discarded while queued
+
+            task = asyncio.ensure_future(self.rip(dev, disc_type))
+            self._active[dev] = task
+            try:
+                # wait() does not raise if only the rip was cancelled
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                self._active.pop(dev, None)
+
+            if task.cancelled():
+                self.log.info("%s - Rip cancelled", dev)
+                ok = False
+            elif task.exception() is not None:
+                self.log.error(
+                    "%s - Rip failed: %s",
+                    dev,
+                    task.exception(),
+                )
+                ok = False
+            else:
+                ok = bool(task.result())
+
+            if self.on_finished is not None:
+                await self.on_finished(dev, ok, task.cancelled())
+
+
+class Core:
+    """
+    Device events and rip queue on one asyncio loop
+
+    """
+
+    def __init__(
+        self,
+        source: EventSource,
+        rip=None,
+        concurrency: int = CONCURRENCY,
+        eject: bool = True,
+    ):
+        """
+        Arguments:
+            source (EventSource): Source of device events
+
+        Keyword arguments:
+            rip (callable): Coroutine function called with (dev,
+                disc_type) to rip a disc. If not given, events are only
+                passed to listeners; e.g., to Qt disc handlers
+            concurrency (int): Number of rips run at the same time
+            eject (bool): Eject discs when their rip finishes
+
+        """
+
+        self.log = logging.getLogger(__name__)
+        self.source = source
+        self.eject = eject
+        self.queue = None
+        if rip is not None:
+            self.queue = RipQueue(rip, concurrency=concurrency)
+            self.queue.on_finished = self._finished
+
+        self.stats = {'inserts': 0, 'ok': 0, 'failed': 0, 'cancelled': 0}
+        self._listeners = {
+            INSERT: [],
+            EJECTED: [],
+            DECLINED: [],
+            FINISHED: [],
+        }
+        self._stop = None
+        self._loop = None
+
+    def subscribe(self, kind: str, func) -> None:
+        """
+        Call func on events of a kind
+
+        Listeners of INSERT/EJECTED/DECLINED get (dev, disc_type); of
+        FINISHED get (dev, ok). They are called in the loop thread.
+
+        """
+
+        self._listeners[kind].append(func)
+
+    def _notify(self, kind: str, *args) -> None:
+        for func in self._listeners[kind]:
+            try:
+                func(*args)
+            except Exception:
+                self.log.exception("Listener for %s events failed", kind)
+
+    async def run(self) -> None:
+        """
+        Run until stop() is called
+
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        if self.queue is not None:
+            self.queue.start()
+
+        reader = asyncio.ensure_future(self._dispatch())
+        try:
+            await self._stop.wait()
+        finally:
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            if self.queue is not None:
+                await self.queue.stop()
+
+    def stop(self) -> None:
+        """
+        Stop the core; may be called from any thread
+
+        """
+
+        if self._loop is None or self._stop is None:
+            return
+        self._loop.call_soon_threadsafe(self._stop.set)
+
+    async def _dispatch(self) -> None:
+        async for event in self.source.events():
+            if event.kind == INSERT:
+                self.stats['inserts'] += 1
+                self.log.info(
+                    "%s - %s disc inserted",
+                    event.dev,
+                    event.disc_type,
+                )
+                self._notify(INSERT, event.dev, event.disc_type)
+                if self.queue is not None:
+                    self.queue.put(event.dev, event.disc_type)
+            elif event.kind == EJECTED:
+                self._notify(EJECTED, event.dev, None)
+                if self.queue is not None:
+                    self.queue.discard(event.dev)
+            elif event.kind == DECLINED:
+                self._notify(DECLINED, event.dev, None)
+
+    async def _finished(self, dev: str, ok: bool, cancelled: bool) -> None:
+        if cancelled:
+            self.stats['cancelled'] += 1
+        else:
+            self.stats['ok' if ok else 'failed'] += 1
+        self._notify(FINISHED, dev, ok)
+        if self.eject and not cancelled:
+            try:
+                await self.source.eject(dev)
+            except Exception as err:
+                self.log.warning("%s - Failed to eject: %s", dev, err)
+
+
+class QtBridge(QtCore.QObject):
+    """
+    Run a Core alongside the Qt event loop and forward its events
+
+    """
+
+    # Dev device and disc type string
+    HANDLE_INSERT = QtCore.pyqtSignal(str, str)
+    # Dev device whose disc was ejected
+    DEVICE_EJECTED = QtCore.pyqtSignal(str)
+    # Dev device with a disc that has nothing to rip
+    DISC_DECLINED = QtCore.pyqtSignal(str)
+    # Dev device and whether its rip succeeded
+    RIP_FINISHED = QtCore.pyqtSignal(str, bool)
+
+    def __init__(self, core: Core, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+        self.core = core
+        self._thread = None
+
+        # Signals emitted from the loop thread are queued to receivers
+        core.subscribe(INSERT, self.HANDLE_INSERT.emit)
+        core.subscribe(EJECTED, lambda dev, _: self.DEVICE_EJECTED.emit(dev))
+        core.subscribe(DECLINED, lambda dev, _: self.DISC_DECLINED.emit(dev))
+        core.subscribe(FINISHED, self.RIP_FINISHED.emit)
+
+    def exec_(self, app: QtWidgets.QApplication) -> int:
+        """
+        Run Qt event loop and the core until the application quits
+
+        Use in place of app.exec_()
+
+        """
+
+        if qasync is None:
+            self.start()
+            try:
+                return app.exec_()
+            finally:
+                self.stop()
+
+        self.log.debug("Running core on Qt event loop through qasync")
+        loop = qasync.QEventLoop(app)
+        asyncio.set_event_loop(loop)
+        with loop:
+            task = loop.create_task(self.core.run())
+            # Returns when the application quits
+            code = loop.run_forever()
+            # Let the core unwind (cancel rips, stop workers) before the
+            # loop closes
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                loop.run_until_complete(task)
+        return code or 0
+
+    def start(self) -> None:
+        """
+        Run the core in a background thread with its own loop
+
+        """
+
+        if self._thread is not None:
+            return
+        self.log.debug("Running core in background thread")
+        self._thread = threading.Thread(
+            target=asyncio.run,
+            args=(self.core.run(),),
+            name='core',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.core.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=KILL_AFTER)
+            self._thread = None
+
+
+async def _standalone(core: Core, run_for: float | None, report: float):
+    log = logging.getLogger(__name__)
+    started = time.monotonic()
+
+    def _report():
+        elapsed = time.monotonic() - started
+        active = len(core.queue.active) if core.queue else 0
+        queued = len(core.queue.queued) if core.queue else 0
+        log.warning(
+            "%.0f s: %d inserts, %d ok, %d failed, %d cancelled; "
+            "%d ripping, %d queued",
+            elapsed,
+            core.stats['inserts'],
+            core.stats['ok'],
+            core.stats['failed'],
+            core.stats['cancelled'],
+            active,
+            queued,
+        )
+
+    # Replace handlers installed by the watchdogs package
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, core.stop)
+        except NotImplementedError:
+            pass
+
+    timers = [every(report, _report)]
+    if run_for is not None:
+        timers.append(every(run_for, core.stop))
+    try:
+        await core.run()
+    finally:
+        for timer in timers:
+            timer.cancel()
+        _report()
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description='Run the asyncio core without the GUI',
+    )
+    parser.add_argument(
+        '--loglevel',
+        type=int,
+        default=30,
+        help='Set logging level',
+    )
+    parser.add_argument(
+        '--simulate',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Use N simulated drives instead of udev',
+    )
+    parser.add_argument(
+        '--command',
+        metavar='CMD',
+        help=(
+            'Command run to rip each disc; formatted with {dev} and '
+            '{disc_type}. Rips are simulated if not given'
+        ),
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=CONCURRENCY,
+        help='Number of rips run at the same time',
+    )
+    parser.add_argument(
+        '--run-for',
+        type=float,
+        default=None,
+        metavar='SECONDS',
+        help='Stop after this many seconds',
+    )
+    parser.add_argument(
+        '--report',
+        type=float,
+        default=10.0,
+        metavar='SECONDS',
+        help='Seconds between status reports',
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=args.loglevel,
+        format='%(asctime)s [%(levelname).4s] %(message)s',
+    )
+
+    if args.simulate > 0:
+        source = SimulatedSource(args.simulate)
+    else:
+        source = UdevSource()
+
+    if args.command:
+        rip = CommandRipper(args.command)
+    else:
+        rip = SimulatedRipper()
+
+    core = Core(source, rip=rip, concurrency=args.concurrency)
+    try:
+        asyncio.run(_standalone(core, args.run_for, args.report))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    cli()
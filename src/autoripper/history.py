@@ -0,0 +1,399 @@
+"""
+Persistent history of rips
+
+Every rip is recorded with when it ran, on which drive, how much it wrote
+and how it ended, in a sqlite database under APPDIR. Drives are told
+apart by model and serial number, so drives of the same model are
+reported separately. Rows are kept compact: drive names are stored once
+in a lookup table and output paths are zlib-compressed. Rows past the
+retention period or the row limit are removed periodically and the freed
+pages returned to the file system.
+
+Reports (e.g., throughput by drive) are answered from per-day totals
+that are updated as rips are recorded, so their cost depends on the
+number of days and drives, not on the number of rips.
+
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import APPDIR
+
+try:
+    from .ui.utils import get_identity
+except Exception:
+    get_identity = None
+
+HISTORY_FILE = os.path.join(APPDIR, 'history.db')
+
+RETENTION_DAYS = 365  # Days rows are kept
+MAX_ROWS = 1_000_000  # Rows kept regardless of age
+COMPACT_EVERY = 1000  # Inserts between compactions
+
+# Status of rips
+OK = 'ok'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+UNKNOWN = 'unknown'  # Handler did not report success or failure
+STATUS = (OK, FAILED, CANCELLED, UNKNOWN)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS drives ("
+    "id INTEGER PRIMARY KEY, "
+    "name TEXT UNIQUE NOT NULL, "
+    "model TEXT)",
+    "CREATE TABLE IF NOT EXISTS rips ("
+    "id INTEGER PRIMARY KEY, "
+    "started REAL NOT NULL, "
+    "finished REAL NOT NULL, "
+    "drive INTEGER NOT NULL REFERENCES drives(id), "
+    "dev TEXT, "
+    "disc_type INTEGER NOT NULL, "
+    "status INTEGER NOT NULL, "
+    "bytes INTEGER, "
+    "output BLOB)",
+    "CREATE INDEX IF NOT EXISTS rips_finished "
+    "ON rips (finished)",
+    "CREATE TABLE IF NOT EXISTS daily ("
+    "day INTEGER NOT NULL, "
+    "drive INTEGER NOT NULL, "
+    "status INTEGER NOT NULL, "
+    "rips INTEGER NOT NULL, "
+    "bytes INTEGER NOT NULL, "
+    "seconds REAL NOT NULL, "
+    "PRIMARY KEY (day, drive, status)) WITHOUT ROWID",
+)
+
+DAY = 86400  # Seconds per day of daily totals
+
+DISC_TYPES = ('video', 'audio')
+
+
+def output_size(path: str | None) -> int | None:
+    """
+    Get size of rip output; a file or directory of files
+
+    """
+
+    if not path:
+        return None
+    try:
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        size = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                size += os.path.getsize(os.path.join(root, name))
+        return size
+    except OSError:
+        return None
+
+
+class HistoryStore:
+    """
+    Store of rip history
+
+    Writes are done in a background thread so the GUI never waits on the
+    database; queries are run in the calling thread.
+
+    """
+
+    def __init__(
+        self,
+        path: str = HISTORY_FILE,
+        retention_days: float = RETENTION_DAYS,
+        max_rows: int = MAX_ROWS,
+    ):
+        self.log = logging.getLogger(__name__)
+        self.path = path
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Must be set before tables are created to take effect
+        self._db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode = WAL")
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+        self._drives = dict(self._db.execute("SELECT name, id FROM drives"))
+        self._identity = {}
+        self._inserts = 0
+        self._started = {}
+        self._written = {}  # Bytes in finished and current file of rips
+        self._pool = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='history',
+        )
+        self._pool.submit(self.compact)
+
+    def identity(self, dev: str) -> tuple[str, str]:
+        """
+        Get model and physical identity of drive; see get_identity()
+
+        """
+
+        ident = self._identity.get(dev, None)
+        if ident is None:
+            if get_identity is None:
+                ident = (dev, dev)
+            else:
+                ident = get_identity(dev)
+            self._identity[dev] = ident
+        return ident
+
+    def _drive_id(self, name: str, model: str) -> int:
+        drive_id = self._drives.get(name, None)
+        if drive_id is None:
+            drive_id = self._db.execute(
+                "INSERT INTO drives (name, model) VALUES (?, ?)",
+                (name, model),
+            ).lastrowid
+            self._drives[name] = drive_id
+        return drive_id
+
+    def started(self, dev: str) -> None:
+        """
+        Note start of rip in drive
+
+        """
+
+        self._started[dev] = time.time()
+        self._written.pop(dev, None)
+
+    def next_file(self, dev: str) -> None:
+        """
+        Note that a rip started writing its next output file
+
+        For rips that do not report their output when finished (e.g.,
+        audio tracks), together with file_size()
+
+        """
+
+        done, current = self._written.get(dev, (0, 0))
+        self._written[dev] = (done + current, 0)
+
+    def file_size(self, dev: str, size: int) -> None:
+        """
+        Note bytes written so far to current output file of a rip
+
+        """
+
+        done, _ = self._written.get(dev, (0, 0))
+        self._written[dev] = (done, size)
+
+    def finished(
+        self,
+        dev: str,
+        disc_type: str,
+        status: str,
+        output: str | None = None,
+    ) -> None:
+        """
+        Record a rip that finished
+
+        Arguments:
+            dev (str): Dev device
+            disc_type (str): Type of disc, either audio or video
+            status (str): One of STATUS
+            output (str): Output file or directory, if known
+
+        """
+
+        finished = time.time()
+        started = self._started.pop(dev, finished)
+        written = sum(self._written.pop(dev, (0, 0))) or None
+        # Drive identity is read before leaving the GUI thread as the
+        # drive may be reused by the time the write runs
+        model, drive = self.identity(dev)
+        self._pool.submit(
+            self._insert,
+            started,
+            finished,
+            drive,
+            model,
+            dev,
+            disc_type,
+            status,
+            output,
+            written,
+        )
+
+    def _insert(
+        self,
+        started,
+        finished,
+        drive,
+        model,
+        dev,
+        disc_type,
+        status,
+        output,
+        written,
+    ) -> None:
+        size = output_size(output)
+        if size is None:
+            size = written
+        blob = zlib.compress(output.encode()) if output else None
+        try:
+            with self._lock:
+                drive_id = self._drive_id(drive, model)
+                status_id = STATUS.index(status)
+                self._db.execute(
+                    "INSERT INTO rips (started, finished, drive, dev, "
+                    "disc_type, status, bytes, output) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        started,
+                        finished,
+                        drive_id,
+                        dev,
+                        DISC_TYPES.index(disc_type),
+                        status_id,
+                        size,
+                        blob,
+                    ),
+                )
+                self._db.execute(
+                    "INSERT INTO daily "
+                    "(day, drive, status, rips, bytes, seconds) "
+                    "VALUES (?, ?, ?, 1, ?, ?) "
+                    "ON CONFLICT (day, drive, status) DO UPDATE SET "
+                    "rips = rips + 1, "
+                    "bytes = bytes + excluded.bytes, "
+                    "seconds = seconds + excluded.seconds",
+                    (
+                        int(finished // DAY),
+                        drive_id,
+                        status_id,
+                        size or 0,
+                        # Only rips of known size count toward throughput
+                        0.0 if size is None else finished - started,
+                    ),
+                )
+                self._db.commit()
+        except (sqlite3.Error, ValueError) as err:
+            self.log.error("%s - Failed to record rip: %s", dev, err)
+            return
+
+        self._inserts += 1
+        if self._inserts % COMPACT_EVERY == 0:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Remove rows past retention/row limit and free unused pages
+
+        """
+
+        cutoff = time.time() - self.retention_days * DAY
+        with self._lock:
+            removed = self._db.execute(
+                "DELETE FROM rips WHERE finished < ?",
+                (cutoff,),
+            ).rowcount
+            self._db.execute(
+                "DELETE FROM daily WHERE day < ?",
+                (int(cutoff // DAY),),
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM rips").fetchone()
+            excess = count[0] - self.max_rows
+            if excess > 0:
+                removed += self._db.execute(
+                    "DELETE FROM rips WHERE id IN ("
+                    "SELECT id FROM rips ORDER BY finished LIMIT ?)",
+                    (excess,),
+                ).rowcount
+            self._db.commit()
+            if removed:
+                self._db.execute("PRAGMA incremental_vacuum")
+                self._db.commit()
+        if removed:
+            self.log.info("Removed %d old rip(s) from history", removed)
+
+    def throughput_by_drive(self, days: float = 30) -> list[dict]:
+        """
+        Summarize rips per drive, excluding failed and cancelled rips
+
+        Rips whose outcome is unknown (e.g., audio) are included. Totals
+        are kept per day, so the period covers whole days.
+
+        Arguments:
+            days (float): Days back from now to include
+
+        Returns:
+            list: One dict per drive with keys drive, model, rips, bytes,
+                seconds and rate (bytes per second), fastest first
+
+        """
+
+        since = int((time.time() - days * DAY) // DAY)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT d.name, d.model, SUM(t.rips), TOTAL(t.bytes), "
+                "TOTAL(t.seconds) "
+                "FROM daily AS t JOIN drives AS d ON d.id = t.drive "
+                "WHERE t.day >= ? AND t.status IN (?, ?) "
+                "GROUP BY t.drive",
+                (since, STATUS.index(OK), STATUS.index(UNKNOWN)),
+            ).fetchall()
+
+        out = [
+            {
+                'drive': name,
+                'model': model,
+                'rips': rips,
+                'bytes': int(nbytes),
+                'seconds': seconds,
+                'rate': nbytes / seconds if seconds else 0.0,
+            }
+            for name, model, rips, nbytes, seconds in rows
+        ]
+        out.sort(key=lambda row: row['rate'], reverse=True)
+        return out
+
+    def recent(self, limit: int = 100) -> list[dict]:
+        """
+        Get most recent rips, newest first
+
+        """
+
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT r.started, r.finished, d.name, d.model, r.dev, "
+                "r.disc_type, r.status, r.bytes, r.output "
+                "FROM rips AS r JOIN drives AS d ON d.id = r.drive "
+                "ORDER BY r.finished DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+        return [
+            {
+                'started': started,
+                'finished': finished,
+                'drive': drive,
+                'model': model,
+                'dev': dev,
+                'disc_type': DISC_TYPES[disc_type],
+                'status': STATUS[status],
+                'bytes': nbytes,
+                'output': zlib.decompress(blob).decode() if blob else None,
+            }
+            for (
+                started, finished, drive, model, dev,
+                disc_type, status, nbytes, blob,
+            ) in rows
+        ]
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,285 @@
+"""
+Adaptive CPU/IO priority for child processes
+
+While rips are active, processes that read from drives (MakeMKV, CD
+rippers), and the processes they run under (e.g., worker processes), get
+a raised IO priority while all other child processes (encoding, tagging,
+eject, etc.) are dropped to the idle IO class so they cannot starve the
+rips. When the drives go idle, every child is returned to default
+priority.
+
+Niceness is not changed: raising it cannot be undone without privileges
+and is inherited by any rip a process starts later. CPU is shared through
+cgroups instead; optionally, children are sorted into 'rip' and 'post'
+cgroup v2 groups below a delegated cgroup, whose io.weight and cpu.weight
+are adjusted as drives become busy or idle.
+
+Only supported on Linux; elsewhere the policy does nothing.
+
+"""
+
+import logging
+import os
+import sys
+import ctypes
+import platform
+
+from PyQt5 import QtCore
+
+INTERVAL = 5000  # Milliseconds between re-applying policy
+
+# Commands of processes that read from drives
+RIP_COMMANDS = {
+    'makemkvcon',
+    'cdparanoia',
+    'cd-paranoia',
+    'cdda2wav',
+    'icedax',
+    'cdrdao',
+}
+
+RIP = 'rip'
+POST = 'post'
+
+# See linux/ioprio.h
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_DEFAULT = (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | 4
+IOPRIO_HIGH = (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | 0
+IOPRIO_IDLE = IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+
+SYS_IOPRIO_SET = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'armv7l': 314,
+}
+
+# cgroup v2 weights for (busy, idle) drives
+WEIGHTS = {
+    RIP: (500, 100),
+    POST: (25, 100),
+}
+
+
+def _libc():
+    try:
+        return ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+
+
+LIBC = _libc() if sys.platform.startswith('linux') else None
+
+
+def ioprio_set(pid: int, value: int) -> bool:
+    """
+    Set IO priority of a process
+
+    Returns:
+        bool: False if not supported or failed
+
+    """
+
+    nr = SYS_IOPRIO_SET.get(platform.machine(), None)
+    if LIBC is None or nr is None:
+        return False
+    return LIBC.syscall(nr, IOPRIO_WHO_PROCESS, pid, value) == 0
+
+
+def io_priority(role: str, busy: bool) -> int:
+    """
+    Get IO priority for a process in a role
+
+    """
+
+    if not busy:
+        return IOPRIO_DEFAULT
+    return IOPRIO_HIGH if role == RIP else IOPRIO_IDLE
+
+
+def children(root: int | None = None) -> dict[int, tuple[str, int]]:
+    """
+    Get all descendant processes
+
+    Arguments:
+        root (int): Process to get descendants of; default is this process
+
+    Returns:
+        dict: Keys are pids, values are command name and parent pid
+
+    """
+
+    root = os.getpid() if root is None else root
+    tree = {}
+    names = {}
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", mode='r') as iid:
+                stat = iid.read()
+        except OSError:
+            continue
+        # Command may contain spaces/parens, so split on last paren
+        head, _, tail = stat.rpartition(')')
+        pid = int(entry)
+        ppid = int(tail.split()[1])
+        names[pid] = head.partition('(')[2]
+        parents[pid] = ppid
+        tree.setdefault(ppid, []).append(pid)
+
+    out = {}
+    stack = list(tree.get(root, []))
+    while stack:
+        pid = stack.pop()
+        out[pid] = (names[pid], parents[pid])
+        stack.extend(tree.get(pid, []))
+    return out
+
+
+def roles(procs: dict[int, tuple[str, int]], hosts=()) -> dict[int, str]:
+    """
+    Sort processes into rip and post-processing roles
+
+    Rip commands and all of their ancestors in procs are rips, so that
+    whatever a rip runs under is never deprioritized.
+
+    Arguments:
+        procs (dict): Result of children()
+
+    Keyword arguments:
+        hosts (iterable): Pids that are rips regardless of command; e.g.,
+            worker processes that have not started a rip command yet
+
+    Returns:
+        dict: Keys are pids, values are RIP or POST
+
+    """
+
+    out = {pid: RIP for pid in hosts if pid in procs}
+    for pid, (name, _) in procs.items():
+        if name not in RIP_COMMANDS:
+            continue
+        while pid in procs and out.get(pid, None) != RIP:
+            out[pid] = RIP
+            pid = procs[pid][1]
+    for pid in procs:
+        out.setdefault(pid, POST)
+    return out
+
+
+class ResourcePolicy(QtCore.QObject):
+    """
+    Adjust priority of child processes as drives become busy or idle
+
+    """
+
+    def __init__(
+        self,
+        watchdog,
+        *args,
+        cgroup: str | None = None,
+        interval: int = INTERVAL,
+        **kwargs,
+    ):
+        """
+        Arguments:
+            watchdog (BaseWatchdog): Watchdog tracking active rips
+
+        Keyword arguments:
+            cgroup (str): Path of a delegated cgroup v2 directory to
+                create rip/post groups in
+            interval (int): Milliseconds between re-applying policy
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+
+        self.watchdog = watchdog
+        self.cgroup = cgroup
+        self._applied = {}  # pid to (role, busy) last applied
+        self._busy = None
+
+        self.enabled = sys.platform.startswith('linux')
+        if not self.enabled:
+            self.log.info("Resource policy only supported on Linux")
+            return
+
+        if self.cgroup is not None:
+            self._setup_cgroup()
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.apply)
+        self._timer.start(interval)
+
+        self.watchdog.HANDLE_INSERT.connect(self._schedule)
+        self.watchdog.RIP_FINISHED.connect(self._schedule)
+
+    def _setup_cgroup(self) -> None:
+        try:
+            for role in WEIGHTS:
+                os.makedirs(os.path.join(self.cgroup, role), exist_ok=True)
+        except OSError as err:
+            self.log.error(
+                "Cannot use cgroup %s, disabling: %s",
+                self.cgroup,
+                err,
+            )
+            self.cgroup = None
+
+    def _cgroup_write(self, *path, value) -> None:
+        try:
+            with open(os.path.join(self.cgroup, *path), mode='w') as oid:
+                oid.write(str(value))
+        except OSError as err:
+            self.log.debug("Failed cgroup write %s: %s", path, err)
+
+    def _schedule(self, *args):
+        # Let handler start its processes before re-applying
+        QtCore.QTimer.singleShot(500, self.apply)
+
+    @QtCore.pyqtSlot()
+    def apply(self) -> None:
+        """
+        Apply policy to all child processes
+
+        """
+
+        busy = len(self.watchdog.active()) > 0
+        if busy != self._busy:
+            self.log.info(
+                "Drives %s; adjusting child process priorities",
+                'busy' if busy else 'idle',
+            )
+            self._busy = busy
+            if self.cgroup is not None:
+                for role, weights in WEIGHTS.items():
+                    weight = weights[0] if busy else weights[1]
+                    self._cgroup_write(role, 'io.weight', value=weight)
+                    self._cgroup_write(role, 'cpu.weight', value=weight)
+
+        procs = roles(children(), hosts=self.watchdog.worker_pids())
+        for pid in list(self._applied):
+            if pid not in procs:
+                del self._applied[pid]
+
+        for pid, role in procs.items():
+            if self._applied.get(pid, None) == (role, busy):
+                continue
+            self._apply(pid, role, busy)
+            self._applied[pid] = (role, busy)
+
+    def _apply(self, pid: int, role: str, busy: bool) -> None:
+        # Unlike niceness, any best-effort level can be restored
+        # without privileges
+        if not ioprio_set(pid, io_priority(role, busy)):
+            self.log.debug("Failed to set IO priority of %d", pid)
+
+        if self.cgroup is not None:
+            self._cgroup_write(role, 'cgroup.procs', value=pid)
@@ -0,0 +1,228 @@
+"""
+On-demand sampling profiler for the running application
+
+Stacks of all threads are sampled from a background thread through
+sys._current_frames(), so no tracing hooks slow down the profiled code.
+Samples are written as collapsed stacks (one 'frame;frame;frame count'
+line per unique stack) that flamegraph.pl, speedscope and inferno read
+directly.
+
+Qt event-loop latency is measured at the same time by emitting a signal
+from the sampling thread and timing how long the queued call waits before
+the GUI thread runs it.
+
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from PyQt5 import QtCore
+
+from . import LOGDIR
+
+INTERVAL = 0.01  # Seconds between stack samples
+LATENCY_INTERVAL = 0.1  # Seconds between event-loop latency probes
+MAX_DEPTH = 128  # Frames kept per stack
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '')
+    if not module:
+        module = os.path.basename(code.co_filename)
+    return f"{module}:{code.co_name}"
+
+
+def collapse(frame, thread: str) -> str:
+    """
+    Collapse a stack to a flamegraph line; outermost frame first
+
+    """
+
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(thread)
+    return ';'.join(reversed(names))
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(int(len(values) * pct / 100.0), len(values) - 1)
+    return values[idx]
+
+
+class _LatencyProbe(QtCore.QObject):
+    """
+    Measure how long queued calls wait for the GUI event loop
+
+    Must be created in the GUI thread; ping() is called from another
+    thread, so the PING signal is delivered through the event queue.
+
+    """
+
+    PING = QtCore.pyqtSignal(float)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self._lock = threading.Lock()
+        self.PING.connect(self._pong, QtCore.Qt.QueuedConnection)
+
+    def ping(self) -> None:
+        self.PING.emit(time.monotonic())
+
+    @QtCore.pyqtSlot(float)
+    def _pong(self, sent: float):
+        with self._lock:
+            self.latencies.append(time.monotonic() - sent)
+
+    def take(self) -> list:
+        with self._lock:
+            latencies, self.latencies = self.latencies, []
+        return latencies
+
+
+class SamplingProfiler(QtCore.QObject):
+    """
+    Sample stacks of all threads and Qt event-loop latency
+
+    """
+
+    # Path of collapsed stack file written when profiling stops
+    SAVED = QtCore.pyqtSignal(str)
+
+    def __init__(
+        self,
+        *args,
+        interval: float = INTERVAL,
+        outdir: str = LOGDIR,
+        **kwargs,
+    ):
+        """
+        Keyword arguments:
+            interval (float): Seconds between stack samples
+            outdir (str): Directory to write profiles to
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+
+        self.interval = interval
+        self.outdir = outdir
+
+        self._probe = _LatencyProbe(self)
+        self._stacks = Counter()
+        self._samples = 0
+        self._started = None
+        self._event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.log.info(
+            "Starting sampling profiler every %.0f ms",
+            self.interval * 1000,
+        )
+        self._stacks.clear()
+        self._samples = 0
+        self._probe.take()
+        self._started = time.time()
+        self._event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='profiler',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> str | None:
+        """
+        Stop profiling and write results to outdir
+
+        Returns:
+            str: Path of collapsed stack file, or None if not running
+
+        """
+
+        if not self.running:
+            return None
+        self._event.set()
+        self._thread.join()
+        self._thread = None
+        path = self._write()
+        self.SAVED.emit(path)
+        return path
+
+    def toggle(self) -> None:
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        next_ping = 0.0
+        while not self._event.wait(self.interval):
+            now = time.monotonic()
+            if now >= next_ping:
+                self._probe.ping()
+                next_ping = now + LATENCY_INTERVAL
+
+            names = {
+                thread.ident: thread.name
+                for thread in threading.enumerate()
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                thread = names.get(ident, f"thread-{ident}")
+                self._stacks[collapse(frame, thread)] += 1
+            self._samples += 1
+
+    def _write(self) -> str:
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self._started))
+        base = os.path.join(self.outdir, f"profile-{stamp}")
+
+        with open(f"{base}.folded", mode='w') as oid:
+            for stack, count in self._stacks.most_common():
+                oid.write(f"{stack} {count}\n")
+
+        latencies = self._probe.take()
+        summary = (
+            f"duration: {time.time() - self._started:.1f} s\n"
+            f"samples: {self._samples}\n"
+            f"event loop probes: {len(latencies)}\n"
+        )
+        if latencies:
+            summary += ''.join(
+                f"event loop latency {label}: {1000 * value:.2f} ms\n"
+                for label, value in (
+                    ('p50', percentile(latencies, 50)),
+                    ('p95', percentile(latencies, 95)),
+                    ('p99', percentile(latencies, 99)),
+                    ('max', max(latencies)),
+                )
+            )
+        with open(f"{base}-latency.txt", mode='w') as oid:
+            oid.write(summary)
+
+        self.log.info(
+            "Wrote profile of %d samples to %s.folded",
+            self._samples,
+            base,
+        )
+        return f"{base}.folded"
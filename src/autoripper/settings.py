@@ -0,0 +1,339 @@
+"""
+Hot-reloadable settings
+
+The settings file is watched for changes (inotify on Linux, through Qt's
+file system watcher) so hosts can be reconfigured without a restart.
+Edits are validated against a schema, pushed into the audio/video backend
+settings objects used by the handlers, and published as versioned,
+immutable snapshots. Subscribers are notified of which keys changed.
+
+"""
+
+import logging
+import os
+import json
+import threading
+from types import MappingProxyType
+
+from PyQt5 import QtCore
+
+from . import SETTINGS_FILE
+
+DEBOUNCE = 250  # Milliseconds to wait for writes to settle before reload
+
+SCHEMA = {
+    'video': {
+        'dbdir': str,
+        'outdir': str,
+        'everything': bool,
+        'extras': bool,
+        'show_status': bool,
+        'convention': str,
+    },
+    'audio': {
+        'outdir': str,
+    },
+}
+
+
+class SettingsError(ValueError):
+    pass
+
+
+def validate(settings: dict, base: dict | None = None) -> dict:
+    """
+    Validate settings against the schema
+
+    Arguments:
+        settings (dict): Settings keyed by section; e.g., video/audio
+
+    Keyword arguments:
+        base (dict): Settings to fill keys missing from settings
+
+    Returns:
+        dict: New dict of validated settings
+
+    Raises:
+        SettingsError: On unknown section/key or wrong value type
+
+    """
+
+    if not isinstance(settings, dict):
+        raise SettingsError('Settings must be a JSON object')
+
+    base = base or {}
+    out = {}
+    for section, schema in SCHEMA.items():
+        values = settings.get(section, {})
+        if not isinstance(values, dict):
+            raise SettingsError(f"Section '{section}' must be an object")
+
+        bad = set(values) - set(schema)
+        if bad:
+            raise SettingsError(
+                f"Unknown {section} settings: {', '.join(sorted(bad))}"
+            )
+
+        out[section] = dict(base.get(section, {}))
+        for key, val in values.items():
+            if not isinstance(val, schema[key]):
+                raise SettingsError(
+                    f"Setting {section}.{key} must be "
+                    f"{schema[key].__name__}, got {type(val).__name__}"
+                )
+            out[section][key] = val
+
+    bad = set(settings) - set(SCHEMA)
+    if bad:
+        raise SettingsError(
+            f"Unknown settings sections: {', '.join(sorted(bad))}"
+        )
+
+    return out
+
+
+class Snapshot:
+    """
+    Immutable, versioned view of settings
+
+    """
+
+    __slots__ = ('version', 'data')
+
+    def __init__(self, version: int, settings: dict):
+        self.version = version
+        self.data = MappingProxyType({
+            section: MappingProxyType(dict(values))
+            for section, values in settings.items()
+        })
+
+    def __getitem__(self, section):
+        return self.data[section]
+
+    def get(self, section: str, key: str, default=None):
+        return self.data.get(section, {}).get(key, default)
+
+    def to_dict(self) -> dict:
+        return {
+            section: dict(values)
+            for section, values in self.data.items()
+        }
+
+
+class SettingsService(QtCore.QObject):
+    """
+    Own the settings file and publish changes
+
+    """
+
+    # New version and changed keys; {section: [key, ...]}
+    CHANGED = QtCore.pyqtSignal(int, dict)
+
+    def __init__(
+        self,
+        *args,
+        backends: dict | None = None,
+        path: str = SETTINGS_FILE,
+        watch: bool = True,
+        **kwargs,
+    ):
+        """
+        Keyword arguments:
+            backends (dict): Backend settings objects keyed by section;
+                e.g., {'video': VIDEO_SETTINGS, 'audio': AUDIO_SETTINGS}
+            path (str): Settings file to own
+            watch (bool): If set, reload when file changes on disk
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+
+        self.path = path
+        self.backends = backends or {}
+
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._snapshot = Snapshot(0, {section: {} for section in SCHEMA})
+
+        self._debounce = QtCore.QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(DEBOUNCE)
+        self._debounce.timeout.connect(self.reload)
+
+        if os.path.isfile(self.path):
+            self.reload()
+        else:
+            self.sync_from_backends()
+
+        self._watcher = None
+        if watch:
+            self._watcher = QtCore.QFileSystemWatcher(self)
+            # Watch directory as well so atomic replacement is caught
+            self._watcher.addPath(os.path.dirname(self.path))
+            self._watcher.addPath(self.path)
+            self._watcher.fileChanged.connect(self._file_changed)
+            self._watcher.directoryChanged.connect(self._file_changed)
+
+    @property
+    def snapshot(self) -> Snapshot:
+        """
+        Current settings; safe to read from any thread
+
+        """
+
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def subscribe(self, callback) -> None:
+        """
+        Call callback(snapshot, changed) on every change
+
+        Arguments:
+            callback (callable): Called with new Snapshot and dict of
+                changed keys by section
+
+        """
+
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    @QtCore.pyqtSlot(str)
+    def _file_changed(self, path: str):
+        # Path is dropped from watcher when file is replaced; re-add it
+        watcher = self._watcher
+        if watcher is not None and self.path not in watcher.files():
+            if os.path.isfile(self.path):
+                watcher.addPath(self.path)
+        self._debounce.start()
+
+    @QtCore.pyqtSlot()
+    def reload(self) -> bool:
+        """
+        Load settings file and apply any changes
+
+        Returns:
+            bool: False if file could not be read or was invalid
+
+        """
+
+        try:
+            with open(self.path, 'r') as fid:
+                settings = json.load(fid)
+            settings = validate(settings, base=self._snapshot.to_dict())
+        except (OSError, ValueError) as err:
+            self.log.error(
+                "Ignoring invalid settings file %s: %s",
+                self.path,
+                err,
+            )
+            return False
+
+        self._apply(settings)
+        return True
+
+    @QtCore.pyqtSlot(str, dict)
+    def update(self, section: str, values: dict) -> None:
+        """
+        Update settings of a section and save to file
+
+        Arguments:
+            section (str): Settings section; e.g., video/audio
+            values (dict): Keys and values to update
+
+        Raises:
+            SettingsError: If values are invalid
+
+        """
+
+        settings = validate(
+            {section: values},
+            base=self._snapshot.to_dict(),
+        )
+        if self._apply(settings):
+            self._save()
+
+    def sync_from_backends(self) -> None:
+        """
+        Publish values currently held by backend settings objects
+
+        Used after the settings dialog saves to the backends.
+
+        """
+
+        settings = self._snapshot.to_dict()
+        for section, obj in self.backends.items():
+            for key in SCHEMA.get(section, {}):
+                if hasattr(obj, key):
+                    settings[section][key] = getattr(obj, key)
+
+        try:
+            settings = validate(settings)
+        except SettingsError as err:
+            self.log.error("Backend settings are invalid: %s", err)
+            return
+
+        self._apply(settings, push=False)
+        self._save()
+
+    def _save(self) -> None:
+        self.log.debug('Saving settings to %s', self.path)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as fid:
+            json.dump(self._snapshot.to_dict(), fid, indent=4)
+        os.replace(tmp, self.path)
+
+    def _apply(self, settings: dict, push: bool = True) -> bool:
+        """
+        Publish new settings if anything changed
+
+        Returns:
+            bool: True if settings changed
+
+        """
+
+        with self._lock:
+            old = self._snapshot
+            changed = {}
+            for section, values in settings.items():
+                keys = [
+                    key
+                    for key, val in values.items()
+                    if old.get(section, key, None) != val
+                    or key not in old[section]
+                ]
+                if keys:
+                    changed[section] = keys
+            if not changed:
+                return False
+            self._snapshot = Snapshot(old.version + 1, settings)
+            new = self._snapshot
+
+        self.log.info(
+            "Settings updated to version %d: %s",
+            new.version,
+            changed,
+        )
+
+        if push:
+            for section, keys in changed.items():
+                obj = self.backends.get(section, None)
+                if obj is None:
+                    continue
+                obj.update(**{key: new[section][key] for key in keys})
+                obj.save()
+
+        self.CHANGED.emit(new.version, changed)
+        for callback in list(self._subscribers):
+            try:
+                callback(new, changed)
+            except Exception:
+                self.log.exception("Settings subscriber failed")
+        return True
@@ -0,0 +1,275 @@
+"""
+Shared-memory progress table
+
+A fixed number of fixed-size binary records, one per drive, kept in a
+shared-memory block. Rip workers update their record in place; readers
+(the progress panel, metrics) sample the whole table on their own schedule
+instead of receiving a signal for every update.
+
+Each record is guarded by a sequence counter (seqlock): the single writer
+of a record makes the counter odd while writing and even when done, and
+readers retry a record whose counter was odd or changed while reading.
+
+"""
+
+import logging
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Record states
+IDLE = 0
+SCANNING = 1
+RIPPING = 2
+DONE = 3
+FAILED = 4
+
+STATES = {
+    IDLE: 'Idle',
+    SCANNING: 'Scanning',
+    RIPPING: 'Ripping',
+    DONE: 'Done',
+    FAILED: 'Failed',
+}
+
+SLOTS = 64  # Default number of records; i.e., max concurrent drives
+DEVLEN = 16  # Max bytes of dev device stored in record
+
+# seq, state, title, dev, done, total, updated
+RECORD = struct.Struct(f"<IBxh{DEVLEN}sQQd")
+SEQ = struct.Struct('<I')
+STATE = struct.Struct('<B')
+TITLE = struct.Struct('<h')
+BYTES = struct.Struct('<QQd')
+
+SEQ_OFFSET = 0
+STATE_OFFSET = 4
+TITLE_OFFSET = 6
+BYTES_OFFSET = 8 + DEVLEN
+
+RETRIES = 10  # Attempts to read a record being written before giving up
+
+
+class ProgressSlot:
+    """
+    Writer for a single record of the table
+
+    Only one ProgressSlot should write to a given record at a time.
+
+    """
+
+    __slots__ = ('table', 'buf', 'offset', '_seq')
+
+    def __init__(self, table, index: int):
+        # Hold reference to table so buffer is not released under us
+        self.table = table
+        self.buf = table.shm.buf
+        self.offset = index * RECORD.size
+        self._seq = SEQ.unpack_from(self.buf, self.offset)[0]
+
+    def _begin(self):
+        self._seq += 1
+        SEQ.pack_into(self.buf, self.offset + SEQ_OFFSET, self._seq)
+
+    def _end(self):
+        self._seq += 1
+        SEQ.pack_into(self.buf, self.offset + SEQ_OFFSET, self._seq)
+
+    def write(self, done: int, total: int) -> None:
+        """
+        Update bytes done and total of the record
+
+        Arguments:
+            done (int): Bytes (or units) done
+            total (int): Bytes (or units) in total
+
+        """
+
+        self._begin()
+        BYTES.pack_into(
+            self.buf,
+            self.offset + BYTES_OFFSET,
+            done,
+            total,
+            time.time(),
+        )
+        self._end()
+
+    def set_title(self, title: int) -> None:
+        self._begin()
+        TITLE.pack_into(self.buf, self.offset + TITLE_OFFSET, title)
+        BYTES.pack_into(
+            self.buf,
+            self.offset + BYTES_OFFSET,
+            0,
+            0,
+            time.time(),
+        )
+        self._end()
+
+    def set_state(self, state: int) -> None:
+        self._begin()
+        STATE.pack_into(self.buf, self.offset + STATE_OFFSET, state)
+        self._end()
+
+
+class SharedProgress:
+    """
+    Table of per-drive progress records in shared memory
+
+    """
+
+    def __init__(
+        self,
+        name: str | None = None,
+        slots: int = SLOTS,
+        create: bool = True,
+    ):
+        """
+        Keyword arguments:
+            name (str): Name of shared memory block; required to attach
+                to an existing table
+            slots (int): Number of records in a new table
+            create (bool): If set, create a new table, else attach
+
+        """
+
+        self.log = logging.getLogger(__name__)
+        self._owner = create
+        if create:
+            self.shm = shared_memory.SharedMemory(
+                name=name,
+                create=True,
+                size=slots * RECORD.size,
+            )
+            self.shm.buf[:] = bytes(len(self.shm.buf))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.slots = len(self.shm.buf) // RECORD.size
+        self._used = {}
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def claim(self, dev: str) -> int:
+        """
+        Assign a free record to a drive
+
+        A drive that already has a record (e.g., its worker is restarted
+        after a crash) keeps it, but the record is reset.
+
+        Arguments:
+            dev (str): Dev device
+
+        Returns:
+            int: Index of the record
+
+        Raises:
+            RuntimeError: If all records are in use
+
+        """
+
+        index = self._used.get(dev, None)
+        if index is None:
+            used = set(self._used.values())
+            for index in range(self.slots):
+                if index not in used:
+                    break
+            else:
+                raise RuntimeError(
+                    f"All {self.slots} progress records in use"
+                )
+
+        offset = index * RECORD.size
+        RECORD.pack_into(
+            self.shm.buf,
+            offset,
+            self._next_seq(offset),
+            SCANNING,
+            -1,
+            dev.encode()[:DEVLEN],
+            0,
+            0,
+            time.time(),
+        )
+        self._used[dev] = index
+        return index
+
+    def release(self, dev: str) -> None:
+        index = self._used.pop(dev, None)
+        if index is None:
+            return
+        offset = index * RECORD.size
+        RECORD.pack_into(
+            self.shm.buf,
+            offset,
+            self._next_seq(offset),
+            IDLE,
+            -1,
+            b'',
+            0,
+            0,
+            0.0,
+        )
+
+    def _next_seq(self, offset: int) -> int:
+        """
+        Even sequence number for a record rewritten by the supervisor
+
+        A worker that died mid-write leaves the sequence odd, which
+        readers take as a write in progress; round up to the next even
+        value so the record is readable again.
+
+        """
+
+        seq = SEQ.unpack_from(self.shm.buf, offset)[0]
+        return (seq | 1) + 1
+
+    def slot(self, index: int) -> ProgressSlot:
+        return ProgressSlot(self, index)
+
+    def read(self, index: int) -> tuple | None:
+        """
+        Read a consistent copy of one record
+
+        Returns:
+            tuple: (state, title, dev, done, total, updated), or None if
+                the record was being written on every attempt
+
+        """
+
+        offset = index * RECORD.size
+        for _ in range(RETRIES):
+            seq, *rec = RECORD.unpack_from(self.shm.buf, offset)
+            if seq & 1:
+                continue
+            if SEQ.unpack_from(self.shm.buf, offset)[0] == seq:
+                rec[2] = rec[2].rstrip(b'\x00').decode()
+                return tuple(rec)
+        return None
+
+    def sample(self) -> dict:
+        """
+        Read all records not idle
+
+        Returns:
+            dict: Keys are dev devices, values are tuples of
+                (state, title, done, total, updated)
+
+        """
+
+        out = {}
+        for index in range(self.slots):
+            rec = self.read(index)
+            if rec is None or rec[0] == IDLE:
+                continue
+            state, title, dev, done, total, updated = rec
+            out[dev] = (state, title, done, total, updated)
+        return out
+
+    def close(self) -> None:
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
@@ -0,0 +1,208 @@
+"""
+Output sink between the application and output directories
+
+Output directories are often mounted network shares, where every small
+write costs a round trip and a hung server can block the calling thread
+forever. A FileSink runs all file system calls on a small pool of
+long-lived worker threads and waits on them with a timeout, retrying
+transient errors with backoff, so a hung share raises SinkTimeout rather
+than blocking a rip.
+
+Small files (e.g., checksum manifests) are written to a temporary name
+and renamed into place as a single operation, so each costs one wait on
+the share and readers never see partial files. Rip output, including tag
+writes and the final renames, is written by the ripping backends
+(automakemkv, cdripper) and their subprocesses, not through the sink.
+
+SimulatedShare adds latency and injected failures to a local directory as
+a stand-in for a network share in testing.
+
+"""
+
+import logging
+import os
+import errno
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+TIMEOUT = 60.0  # Seconds allowed for a single operation
+RETRIES = 3  # Retries of an operation failing with a transient error
+BACKOFF = 1.0  # Seconds before first retry; doubled for each retry
+WORKERS = 4  # Worker threads per sink
+
+TMP_SUFFIX = '.partial'
+
+# Errors that a network share may recover from
+TRANSIENT = {
+    errno.EIO,
+    errno.EAGAIN,
+    errno.EINTR,
+    errno.ETIMEDOUT,
+    errno.ECONNRESET,
+    errno.ECONNABORTED,
+    errno.EHOSTUNREACH,
+    errno.ENETUNREACH,
+    getattr(errno, 'ESTALE', errno.EIO),
+}
+
+
+class SinkError(Exception):
+    pass
+
+
+class SinkTimeout(SinkError):
+    pass
+
+
+class FileSink:
+    """
+    File system operations with timeouts and retry
+
+    Relative paths are taken relative to root; absolute paths are used
+    as given.
+
+    """
+
+    def __init__(
+        self,
+        root: str = '',
+        timeout: float = TIMEOUT,
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+        workers: int = WORKERS,
+    ):
+        self.log = logging.getLogger(__name__)
+        self.root = root
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='sink',
+        )
+
+    def path(self, path: str) -> str:
+        return os.path.join(self.root, path)
+
+    def _io(self, func, *args):
+        """
+        Run a single file system call; hook for subclasses
+
+        """
+
+        return func(*args)
+
+    def retry(self, func, *args):
+        """
+        Run func in the calling thread, retrying transient errors
+
+        """
+
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                return self._io(func, *args)
+            except OSError as err:
+                if err.errno not in TRANSIENT or attempt == self.retries:
+                    raise
+                self.log.warning(
+                    "%s failed (%s); retry %d of %d in %.1f s",
+                    getattr(func, '__name__', func),
+                    err,
+                    attempt + 1,
+                    self.retries,
+                    delay,
+                )
+                time.sleep(delay)
+                delay *= 2
+
+    def call(self, func, *args):
+        """
+        Run func on a worker thread with retry and timeout
+
+        Raises:
+            SinkTimeout: If the operation did not finish in time; the
+                worker may still be blocked in the call
+
+        """
+
+        future = self._pool.submit(self.retry, func, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise SinkTimeout(
+                f"{getattr(func, '__name__', func)} did not finish in "
+                f"{self.timeout:.1f} s"
+            )
+
+    def makedirs(self, path: str) -> None:
+        self.call(os.makedirs, self.path(path), 0o777, True)
+
+    def rename(self, src: str, dst: str) -> None:
+        self.call(os.replace, self.path(src), self.path(dst))
+
+    def remove(self, path: str) -> None:
+        self.call(os.remove, self.path(path))
+
+    def write_file(self, path: str, data: bytes | str) -> None:
+        """
+        Write small file atomically
+
+        The whole write and rename run as one operation on a worker, so
+        a small file costs a single wait on the share.
+
+        """
+
+        if isinstance(data, str):
+            data = data.encode()
+        self.call(_write_replace, self.path(path), data)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _write_replace(path: str, data: bytes) -> None:
+    tmp = path + TMP_SUFFIX
+    with open(tmp, mode='wb') as oid:
+        oid.write(data)
+    os.replace(tmp, path)
+
+
+class SimulatedShare(FileSink):
+    """
+    Local directory that behaves like a slow, unreliable network share
+
+    Keyword arguments:
+        latency (float): Seconds added to every operation
+        failure_rate (float): Chance each operation fails with EIO
+        hang (float): Chance each operation sleeps for hang_time
+        hang_time (float): Seconds a hung operation blocks
+        Other keywords are passed to FileSink
+
+    """
+
+    def __init__(
+        self,
+        root: str,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        hang: float = 0.0,
+        hang_time: float = 3600.0,
+        **kwargs,
+    ):
+        super().__init__(root, **kwargs)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.hang = hang
+        self.hang_time = hang_time
+        self.calls = 0
+
+    def _io(self, func, *args):
+        self.calls += 1
+        time.sleep(self.latency)
+        if random.random() < self.hang:
+            time.sleep(self.hang_time)
+        if random.random() < self.failure_rate:
+            raise OSError(errno.EIO, 'Simulated share failure')
+        return func(*args)
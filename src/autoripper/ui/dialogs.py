@@ -1,3 +1,5 @@
+import time
+
 from PyQt5 import QtWidgets
 from PyQt5 import QtCore
 
@@ -54,3 +56,79 @@ class MyQDialog(QtWidgets.QDialog):
 
         super().done(arg)
         self.FINISHED.emit(self.dev, self.result())
+
+
+class HistoryDialog(QtWidgets.QDialog):
+    """
+    Show rip history; throughput by drive and recent rips
+
+    """
+
+    DAYS = 30  # Days summarized in throughput table
+    RECENT = 200  # Number of recent rips shown
+
+    def __init__(self, store, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setWindowTitle('Rip History')
+        self.resize(800, 500)
+
+        self.tabs = QtWidgets.QTabWidget()
+        self.tabs.addTab(
+            self._table(
+                ['Drive', 'Rips', 'GiB', 'Hours', 'MiB/s'],
+                [
+                    [
+                        row['drive'],
+                        row['rips'],
+                        f"{row['bytes'] / 2**30:.1f}",
+                        f"{row['seconds'] / 3600:.1f}",
+                        f"{row['rate'] / 2**20:.2f}",
+                    ]
+                    for row in store.throughput_by_drive(self.DAYS)
+                ],
+            ),
+            f"Throughput ({self.DAYS} days)",
+        )
+        self.tabs.addTab(
+            self._table(
+                ['Finished', 'Drive', 'Type', 'Status', 'Minutes', 'Output'],
+                [
+                    [
+                        time.strftime(
+                            '%Y-%m-%d %H:%M',
+                            time.localtime(row['finished']),
+                        ),
+                        row['drive'],
+                        row['disc_type'],
+                        row['status'],
+                        f"{(row['finished'] - row['started']) / 60:.1f}",
+                        row['output'] or '',
+                    ]
+                    for row in store.recent(self.RECENT)
+                ],
+            ),
+            'Recent',
+        )
+
+        button_box = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Close
+        )
+        button_box.rejected.connect(self.reject)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.tabs)
+        layout.addWidget(button_box)
+
+        self.setLayout(layout)
+
+    def _table(self, header, rows):
+        table = QtWidgets.QTableWidget(len(rows), len(header))
+        table.setHorizontalHeaderLabels(header)
+        table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        for i, row in enumerate(rows):
+            for j, val in enumerate(row):
+                table.setItem(i, j, QtWidgets.QTableWidgetItem(str(val)))
+        table.resizeColumnsToContents()
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
@@ -11,9 +11,15 @@ from cdripper import SETTINGS as AUDIO_SETTINGS
 from automakemkv import SETTINGS as VIDEO_SETTINGS
 from automakemkv.ui.dialogs import MissingDirDialog
 
-from .. import LOG, STREAM, NAME, APP_ICON, TRAY_ICON
+from .. import LOG, STREAM, NAME, APP_ICON, TRAY_ICON, CONTROL_SOCKET
+from ..settings import SettingsService
+from ..checksum import ALGORITHMS, Checksummer
+from ..profiler import SamplingProfiler
+from ..history import RETENTION_DAYS
 from ..watchdogs import linux
+from ..watchdogs.fingerprint import POLICIES
 from . import progress
+from . import progress_view
 from . import dialogs
 from . import utils
 
@@ -24,7 +30,23 @@ class SystemTray(QtWidgets.QSystemTrayIcon):
 
     """
 
-    def __init__(self, app, name=NAME):
+    def __init__(
+        self,
+        app,
+        name=NAME,
+        table_progress=False,
+        control_socket=None,
+        processes=False,
+        changer=None,
+        duplicates=None,
+        io_policy=False,
+        cgroup=None,
+        retries=0,
+        checksum=None,
+        profile=False,
+        history=None,
+        async_core=False,
+    ):
         super().__init__(QtGui.QIcon(TRAY_ICON), app)
         self.setToolTip(NAME)
 
@@ -44,6 +66,17 @@ class SystemTray(QtWidgets.QSystemTrayIcon):
         self._settings.triggered.connect(self.settings_widget)
         self._menu.addAction(self._settings)
 
+        self._history = QtWidgets.QAction('History')
+        self._history.triggered.connect(self.history_widget)
+        self._history.setVisible(history is not None)
+        self._menu.addAction(self._history)
+
+        self.profiler = SamplingProfiler()
+        self._profile = QtWidgets.QAction('Profile')
+        self._profile.setCheckable(True)
+        self._profile.toggled.connect(self.profile)
+        self._menu.addAction(self._profile)
+
         self._menu.addSeparator()
 
         self._quit = QtWidgets.QAction('Quit')
@@ -53,9 +86,77 @@ class SystemTray(QtWidgets.QSystemTrayIcon):
         self.setContextMenu(self._menu)
         self.setVisible(True)
 
-        self.progress = progress.ProgressDialog()
-        self.ripper = linux.Watchdog(self.progress)
-        self.ripper.start()
+        self.settings = SettingsService(
+            backends={'video': VIDEO_SETTINGS, 'audio': AUDIO_SETTINGS},
+        )
+
+        # Worker processes report progress through the panel's model (and
+        # shared memory), which the widget dialog does not have
+        if table_progress or processes:
+            self.progress = progress_view.ProgressPanel()
+        else:
+            self.progress = progress.ProgressDialog()
+        self.ripper = linux.Watchdog(
+            self.progress,
+            processes=processes,
+            duplicates=duplicates,
+            retries=retries,
+            history=history,
+        )
+
+        # The asyncio core replaces the watchdog thread's udev polling;
+        # disc handlers are still run by the watchdog
+        self.core = None
+        if async_core:
+            from ..core import Core, QtBridge, UdevSource
+            self.core = QtBridge(Core(UdevSource(probe=self.ripper.probe)))
+            self.core.HANDLE_INSERT.connect(self.ripper.HANDLE_INSERT)
+            self.core.DEVICE_EJECTED.connect(self.ripper.invalidate)
+            self.core.DISC_DECLINED.connect(self.ripper.decline)
+        else:
+            self.ripper.start()
+
+        self.policy = None
+        if io_policy or cgroup:
+            from ..priority import ResourcePolicy
+            self.policy = ResourcePolicy(self.ripper, cgroup=cgroup)
+
+        self.checksum = None
+        if checksum:
+            self.checksum = Checksummer(
+                self.ripper,
+                self.progress,
+                {
+                    'video': lambda: VIDEO_SETTINGS.outdir,
+                    'audio': lambda: AUDIO_SETTINGS.outdir,
+                },
+                algorithm=checksum,
+            )
+
+        self.control = None
+        if control_socket:
+            from ..control import ControlError, ControlServer
+            self.control = ControlServer(
+                self.ripper,
+                self.progress,
+                settings=self.settings,
+                path=control_socket,
+            )
+            try:
+                self.control.start()
+            except ControlError as err:
+                self.__log.error("Control API disabled: %s", err)
+                self.control = None
+
+        # Changer batch is started once the event loop is running
+        self.batch = None
+        if changer is not None:
+            from ..changer import ChangerBatch
+            self.batch = ChangerBatch(self.ripper, **changer)
+            QtCore.QTimer.singleShot(0, self.batch.start)
+
+        if profile:
+            self._profile.setChecked(True)
 
         # Set up check of output directory exists to run right after event
         # loop starts
@@ -71,10 +172,30 @@ class SystemTray(QtWidgets.QSystemTrayIcon):
         if settings_widget.exec_():
             AUDIO_SETTINGS.save()
             VIDEO_SETTINGS.save()
+            self.settings.sync_from_backends()
         elif settings_widget.changed:
             AUDIO_SETTINGS.cancel()
             VIDEO_SETTINGS.cancel()
 
+    def history_widget(self, *args, **kwargs):
+        if self.ripper.history is None:
+            return
+        dialogs.HistoryDialog(self.ripper.history).exec_()
+
+    def profile(self, enabled):
+        """Start/stop sampling profiler; results written to LOGDIR"""
+
+        if enabled:
+            self.profiler.start()
+            return
+
+        path = self.profiler.stop()
+        if path is not None:
+            self.showMessage(
+                f"{self._name} Profile",
+                f"Profile written to {path}",
+            )
+
     def quit(self, *args, **kwargs):
         """Display quit confirm dialog"""
         self.__log.info('Saving settings')
@@ -84,6 +205,7 @@ class SystemTray(QtWidgets.QSystemTrayIcon):
 
         if kwargs.get('force', False):
             self.__log.info('Force quit')
+            self.stop_services()
             self.ripper.quit()
             self._app.quit()
 
@@ -97,9 +219,24 @@ class SystemTray(QtWidgets.QSystemTrayIcon):
         )
         res = msg.exec_()
         if res == QtWidgets.QMessageBox.Yes:
+            self.stop_services()
             self.ripper.quit()
             self._app.quit()
 
+    def stop_services(self):
+        self.profiler.stop()
+        if self.core is not None:
+            self.core.stop()
+        if self.batch is not None:
+            self.batch.stop()
+            self.batch = None
+        if self.control is not None:
+            self.control.stop()
+            self.control = None
+        if self.checksum is not None:
+            self.checksum.close()
+            self.checksum = None
+
     def check_outdir_exists(self):
         """
         Check that video/audio output directory exists
@@ -117,7 +254,7 @@ class SystemTray(QtWidgets.QSystemTrayIcon):
                 f'{self._name}: Select Video Output Folder',
             )
             if path != '':
-                VIDEO_SETTINGS.update(outdir=path)
+                self.settings.update('video', {'outdir': path})
             self.check_outdir_exists()
 
         if not os.path.isdir(AUDIO_SETTINGS.outdir):
@@ -131,7 +268,7 @@ class SystemTray(QtWidgets.QSystemTrayIcon):
                 f'{self._name}: Select Audio Output Folder',
             )
             if path != '':
-                AUDIO_SETTINGS.update(outdir=path)
+                self.settings.update('audio', {'outdir': path})
             self.check_outdir_exists()
 
 
@@ -143,9 +280,151 @@ def cli():
         default=30,
         help='Set logging level',
     )
+    parser.add_argument(
+        '--table-progress',
+        action='store_true',
+        help=(
+            'Show progress of all rips in a single scrolling table; '
+            'recommended when ripping from many drives at once'
+        ),
+    )
+
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help=(
+            'Start the sampling profiler at launch; stop it from the tray '
+            'menu or by quitting to write the profile to the log directory'
+        ),
+    )
+
+    parser.add_argument(
+        '--control',
+        nargs='?',
+        const=CONTROL_SOCKET,
+        default=None,
+        metavar='SOCKET',
+        help=(
+            'Serve the JSON-RPC control API on a Unix socket; '
+            f'default socket is {CONTROL_SOCKET}'
+        ),
+    )
+    parser.add_argument(
+        '--processes',
+        action='store_true',
+        help=(
+            'Run each disc handler in its own worker process so a crash '
+            'in one rip does not stop the others; implies --table-progress'
+        ),
+    )
+    parser.add_argument(
+        '--duplicates',
+        choices=POLICIES,
+        default=None,
+        help=(
+            'Fingerprint discs and apply this policy to discs already '
+            'ripped or being ripped in another drive'
+        ),
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=0,
+        metavar='N',
+        help=(
+            'Automatically retry failed rips up to N times and stop using '
+            'drives with a high failure rate'
+        ),
+    )
+    parser.add_argument(
+        '--checksum',
+        choices=ALGORITHMS,
+        default=None,
+        help=(
+            'Hash output files while they are written and save a checksum '
+            'file next to each; xxh64 requires the xxhash package'
+        ),
+    )
+    parser.add_argument(
+        '--history',
+        type=float,
+        nargs='?',
+        const=RETENTION_DAYS,
+        default=None,
+        metavar='DAYS',
+        help=(
+            'Record every rip in a history database, viewable from the '
+            f'tray menu, keeping DAYS of history; default {RETENTION_DAYS}'
+        ),
+    )
+    parser.add_argument(
+        '--async-core',
+        action='store_true',
+        help=(
+            'Watch for discs with the asyncio core rather than a polling '
+            'thread; uses qasync if installed (Linux only)'
+        ),
+    )
+    parser.add_argument(
+        '--io-policy',
+        action='store_true',
+        help=(
+            'Lower IO priority of post-processing child processes '
+            'while rips are active (Linux only)'
+        ),
+    )
+    parser.add_argument(
+        '--cgroup',
+        metavar='PATH',
+        help=(
+            'Delegated cgroup v2 directory in which to create rip/post '
+            'groups with adjusted io/cpu weights; implies --io-policy'
+        ),
+    )
+    parser.add_argument(
+        '--changer-load',
+        metavar='CMD',
+        help=(
+            'Command to load a disc with a changer; formatted with '
+            '{slot} and {drive}. Enables unattended batch mode'
+        ),
+    )
+    parser.add_argument(
+        '--changer-unload',
+        metavar='CMD',
+        help='Command to unload a disc; formatted with {slot} and {drive}',
+    )
+    parser.add_argument(
+        '--changer-slots',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Number of changer slots to process, starting at slot 1',
+    )
+    parser.add_argument(
+        '--changer-drives',
+        nargs='+',
+        default=[],
+        metavar='DEV',
+        help='Dev device of each changer drive, in changer drive order',
+    )
 
     args = parser.parse_args()
 
+    changer = None
+    if args.changer_load:
+        if not (args.changer_unload and args.changer_drives):
+            parser.error(
+                '--changer-load requires --changer-unload and '
+                '--changer-drives'
+            )
+        from ..changer import CommandChanger
+        changer = {
+            'driver': CommandChanger(args.changer_load, args.changer_unload),
+            'drives': dict(enumerate(args.changer_drives)),
+            'slots': range(1, args.changer_slots + 1),
+        }
+
     STREAM.setLevel(args.loglevel)
     LOG.addHandler(STREAM)
 
@@ -153,5 +432,22 @@ def cli():
     app.setApplicationName(NAME)
     app.setWindowIcon(QtGui.QIcon(APP_ICON))
     app.setQuitOnLastWindowClosed(False)
-    _ = SystemTray(app)
-    app.exec_()
+    tray = SystemTray(
+        app,
+        table_progress=args.table_progress,
+        control_socket=args.control,
+        processes=args.processes,
+        changer=changer,
+        duplicates=args.duplicates,
+        io_policy=args.io_policy,
+        cgroup=args.cgroup,
+        retries=args.retries,
+        checksum=args.checksum,
+        profile=args.profile,
+        history=args.history,
+        async_core=args.async_core,
+    )
+    if tray.core is not None:
+        tray.core.exec_(app)
+    else:
+        app.exec_()
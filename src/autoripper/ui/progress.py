@@ -67,6 +67,26 @@ class ProgressDialog(QtWidgets.QWidget):
     def __len__(self):
         return len(self.widgets)
 
+    def snapshot(self) -> dict:
+        """
+        Get summary of all rips shown in the dialog
+
+        Returns:
+            dict: Keys are dev devices, values are dicts of rip information
+
+        """
+
+        return {
+            dev: {
+                'type': (
+                    'video'
+                    if isinstance(widget, VideoProgressWidget) else
+                    'audio'
+                ),
+            }
+            for dev, widget in list(self.widgets.items())
+        }
+
     @QtCore.pyqtSlot(str, dict, bool)
     def mkv_add_disc(self, dev: str, info: dict, full_disc: bool):
         self.log.debug("%s - Disc added", dev)
@@ -170,7 +190,10 @@ class ProgressDialog(QtWidgets.QWidget):
 
     @QtCore.pyqtSlot()
     def cancel(self):
-        dev = self.sender().dev
+        self.cancel_rip(self.sender().dev)
+
+    @QtCore.pyqtSlot(str)
+    def cancel_rip(self, dev: str):
         self.log.info("%s - Emitting cancel event", dev)
         self.CANCEL.emit(dev)
         self.MKV_REMOVE_DISC.emit(dev)
@@ -0,0 +1,515 @@
+"""
+Model/view based progress panel
+
+Rather than creating a full progress widget per disc, the state of every
+active rip is held in a single table model and a delegate paints progress
+bars for only the rows that are visible. A single timer on the model
+coalesces updates from all drives into one dataChanged emit per refresh.
+
+"""
+
+import logging
+import os
+import threading
+from subprocess import Popen
+
+from PyQt5 import QtWidgets
+from PyQt5 import QtCore
+
+from .progress import ProgressDialog
+
+REFRESH = 100  # Milliseconds between flushes of changed rows to the view
+ROW_HEIGHT = 24
+VISIBLE_ROWS = 12  # Rows visible before the panel starts scrolling
+
+# Prefixes of MakeMKV robot progress messages
+PRGV = 'PRGV:'  # Progress values; current,total,max
+PRGC = 'PRGC:'  # Current operation; code,id,name
+PRGT = 'PRGT:'  # Total operation; code,id,name
+
+
+class ProgressRow:
+    """
+    State of one rip shown in the progress panel
+
+    """
+
+    __slots__ = (
+        'dev',
+        'kind',
+        'title',
+        'status',
+        'done',
+        'total',
+    )
+
+    def __init__(self, dev: str, kind: str):
+        self.dev = dev
+        self.kind = kind
+        self.title = ''
+        self.status = 'Starting'
+        self.done = 0
+        self.total = 0
+
+    @property
+    def percent(self) -> int:
+        if self.total <= 0:
+            return 0
+        return min(100, int(100 * self.done / self.total))
+
+
+class ProgressModel(QtCore.QAbstractTableModel):
+    """
+    Table model holding progress for all active rips
+
+    Row contents may be updated from any thread through update(); changes
+    are only marked dirty and are pushed to views by a single timer running
+    in the GUI thread. Adding and removing rows must happen in the GUI
+    thread.
+
+    """
+
+    COLUMNS = ('Drive', 'Type', 'Title', 'Status', 'Progress', '')
+    PROGRESS_COLUMN = 4
+    CANCEL_COLUMN = 5
+
+    def __init__(self, *args, interval: int = REFRESH, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.log = logging.getLogger(__name__)
+        self._rows = []
+        self._index = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._flush)
+        self._timer.start(interval)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, dev):
+        return dev in self._index
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        row = self._rows[index.row()]
+        col = index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if col == 0:
+                return row.dev
+            if col == 1:
+                return row.kind
+            if col == 2:
+                return row.title
+            if col == 3:
+                return row.status
+            if col == self.PROGRESS_COLUMN:
+                return row.percent
+            if col == self.CANCEL_COLUMN:
+                return 'Cancel'
+        elif role == QtCore.Qt.ToolTipRole and col == 3:
+            return row.status
+        return None
+
+    def snapshot(self) -> dict:
+        """
+        Get copy of all rows; safe to call from any thread
+
+        Returns:
+            dict: Keys are dev devices, values are dicts of row information
+
+        """
+
+        with self._lock:
+            return {
+                row.dev: {
+                    'type': row.kind,
+                    'title': row.title,
+                    'status': row.status,
+                    'done': row.done,
+                    'total': row.total,
+                    'percent': row.percent,
+                }
+                for row in self._rows
+            }
+
+    def row_for_dev(self, dev: str) -> int:
+        """
+        Get the row number for given dev device; -1 if not found
+
+        """
+
+        return self._index.get(dev, -1)
+
+    def dev_for_row(self, row: int) -> str | None:
+        if 0 <= row < len(self._rows):
+            return self._rows[row].dev
+        return None
+
+    def add(self, dev: str, kind: str) -> None:
+        """
+        Add row for a new rip
+
+        Arguments:
+            dev (str): Dev device of the rip
+            kind (str): Type of disc; video or audio
+
+        """
+
+        if dev in self._index:
+            self.remove(dev)
+
+        row = len(self._rows)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        with self._lock:
+            self._rows.append(ProgressRow(dev, kind))
+            self._index[dev] = row
+        self.endInsertRows()
+
+    def remove(self, dev: str) -> bool:
+        """
+        Remove row for a rip
+
+        Arguments:
+            dev (str): Dev device of the rip
+
+        Returns:
+            bool: True if the row existed
+
+        """
+
+        row = self._index.get(dev, None)
+        if row is None:
+            return False
+
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        with self._lock:
+            self._rows.pop(row)
+            self._dirty.discard(dev)
+            self._index = {
+                item.dev: i for i, item in enumerate(self._rows)
+            }
+        self.endRemoveRows()
+        return True
+
+    def update(self, dev: str, **kwargs) -> None:
+        """
+        Update fields of a row; safe to call from any thread
+
+        Arguments:
+            dev (str): Dev device of the rip
+            **kwargs: Any of title, status, done, total
+
+        """
+
+        with self._lock:
+            row = self._index.get(dev, None)
+            if row is None:
+                return
+            item = self._rows[row]
+            for key, val in kwargs.items():
+                if getattr(item, key) != val:
+                    setattr(item, key, val)
+                    self._dirty.add(dev)
+
+    @QtCore.pyqtSlot()
+    def _flush(self):
+        """
+        Notify views of all rows changed since last flush
+
+        A single dataChanged spanning the changed rows is emitted so views
+        only repaint once per refresh regardless of how many drives updated.
+
+        """
+
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = [
+                self._index[dev]
+                for dev in self._dirty
+                if dev in self._index
+            ]
+            self._dirty.clear()
+
+        if not rows:
+            return
+        self.dataChanged.emit(
+            self.index(min(rows), 0),
+            self.index(max(rows), len(self.COLUMNS) - 1),
+        )
+
+
+class ProgressDelegate(QtWidgets.QStyledItemDelegate):
+    """
+    Paint progress bars and cancel buttons for visible rows
+
+    """
+
+    def paint(self, painter, option, index):
+        col = index.column()
+        if col == ProgressModel.PROGRESS_COLUMN:
+            bar = QtWidgets.QStyleOptionProgressBar()
+            bar.rect = option.rect.adjusted(2, 2, -2, -2)
+            bar.minimum = 0
+            bar.maximum = 100
+            bar.progress = index.data() or 0
+            bar.text = f"{bar.progress}%"
+            bar.textVisible = True
+            QtWidgets.QApplication.style().drawControl(
+                QtWidgets.QStyle.CE_ProgressBar,
+                bar,
+                painter,
+            )
+        elif col == ProgressModel.CANCEL_COLUMN:
+            button = QtWidgets.QStyleOptionButton()
+            button.rect = option.rect.adjusted(2, 2, -2, -2)
+            button.text = index.data()
+            button.state = QtWidgets.QStyle.State_Enabled
+            QtWidgets.QApplication.style().drawControl(
+                QtWidgets.QStyle.CE_PushButton,
+                button,
+                painter,
+            )
+        else:
+            super().paint(painter, option, index)
+
+
+class MKVProgressReader(threading.Thread):
+    """
+    Parse MakeMKV robot progress messages into the progress model
+
+    """
+
+    def __init__(self, model: ProgressModel, dev: str, proc: Popen, pipe):
+        super().__init__(daemon=True)
+        self.log = logging.getLogger(__name__)
+        self.model = model
+        self.dev = dev
+        self.proc = proc
+        self.pipe = pipe
+
+    def _open(self):
+        """
+        Get iterable of lines from the process
+
+        The pipe may be the path to a file/FIFO MakeMKV writes progress to,
+        or the name of a pipe attribute (e.g., stdout) of the process.
+
+        """
+
+        if isinstance(self.pipe, str) and os.path.exists(self.pipe):
+            return open(self.pipe, mode='r')
+        stream = getattr(self.proc, self.pipe or 'stdout', None)
+        if stream is None:
+            stream = self.proc.stdout
+        return stream
+
+    def run(self):
+        try:
+            stream = self._open()
+        except Exception as err:
+            self.log.warning(
+                "%s - Failed to open progress pipe: %s",
+                self.dev,
+                err,
+            )
+            return
+
+        if stream is None:
+            return
+
+        try:
+            for line in stream:
+                if isinstance(line, bytes):
+                    line = line.decode(errors='ignore')
+                self.parse(line.strip())
+        except Exception as err:
+            self.log.debug("%s - Progress reader stopped: %s", self.dev, err)
+
+    def parse(self, line: str) -> None:
+        if line.startswith(PRGV):
+            try:
+                _, total, maximum = map(int, line[len(PRGV):].split(','))
+            except ValueError:
+                return
+            self.model.update(self.dev, done=total, total=maximum)
+        elif line.startswith(PRGC) or line.startswith(PRGT):
+            name = line.split(',', 2)[-1].strip('"')
+            self.model.update(self.dev, status=name)
+
+
+class ProgressPanel(ProgressDialog):
+    """
+    Drop-in replacement for ProgressDialog using a single table view
+
+    Accepts the same signals as ProgressDialog so handlers need not know
+    which progress display is in use.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.model = ProgressModel(self)
+        self._readers = {}
+        self._ntracks = {}
+
+        self._shared = None
+        self._sampler = QtCore.QTimer(self)
+        self._sampler.timeout.connect(self._sample)
+
+        self.view = QtWidgets.QTableView()
+        self.view.setModel(self.model)
+        self.view.setItemDelegate(ProgressDelegate(self.view))
+        self.view.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.view.setVerticalScrollMode(
+            QtWidgets.QAbstractItemView.ScrollPerPixel
+        )
+        self.view.verticalHeader().hide()
+        self.view.verticalHeader().setSectionResizeMode(
+            QtWidgets.QHeaderView.Fixed
+        )
+        self.view.verticalHeader().setDefaultSectionSize(ROW_HEIGHT)
+        self.view.horizontalHeader().setSectionResizeMode(
+            QtWidgets.QHeaderView.ResizeToContents
+        )
+        self.view.horizontalHeader().setSectionResizeMode(
+            ProgressModel.PROGRESS_COLUMN,
+            QtWidgets.QHeaderView.Stretch,
+        )
+        self.view.clicked.connect(self._clicked)
+
+        self.layout.addWidget(self.view)
+        self.resize(
+            640,
+            ROW_HEIGHT * (VISIBLE_ROWS + 1) + 2 * self.layout.spacing(),
+        )
+
+    def __len__(self):
+        return len(self.model)
+
+    def snapshot(self) -> dict:
+        return self.model.snapshot()
+
+    def set_shared(self, shared) -> None:
+        """
+        Sample progress values from a shared-memory progress table
+
+        Arguments:
+            shared (SharedProgress): Table written to by rip workers
+
+        """
+
+        self._shared = shared
+        self._sampler.start(REFRESH)
+
+    @QtCore.pyqtSlot()
+    def _sample(self):
+        if self._shared is None or len(self.model) == 0:
+            return
+        for dev, rec in self._shared.sample().items():
+            _, _, done, total, _ = rec
+            if total > 0:
+                self.model.update(dev, done=done, total=total)
+
+    def _add(self, dev: str, kind: str):
+        self.model.add(dev, kind)
+        if not self.isVisible():
+            self.show()
+
+    def _remove(self, dev: str):
+        self._readers.pop(dev, None)
+        self._ntracks.pop(dev, None)
+        if self.model.remove(dev):
+            self.log.debug("%s - Disc removed", dev)
+        if len(self.model) == 0:
+            self.setVisible(False)
+
+    @QtCore.pyqtSlot(QtCore.QModelIndex)
+    def _clicked(self, index):
+        if index.column() != ProgressModel.CANCEL_COLUMN:
+            return
+        dev = self.model.dev_for_row(index.row())
+        if dev is not None:
+            self.cancel_rip(dev)
+
+    # Slots for video DVD/Blu-ray
+    @QtCore.pyqtSlot(str, dict, bool)
+    def mkv_add_disc(self, dev: str, info: dict, full_disc: bool):
+        self.log.debug("%s - Disc added", dev)
+        self._add(dev, 'video')
+
+    @QtCore.pyqtSlot(str)
+    def mkv_remove_disc(self, dev: str):
+        self._remove(dev)
+
+    @QtCore.pyqtSlot(str, Popen, str)
+    def mkv_new_process(self, dev: str, proc: Popen, pipe: str):
+        if dev not in self.model:
+            return
+        self.log.debug("%s - Setting new parser process", dev)
+        reader = MKVProgressReader(self.model, dev, proc, pipe)
+        self._readers[dev] = reader
+        reader.start()
+
+    @QtCore.pyqtSlot(str, str)
+    def mkv_current_track(self, dev: str, title: str):
+        self.log.debug("%s - Setting current track: %s", dev, title)
+        self.model.update(dev, title=title, done=0, total=0)
+
+    # Slots for audio CD
+    @QtCore.pyqtSlot(str)
+    def cd_add_disc(self, dev: str):
+        self.log.debug("%s - Disc added", dev)
+        self._add(dev, 'audio')
+
+    @QtCore.pyqtSlot(str)
+    def cd_remove_disc(self, dev: str):
+        self._remove(dev)
+
+    @QtCore.pyqtSlot(str, dict)
+    def cd_set_tracks_info(self, dev: str, info: dict):
+        self.log.debug("%s - Setting track info", dev)
+        self._ntracks[dev] = len(info)
+        self.model.update(dev, total=len(info), status='Ripping')
+
+    @QtCore.pyqtSlot(str, str)
+    def cd_current_track(self, dev: str, title: str):
+        self.log.debug("%s - Setting current track: %s", dev, title)
+        try:
+            done = int(title) - 1
+        except ValueError:
+            done = 0
+        self.model.update(
+            dev,
+            title=f"Track {title} of {self._ntracks.get(dev, '?')}",
+            done=max(done, 0),
+        )
+
+    @QtCore.pyqtSlot(str)
+    def cd_get_metadata(self, dev: str) -> None:
+        self.log.debug("%s - Notifying of metadata grab", dev)
+        self.model.update(dev, status='Fetching metadata')
+
+    @QtCore.pyqtSlot(str, int)
+    def cd_track_size(self, dev, tsize):
+        self.model.update(dev, status=f"{tsize / 2**20:.1f} MiB")
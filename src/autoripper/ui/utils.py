@@ -94,3 +94,47 @@ def get_vendor_model(path: str) -> tuple[str]:
         model = ''
 
     return vendor.strip(), model.strip()
+
+
+def get_serial(path: str) -> str:
+    """
+    Get the serial number of drive; empty if not available
+
+    """
+
+    path = os.path.join(
+        '/sys/class/block/',
+        os.path.basename(path),
+        'device',
+        'vpd_pg80',
+    )
+    try:
+        with open(path, mode='rb') as iid:
+            data = iid.read()
+    except OSError:
+        return ''
+
+    # Unit serial number page; 4 byte header followed by ASCII serial
+    return data[4:].decode('ascii', errors='ignore').strip(' \x00')
+
+
+def get_identity(path: str) -> tuple[str, str]:
+    """
+    Get vendor/model and physical identity of drive
+
+    The physical identity is the model and serial number, falling back
+    to the dev device if the serial cannot be read.
+
+    Returns:
+        tuple: Model and physical identity
+
+    """
+
+    vendor = model = serial = ''
+    try:
+        vendor, model = get_vendor_model(path)
+        serial = get_serial(path)
+    except Exception:
+        pass
+    model = f"{vendor} {model}".strip() or path
+    return model, f"{model} ({serial or path})"
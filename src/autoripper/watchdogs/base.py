@@ -5,6 +5,7 @@ Utilities for ripping titles
 
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait
 from subprocess import Popen
 
 from PyQt5 import QtCore
@@ -25,7 +26,15 @@ except Exception:
     UUID_ROOT = None
     VideoDiscHandler = None
 
+from .. import shared_progress
+from ..history import HistoryStore, OK, FAILED, CANCELLED, UNKNOWN
 from . import RUNNING
+from . import fingerprint
+from .retry import RetryEngine
+from .worker import WorkerProcess
+
+SCAN_TIMEOUT = 15.0  # Seconds allowed for startup scan of all drives
+SCAN_WORKERS = 8  # Max drives probed at the same time during startup scan
 
 
 class BaseWatchdog(QtCore.QThread):
@@ -36,12 +45,20 @@ class BaseWatchdog(QtCore.QThread):
 
     # Dev device and disc type string
     HANDLE_INSERT = QtCore.pyqtSignal(str, str)
+    # Dev device that disc was ejected from
+    DISC_EJECTED = QtCore.pyqtSignal(str)
+    # Dev device whose rip finished
+    RIP_FINISHED = QtCore.pyqtSignal(str)
 
     def __init__(
         self,
         progress,
         *args,
         root: str | None = UUID_ROOT,
+        processes: bool = False,
+        duplicates: str | None = None,
+        retries: int = 0,
+        history: float | None = None,
         **kwargs,
     ):
         """
@@ -49,6 +66,16 @@ class BaseWatchdog(QtCore.QThread):
             outdir (str) : Top-level directory for ripping files
 
         Keyword arguments:
+            processes (bool) : If set, run each disc handler in its own
+                worker process rather than a thread of this process
+            duplicates (str) : Policy for discs already ripped or being
+                ripped in another drive; one of fingerprint.POLICIES.
+                If not set, discs are not fingerprinted
+            retries (int) : Number of times to automatically retry a
+                failed rip; see retry.RetryEngine. Drive health is only
+                tracked when greater than zero
+            history (float) : Days to keep rips in the rip history; see
+                history.HistoryStore. If not set, no history is recorded
 
         """
 
@@ -60,13 +87,316 @@ class BaseWatchdog(QtCore.QThread):
 
         self.progress = progress
         self.root = root
+        self.processes = processes
+
+        # Workers write progress values to shared memory, which the
+        # progress panel (if in use) samples instead of per-update signals
+        self.shared = None
+        if self.processes:
+            self.shared = shared_progress.SharedProgress()
+            if hasattr(self.progress, 'set_shared'):
+                self.progress.set_shared(self.shared)
 
         self._mounted = []
         self._failure = []
         self._success = []
 
+        self._paused = False
+        self._queue = []
+
+        # Set to False for unattended (e.g., changer) operation
+        self.prompts = True
+
+        self.duplicates = duplicates
+        self.fingerprints = None
+        if duplicates not in (None, fingerprint.RIP):
+            if duplicates not in fingerprint.POLICIES:
+                raise ValueError(f"Unknown duplicates policy: {duplicates}")
+            self.fingerprints = fingerprint.FingerprintIndex()
+        self._pending_fp = {}  # Fingerprints of discs not yet handled
+        self._active_fp = {}  # Fingerprints of discs being ripped
+        # Success flag (None if not known) and output file of rips
+        self._outcome = {}
+        self._cancelled = set()
+        self.progress.CANCEL.connect(self._rip_cancelled)
+
+        self.retry = None
+        if retries > 0:
+            self.retry = RetryEngine(self, max_retries=retries)
+
+        self.history = None
+        if history is not None:
+            self.history = HistoryStore(retention_days=history)
+            # Audio rips write a file per track and do not report their
+            # output, so their size is taken from track progress
+            self.progress.CD_CUR_TRACK.connect(self._history_track)
+            self.progress.CD_TRACK_SIZE.connect(self._history_size)
+
     def quit(self, *args, **kwargs):
         RUNNING.set()
+        for obj in list(self._mounted):
+            if isinstance(obj, WorkerProcess):
+                obj.stop()
+        if self.fingerprints is not None:
+            self.fingerprints.close()
+            self.fingerprints = None
+        if self.retry is not None:
+            self.retry.close()
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+        if self.shared is not None:
+            self.shared.close()
+            self.shared = None
+
+    def drives(self) -> list[str]:
+        """
+        List optical drives on the system
+
+        Overridden by platform watchdogs
+
+        """
+
+        return []
+
+    def set_fingerprint(self, dev: str, func, *args) -> None:
+        """
+        Fingerprint disc ahead of HANDLE_INSERT
+
+        Called from the watchdog thread so reading the disc does not
+        block the GUI thread; does nothing if duplicate detection is off.
+
+        Arguments:
+            dev (str): Dev device
+            func (callable): Fingerprint function from fingerprint module
+            *args: Passed to func after dev
+
+        """
+
+        if self.fingerprints is None:
+            return
+        try:
+            self._pending_fp[dev] = func(dev, *args)
+        except Exception as err:
+            self.log.warning("%s - Failed to fingerprint disc: %s", dev, err)
+
+    def _check_duplicate(self, dev: str, disc_type: str) -> bool:
+        """
+        Apply duplicates policy to disc
+
+        Returns:
+            bool: True if disc should be ripped
+
+        """
+
+        fp = self._pending_fp.pop(dev, None)
+        if self.fingerprints is None or fp is None:
+            return True
+
+        entry = self.fingerprints.lookup(fp)
+        if entry is None:
+            # Recorded as ripping once a handler is created; see _started
+            self._active_fp[dev] = fp
+            return True
+
+        if entry['status'] == fingerprint.RIPPING:
+            where = f"currently ripping in {entry['dev']}"
+        else:
+            where = f"already ripped to {entry['output'] or 'unknown'}"
+        self.log.warning(
+            "%s - Duplicate disc, %s; policy is '%s'",
+            dev,
+            where,
+            self.duplicates,
+        )
+
+        if self.duplicates == fingerprint.LINK:
+            self.fingerprints.add_copy(fp)
+        if self.duplicates in (fingerprint.EJECT, fingerprint.LINK):
+            self.eject(dev)
+        else:
+            self.decline(dev)
+        return False
+
+    @QtCore.pyqtSlot(str)
+    def _rip_cancelled(self, dev: str):
+        self._outcome[dev] = (False, None)
+        self._cancelled.add(dev)
+
+    def decline(self, dev: str) -> None:
+        """
+        Note that the disc in a drive will not be ripped
+
+        With prompts off (e.g., changer batch) nobody is there to remove
+        the disc, so it is ejected to free the drive for the next one.
+
+        """
+
+        self._active_fp.pop(dev, None)
+        if not self.prompts:
+            self.eject(dev)
+
+    def _started(self, dev: str, disc_type: str) -> None:
+        """
+        Record start of rip once its handler is created
+
+        """
+
+        fp = self._active_fp.get(dev, None)
+        if fp is not None and self.fingerprints is not None:
+            self.fingerprints.start(fp, dev, disc_type)
+        if self.history is not None:
+            self.history.started(dev)
+
+    @QtCore.pyqtSlot(str, str)
+    def _history_track(self, dev: str, title: str):
+        if self.history is not None:
+            self.history.next_file(dev)
+
+    @QtCore.pyqtSlot(str, int)
+    def _history_size(self, dev: str, size: int):
+        if self.history is not None:
+            self.history.file_size(dev, size)
+
+    def probe(self, dev: str) -> str | None:
+        """
+        Check drive for a disc that is ready to rip
+
+        Overridden by platform watchdogs
+
+        Arguments:
+            dev (str): Dev device
+
+        Returns:
+            str: Type of disc (audio or video), or None if no disc
+
+        """
+
+        return None
+
+    def scan(self, timeout: float = SCAN_TIMEOUT) -> None:
+        """
+        Start rips for discs already in drives
+
+        All drives are probed concurrently; drives that have not answered
+        by the deadline are skipped so one stuck drive cannot hold up
+        startup.
+
+        Keyword arguments:
+            timeout (float): Seconds to wait for all drives
+
+        """
+
+        try:
+            drives = self.drives()
+        except Exception as err:
+            self.log.error("Failed to list drives for startup scan: %s", err)
+            return
+
+        if len(drives) == 0:
+            return
+
+        self.log.info("Scanning %d drive(s) for discs", len(drives))
+        pool = ThreadPoolExecutor(
+            max_workers=min(len(drives), SCAN_WORKERS),
+            thread_name_prefix='scan',
+        )
+        futures = {pool.submit(self.probe, dev): dev for dev in drives}
+        done, not_done = wait(futures, timeout=timeout)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+        for future in not_done:
+            self.log.warning(
+                "%s - Drive did not respond within %.0f s of startup scan",
+                futures[future],
+                timeout,
+            )
+
+        for future in done:
+            dev = futures[future]
+            try:
+                disc_type = future.result()
+            except Exception as err:
+                self.log.warning("%s - Failed to probe drive: %s", dev, err)
+                continue
+            if disc_type is None:
+                continue
+            self.log.info("%s - Found %s disc at startup", dev, disc_type)
+            self.HANDLE_INSERT.emit(dev, disc_type)
+
+    def active(self) -> list[tuple[str, str]]:
+        """
+        List dev device and disc type of all active rips
+
+        """
+
+        return [
+            (obj.dev, self._disc_type(obj))
+            for obj in list(self._mounted)
+        ]
+
+    def worker_pid(self, dev: str) -> int | None:
+        """
+        Get pid of worker process running rip in drive, if any
+
+        """
+
+        for obj in list(self._mounted):
+            if isinstance(obj, WorkerProcess) and obj.dev == dev:
+                return obj.pid
+        return None
+
+    def worker_pids(self) -> list[int]:
+        """
+        List pids of worker processes running rips
+
+        """
+
+        return [
+            obj.pid
+            for obj in list(self._mounted)
+            if isinstance(obj, WorkerProcess) and obj.pid is not None
+        ]
+
+    def _disc_type(self, obj) -> str:
+        if isinstance(obj, WorkerProcess):
+            return obj.disc_type
+        if AudioDiscHandler is not None and isinstance(obj, AudioDiscHandler):
+            return 'audio'
+        return 'video'
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    @property
+    def queued(self) -> list[tuple[str, str]]:
+        return list(self._queue)
+
+    @QtCore.pyqtSlot()
+    def pause(self):
+        """
+        Hold new discs in queue rather than starting rips
+
+        """
+
+        self.log.info("Pausing rip queue")
+        self._paused = True
+
+    @QtCore.pyqtSlot()
+    def resume(self):
+        """
+        Start rips for all discs inserted while paused
+
+        """
+
+        self.log.info(
+            "Resuming rip queue; %d disc(s) queued",
+            len(self._queue),
+        )
+        self._paused = False
+        while self._queue and not self._paused:
+            self.handle_insert(*self._queue.pop(0))
 
     @QtCore.pyqtSlot(str)
     def video_rip_failure(self, fname: str):
@@ -74,6 +404,10 @@ class BaseWatchdog(QtCore.QThread):
         sender = self.sender()
         sender.wait()  # Wait for thread to finish
         dev = sender.dev
+        self._outcome[dev] = (False, fname)
+        if not self.prompts:
+            self.log.error("%s - Rip failed: %s", dev, fname)
+            return
         dialog = video_dialogs.RipFailure(dev, fname)
         self._failure.append(dialog)
         dialog.FINISHED.connect(self._failure_closed)
@@ -92,6 +426,10 @@ class BaseWatchdog(QtCore.QThread):
         sender = self.sender()
         sender.wait()  # Wait for thread to finish
         dev = sender.dev
+        self._outcome[dev] = (True, fname)
+        if not self.prompts:
+            self.log.info("%s - Rip succeeded: %s", dev, fname)
+            return
         dialog = video_dialogs.RipSuccess(dev, fname)
         self._success.append(dialog)
         dialog.FINISHED.connect(self._success_closed)
@@ -119,6 +457,42 @@ class BaseWatchdog(QtCore.QThread):
                 sender.dev,
             )
 
+        # Handlers that never signal success (e.g., audio) leave the
+        # outcome unknown, which must not be counted as a success
+        ok, output = self._outcome.pop(sender.dev, (None, None))
+        cancelled = sender.dev in self._cancelled
+        self._cancelled.discard(sender.dev)
+        fp = self._active_fp.pop(sender.dev, None)
+        if fp is not None and self.fingerprints is not None:
+            # A rip that ran to completion without reporting an outcome
+            # (e.g., audio) is ripped as far as duplicates are concerned
+            self.fingerprints.finish(
+                fp,
+                ok=ok is not False and not cancelled,
+                output=output,
+            )
+        if self.retry is not None:
+            self.retry.finished(
+                sender.dev,
+                self._disc_type(sender),
+                ok,
+                cancelled=cancelled,
+            )
+        if self.history is not None:
+            if cancelled:
+                status = CANCELLED
+            elif ok is None:
+                status = UNKNOWN
+            else:
+                status = OK if ok else FAILED
+            self.history.finished(
+                sender.dev,
+                self._disc_type(sender),
+                status,
+                output,
+            )
+
+        self.RIP_FINISHED.emit(sender.dev)
         sender.deleteLater()
 
     @QtCore.pyqtSlot(str, str)
@@ -130,6 +504,24 @@ class BaseWatchdog(QtCore.QThread):
 
         """
 
+        if self._paused:
+            self.log.info("%s - Queue paused, holding %s disc", dev, disc_type)
+            self._queue.append((dev, disc_type))
+            return
+
+        if self.retry is not None and not self.retry.healthy(dev):
+            self.log.error(
+                "%s - Drive error rate is too high, not ripping; "
+                "move disc to another drive",
+                dev,
+            )
+            self._pending_fp.pop(dev, None)
+            self.eject(dev)
+            return
+
+        if not self._check_duplicate(dev, disc_type):
+            return
+
         if disc_type == 'video':
             if VideoDiscHandler is None:
                 self.log.error(
@@ -138,19 +530,32 @@ class BaseWatchdog(QtCore.QThread):
                     "video discs (DVD/Blu-ray)!",
                     dev,
                 )
+                self.decline(dev)
                 return
 
             self.log.info("%s - Assuming video disc inserted", dev)
-            obj = VideoDiscHandler(
-                dev,
-                self.root,
-                self.progress,
-            )
+            if self.processes:
+                obj = WorkerProcess(
+                    dev,
+                    disc_type,
+                    self.root,
+                    self.progress,
+                    shared=self.shared,
+                )
+            else:
+                obj = VideoDiscHandler(
+                    dev,
+                    self.root,
+                    self.progress,
+                )
             obj.FAILURE.connect(self.video_rip_failure)
             obj.SUCCESS.connect(self.video_rip_success)
             obj.FINISHED.connect(self.rip_finished)
             obj.EJECT_DISC.connect(self.eject_disc)
             self._mounted.append(obj)
+            self._started(dev, disc_type)
+            if self.processes:
+                obj.start()
 
         elif disc_type == 'audio':
             if AudioDiscHandler is None:
@@ -158,21 +563,35 @@ class BaseWatchdog(QtCore.QThread):
                     "%s - The 'cdRipper' program was not imported. "
                     "Are you sure it is installed? Unable to process "
                     "audio discs (CD)!",
-                    self.dev,
+                    dev,
                 )
+                self.decline(dev)
                 return
 
             self.log.info("%s - Assuming audio disc inserted", dev)
-            obj = AudioDiscHandler(
-                dev,
-                self.progress,
-            )
+            if self.processes:
+                obj = WorkerProcess(
+                    dev,
+                    disc_type,
+                    self.root,
+                    self.progress,
+                    shared=self.shared,
+                )
+            else:
+                obj = AudioDiscHandler(
+                    dev,
+                    self.progress,
+                )
             obj.FINISHED.connect(self.rip_finished)
             obj.EJECT_DISC.connect(self.eject_disc)
             self._mounted.append(obj)
+            self._started(dev, disc_type)
+            if self.processes:
+                obj.start()
 
         else:
             self.log.warning("%s - Unrecognized disc_type: %s", dev, disc_type)
+            self.decline(dev)
 
     @QtCore.pyqtSlot()
     def eject_disc(self) -> None:
@@ -181,7 +600,18 @@ class BaseWatchdog(QtCore.QThread):
 
         """
 
-        dev = self.sender().dev
+        self.eject(self.sender().dev)
+
+    @QtCore.pyqtSlot(str)
+    def eject(self, dev: str) -> None:
+        """
+        Eject the disc in given drive
+
+        Arguments:
+            dev (str): Dev device to eject
+
+        """
+
         self.log.debug("%s - Ejecting disc", dev)
 
         if sys.platform.startswith('linux'):
@@ -196,3 +626,5 @@ class BaseWatchdog(QtCore.QThread):
                 None,
             )
             ctypes.windll.winmm.mciSendStringW("close drive", None, 0, None)
+
+        self.DISC_EJECTED.emit(dev)
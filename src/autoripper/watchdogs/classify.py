@@ -0,0 +1,336 @@
+"""
+Disc type classification
+
+Decide what kind of disc is in a drive from cheap udev properties, falling
+back to a single read of the disc's table of contents (TOC), so that discs
+are routed to the correct ripping backend.
+
+"""
+
+import logging
+import enum
+import os
+import struct
+import sys
+
+if sys.platform.startswith('linux'):
+    import fcntl
+
+from . import STATUS
+
+MEDIA = 'ID_CDROM_MEDIA'
+MEDIA_DVD = 'ID_CDROM_MEDIA_DVD'
+MEDIA_BD = 'ID_CDROM_MEDIA_BD'
+TRACKS_AUDIO = 'ID_CDROM_MEDIA_TRACK_COUNT_AUDIO'
+TRACKS_DATA = 'ID_CDROM_MEDIA_TRACK_COUNT_DATA'
+FS_TYPE = 'ID_FS_TYPE'
+FS_UUID = 'ID_FS_UUID'
+
+# Linux ioctls for reading the TOC; see linux/cdrom.h
+CDROMREADTOCHDR = 0x5305
+CDROMREADTOCENTRY = 0x5306
+CDROM_LBA = 0x01
+CDROM_DATA_TRACK = 0x04
+CDROM_LEADOUT = 0xAA
+TOCHDR = struct.Struct('BB')
+TOCENTRY = struct.Struct('BBBxiB3x')
+
+
+class DiscType(enum.Enum):
+    """
+    Type of disc in a drive
+
+    The handler attribute is the disc_type passed to HANDLE_INSERT; None
+    means there is nothing to rip.
+
+    """
+
+    AUDIO_CD = ('audio', 'Audio CD')
+    MIXED_CD = ('audio', 'Mixed-mode/enhanced CD')
+    DATA_CD = (None, 'Data CD')
+    DVD = ('video', 'DVD')
+    DATA_DVD = (None, 'Data DVD')
+    BLURAY = ('video', 'Blu-ray')
+    UNKNOWN = (None, 'Unknown')
+
+    def __init__(self, handler, label):
+        self.handler = handler
+        self.label = label
+
+
+def _count(props, key: str) -> int | None:
+    try:
+        return int(props.get(key, ''))
+    except ValueError:
+        return None
+
+
+def _has_media(props, key: str) -> bool:
+    """
+    Check for key or any of its variants (e.g., ID_CDROM_MEDIA_DVD_R)
+
+    """
+
+    if props.get(key, '') == '1':
+        return True
+    prefix = key + '_'
+    return any(
+        k.startswith(prefix) and props.get(k, '') == '1'
+        for k in props.keys()
+    )
+
+
+def from_tracks(audio: int, data: int) -> DiscType:
+    """
+    Classify a CD from its audio and data track counts
+
+    """
+
+    if audio > 0 and data > 0:
+        return DiscType.MIXED_CD
+    if audio > 0:
+        return DiscType.AUDIO_CD
+    if data > 0:
+        return DiscType.DATA_CD
+    return DiscType.UNKNOWN
+
+
+def from_properties(props) -> DiscType:
+    """
+    Classify disc from udev properties alone
+
+    Arguments:
+        props (Mapping): udev device properties
+
+    Returns:
+        DiscType: UNKNOWN if the properties are not conclusive
+
+    """
+
+    if _has_media(props, MEDIA_BD):
+        return DiscType.BLURAY
+
+    if _has_media(props, MEDIA_DVD):
+        # Data and video DVDs cannot be told apart without reading the
+        # file system, so let the video backend decide
+        return DiscType.DVD
+
+    audio = _count(props, TRACKS_AUDIO)
+    data = _count(props, TRACKS_DATA)
+    if audio is not None or data is not None:
+        disc = from_tracks(audio or 0, data or 0)
+        if disc is not DiscType.UNKNOWN:
+            return disc
+
+    return DiscType.UNKNOWN
+
+
+def toc_entries(dev: str) -> list[tuple[int, int, int]] | None:
+    """
+    Read the TOC of a CD
+
+    Arguments:
+        dev (str): Dev device
+
+    Returns:
+        list: (track, control, lba) of every track followed by the
+            lead-out, or None if TOC could not be read (e.g., not a CD,
+            or not on Linux)
+
+    """
+
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        fd = os.open(dev, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return None
+
+    entries = []
+    try:
+        hdr = bytearray(TOCHDR.size)
+        fcntl.ioctl(fd, CDROMREADTOCHDR, hdr)
+        first, last = TOCHDR.unpack(hdr)
+        for track in [*range(first, last + 1), CDROM_LEADOUT]:
+            entry = bytearray(TOCENTRY.pack(track, 0, CDROM_LBA, 0, 0))
+            fcntl.ioctl(fd, CDROMREADTOCENTRY, entry)
+            _, adr_ctrl, _, lba, _ = TOCENTRY.unpack(entry)
+            entries.append((track, adr_ctrl >> 4, lba))
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    return entries
+
+
+def read_toc(dev: str) -> tuple[int, int] | None:
+    """
+    Count audio and data tracks by reading the TOC of a CD
+
+    Arguments:
+        dev (str): Dev device
+
+    Returns:
+        tuple: Number of audio and data tracks, or None if TOC could
+            not be read
+
+    """
+
+    entries = toc_entries(dev)
+    if entries is None:
+        return None
+
+    data = sum(
+        1
+        for track, ctrl, _ in entries
+        if track != CDROM_LEADOUT and ctrl & CDROM_DATA_TRACK
+    )
+    return len(entries) - 1 - data, data
+
+
+def from_listing(names, fs: str = '') -> DiscType:
+    """
+    Classify disc from the names in the root directory of the volume
+
+    Used on Windows, where audio CDs show 'TrackNN.cda' entries.
+
+    Arguments:
+        names (iterable): Names of files/directories at volume root
+
+    Keyword arguments:
+        fs (str): File system name of the volume; e.g., CDFS, UDF
+
+    """
+
+    names = {name.upper() for name in names}
+    if 'BDMV' in names:
+        return DiscType.BLURAY
+    if 'VIDEO_TS' in names:
+        return DiscType.DVD
+
+    audio = sum(1 for name in names if name.endswith('.CDA'))
+    data = len(names) - audio
+    if audio == 0 and fs.upper() == 'UDF':
+        return DiscType.DATA_DVD
+    return from_tracks(audio, data)
+
+
+class DiscClassifier:
+    """
+    Classify discs, caching the result per media change
+
+    udev can send several change events for one insert; the cache key is
+    the identity of the media so the TOC fallback is read at most once
+    per disc.
+
+    """
+
+    def __init__(self, read_toc=read_toc):
+        """
+        Keyword arguments:
+            read_toc (callable): Function to read TOC of dev device;
+                replaceable for testing
+
+        """
+
+        self.log = logging.getLogger(__name__)
+        self._read_toc = read_toc
+        self._cache = {}
+
+    def _key(self, props) -> tuple:
+        return tuple(
+            props.get(key, '')
+            for key in (
+                MEDIA,
+                TRACKS_AUDIO,
+                TRACKS_DATA,
+                FS_TYPE,
+                FS_UUID,
+                'ID_CDROM_MEDIA_SESSION_COUNT',
+            )
+        )
+
+    def invalidate(self, dev: str) -> None:
+        """
+        Forget cached result for drive; call on eject
+
+        """
+
+        self._cache.pop(dev, None)
+
+    def classify(self, dev: str, props) -> DiscType:
+        """
+        Get type of disc in drive
+
+        Arguments:
+            dev (str): Dev device
+            props (Mapping): udev properties of the change event
+
+        Returns:
+            DiscType
+
+        """
+
+        key = self._key(props)
+        cached = self._cache.get(dev, None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        disc = from_properties(props)
+        if disc is DiscType.UNKNOWN:
+            counts = self._read_toc(dev)
+            if counts is not None:
+                disc = from_tracks(*counts)
+
+        if disc is DiscType.UNKNOWN:
+            # Last resort; the media state heuristic used historically
+            disc = (
+                DiscType.DVD
+                if props.get(STATUS, '') == 'complete' else
+                DiscType.AUDIO_CD
+            )
+            self.log.debug(
+                "%s - Inconclusive classification, assuming %s",
+                dev,
+                disc.label,
+            )
+
+        self.log.info("%s - Classified disc as %s", dev, disc.label)
+        self._cache[dev] = (key, disc)
+        return disc
+
+    def classify_volume(self, dev: str, info: tuple) -> DiscType:
+        """
+        Get type of disc in drive from its volume information (Windows)
+
+        Arguments:
+            dev (str): Drive letter; e.g., D:
+            info (tuple): Result of win32api.GetVolumeInformation
+
+        Returns:
+            DiscType
+
+        """
+
+        name, serial, _, _, fs = info
+        key = (name, serial, fs)
+        cached = self._cache.get(dev, None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        try:
+            names = os.listdir(f"{dev}\\")
+        except OSError as err:
+            self.log.debug("%s - Failed to list volume: %s", dev, err)
+            names = None
+
+        if names is not None:
+            disc = from_listing(names, fs)
+        else:
+            disc = DiscType.AUDIO_CD if fs == 'CDFS' else DiscType.DVD
+
+        self.log.info("%s - Classified disc as %s", dev, disc.label)
+        self._cache[dev] = (key, disc)
+        return disc
@@ -0,0 +1,249 @@
+"""
+Disc fingerprints and index of discs already ripped
+
+A fingerprint identifies the content of a disc rather than the drive it is
+in, so a second copy of a disc (or the same disc in another drive) can be
+recognized before hours are spent ripping it again.
+
+"""
+
+import logging
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+
+from .. import APPDIR
+from .classify import toc_entries
+
+INDEX_FILE = os.path.join(APPDIR, 'fingerprints.db')
+
+SECTOR = 2048
+FIRST_SECTOR = 16  # ISO9660/UDF volume descriptors start here
+SECTORS = 16  # Number of sectors hashed
+
+# Policies for duplicate discs
+RIP = 'rip'  # Rip anyway
+SKIP = 'skip'  # Leave disc in drive and do nothing
+EJECT = 'eject'  # Eject disc without ripping
+LINK = 'link'  # Eject and record disc as a copy of the existing rip
+POLICIES = (RIP, SKIP, EJECT, LINK)
+
+# States of entries in the index
+RIPPING = 'ripping'
+RIPPED = 'ripped'
+
+
+def _read_sectors(path: str) -> bytes:
+    try:
+        with open(path, mode='rb', buffering=0) as iid:
+            iid.seek(FIRST_SECTOR * SECTOR)
+            return iid.read(SECTORS * SECTOR)
+    except OSError:
+        return b''
+
+
+def from_device(dev: str, props) -> str | None:
+    """
+    Fingerprint disc in a Linux drive
+
+    Audio CDs are identified by their TOC (as CD database disc IDs are);
+    data discs by their file system UUID/label and a hash of the first
+    volume descriptor sectors.
+
+    Arguments:
+        dev (str): Dev device
+        props (Mapping): udev properties of the device
+
+    Returns:
+        str: Hex digest, or None if nothing identifying could be read
+
+    """
+
+    digest = hashlib.sha1()
+    found = False
+
+    toc = toc_entries(dev)
+    if toc:
+        digest.update(repr(toc).encode())
+        found = True
+
+    for key in ('ID_FS_UUID', 'ID_FS_LABEL', 'ID_FS_TYPE'):
+        val = props.get(key, '')
+        if val:
+            digest.update(f"{key}={val}".encode())
+            found = True
+
+    if props.get('ID_FS_TYPE', ''):
+        data = _read_sectors(dev)
+        if data:
+            digest.update(data)
+            found = True
+
+    return digest.hexdigest() if found else None
+
+
+def from_volume(dev: str, info: tuple) -> str | None:
+    """
+    Fingerprint disc in a Windows drive
+
+    Arguments:
+        dev (str): Drive letter; e.g., D:
+        info (tuple): Result of win32api.GetVolumeInformation
+
+    Returns:
+        str: Hex digest, or None if nothing identifying could be read
+
+    """
+
+    name, serial, _, _, fs = info
+    digest = hashlib.sha1(f"{name}|{serial}|{fs}".encode())
+    data = _read_sectors(f"\\\\.\\{dev}")
+    if data:
+        digest.update(data)
+    elif not serial:
+        # Audio CD serials are derived from the TOC, so are identifying
+        return None
+    return digest.hexdigest()
+
+
+class FingerprintIndex:
+    """
+    Persistent index of disc fingerprints
+
+    Lookups hit an in-memory cache; the sqlite file is only written when
+    a rip starts or finishes.
+
+    """
+
+    def __init__(self, path: str = INDEX_FILE):
+        self.log = logging.getLogger(__name__)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS discs ("
+            "fingerprint TEXT PRIMARY KEY, "
+            "disc_type TEXT, "
+            "dev TEXT, "
+            "status TEXT, "
+            "output TEXT, "
+            "copies INTEGER DEFAULT 0, "
+            "updated REAL)"
+        )
+        # Entries left 'ripping' by a previous run never finished
+        self._db.execute(
+            "DELETE FROM discs WHERE status = ?",
+            (RIPPING,),
+        )
+        self._db.commit()
+
+        self._cache = {
+            row[0]: {
+                'disc_type': row[1],
+                'dev': row[2],
+                'status': row[3],
+                'output': row[4],
+            }
+            for row in self._db.execute(
+                "SELECT fingerprint, disc_type, dev, status, output "
+                "FROM discs"
+            )
+        }
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self._cache
+
+    def lookup(self, fingerprint: str) -> dict | None:
+        """
+        Get entry for fingerprint
+
+        Returns:
+            dict: Keys are disc_type, dev, status, output; None if the
+                disc has not been seen
+
+        """
+
+        return self._cache.get(fingerprint, None)
+
+    def _write(self, fingerprint: str, entry: dict) -> None:
+        with self._lock:
+            self._cache[fingerprint] = entry
+            self._db.execute(
+                "INSERT INTO discs "
+                "(fingerprint, disc_type, dev, status, output, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(fingerprint) DO UPDATE SET "
+                "disc_type=excluded.disc_type, dev=excluded.dev, "
+                "status=excluded.status, output=excluded.output, "
+                "updated=excluded.updated",
+                (
+                    fingerprint,
+                    entry['disc_type'],
+                    entry['dev'],
+                    entry['status'],
+                    entry['output'],
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def start(self, fingerprint: str, dev: str, disc_type: str) -> None:
+        self._write(
+            fingerprint,
+            {
+                'disc_type': disc_type,
+                'dev': dev,
+                'status': RIPPING,
+                'output': None,
+            },
+        )
+
+    def finish(
+        self,
+        fingerprint: str,
+        ok: bool = True,
+        output: str | None = None,
+    ) -> None:
+        """
+        Mark rip of disc finished
+
+        Failed rips are removed so the disc is ripped when seen again.
+
+        """
+
+        entry = self._cache.get(fingerprint, None)
+        if entry is None:
+            return
+
+        if not ok:
+            with self._lock:
+                self._cache.pop(fingerprint, None)
+                self._db.execute(
+                    "DELETE FROM discs WHERE fingerprint = ?",
+                    (fingerprint,),
+                )
+                self._db.commit()
+            return
+
+        entry = dict(entry, status=RIPPED, output=output or entry['output'])
+        self._write(fingerprint, entry)
+
+    def add_copy(self, fingerprint: str) -> None:
+        """
+        Record that another copy of a disc was seen
+
+        """
+
+        with self._lock:
+            self._db.execute(
+                "UPDATE discs SET copies = copies + 1, updated = ? "
+                "WHERE fingerprint = ?",
+                (time.time(), fingerprint),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -8,7 +8,9 @@ import logging
 import pyudev
 
 from . import RUNNING
+from . import fingerprint
 from .base import BaseWatchdog
+from .classify import DiscClassifier
 
 KEY = 'DEVNAME'
 CHANGE = 'DISK_MEDIA_CHANGE'
@@ -48,6 +50,45 @@ class Watchdog(BaseWatchdog):
         self._context = pyudev.Context()
         self._monitor = pyudev.Monitor.from_netlink(self._context)
         self._monitor.filter_by(subsystem='block')
+        self._classifier = DiscClassifier()
+
+    def drives(self) -> list[str]:
+        """
+        List dev devices of all optical drives known to udev
+
+        """
+
+        return sorted(
+            device.device_node
+            for device in self._context.list_devices(
+                subsystem='block',
+                ID_CDROM='1',
+            )
+            if device.device_node
+        )
+
+    def probe(self, dev: str) -> str | None:
+        # Probes run concurrently (startup scan, asyncio core) and a
+        # pyudev Context is not thread-safe, so each gets its own
+        context = pyudev.Context()
+        device = pyudev.Devices.from_device_file(context, dev)
+        props = device.properties
+        if props.get('ID_CDROM_MEDIA', '') != '1':
+            return None
+        if props.get(STATUS, '') not in ('', 'complete'):
+            return None
+        disc_type = self._classifier.classify(dev, props).handler
+        if disc_type is not None:
+            self.set_fingerprint(dev, fingerprint.from_device, props)
+        return disc_type
+
+    def invalidate(self, dev: str) -> None:
+        """
+        Forget cached classification of disc in drive
+
+        """
+
+        self._classifier.invalidate(dev)
 
     def run(self):
         """
@@ -59,6 +100,11 @@ class Watchdog(BaseWatchdog):
         """
 
         self.log.info('Watchdog thread started')
+
+        # Start monitor first so inserts during the scan are not lost
+        self._monitor.start()
+        self.scan()
+
         while not RUNNING.is_set():
             device = self._monitor.poll(timeout=1.0)
             if device is None:
@@ -71,10 +117,12 @@ class Watchdog(BaseWatchdog):
 
             if device.properties.get(EJECT, ''):
                 self.log.debug("%s - Eject request", dev)
+                self._classifier.invalidate(dev)
                 continue
 
             if device.properties.get(READY, '') == '0':
                 self.log.debug("%s - Drive is ejected", dev)
+                self._classifier.invalidate(dev)
                 continue
 
             if device.properties.get(CHANGE, '') != '1':
@@ -98,7 +146,15 @@ class Watchdog(BaseWatchdog):
                 continue
 
             self.log.debug("%s - Finished mounting", dev)
-            self.HANDLE_INSERT.emit(
+            disc = self._classifier.classify(dev, device.properties)
+            if disc.handler is None:
+                self.log.info("%s - Nothing to rip on %s", dev, disc.label)
+                self.decline(dev)
+                continue
+
+            self.set_fingerprint(
                 dev,
-                'video' if status == 'complete' else 'audio',
+                fingerprint.from_device,
+                device.properties,
             )
+            self.HANDLE_INSERT.emit(dev, disc.handler)
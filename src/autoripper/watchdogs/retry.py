@@ -0,0 +1,292 @@
+"""
+Automatic retry of failed rips with per-drive failure tracking
+
+Failed rips are re-queued with exponential backoff. Failure rates are
+tracked per physical drive (model and serial number) and persisted, so a
+drive whose error rate passes a threshold stops receiving work while
+other drives of the same model carry on. Counts decay over time, so a
+drive that was repaired, or had a run of bad discs, is tried again
+later. Totals per drive model are kept as statistics only.
+
+"""
+
+import logging
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtCore
+
+from .. import APPDIR
+
+try:
+    from ..ui.utils import get_identity
+except Exception:
+    get_identity = None
+
+STATS_FILE = os.path.join(APPDIR, 'drive_stats.json')
+
+MAX_RETRIES = 2  # Retries of a disc before giving up
+BACKOFF = 30.0  # Seconds before first retry; doubled for each retry
+THRESHOLD = 0.5  # Failure rate above which a drive is unhealthy
+MIN_ATTEMPTS = 5  # Rips needed before failure rate is trusted
+HALF_LIFE = 7 * 86400.0  # Seconds for drive counts to decay by half
+PROBE_WORKERS = 4  # Max drives probed for a retry at the same time
+
+
+class RetryEngine(QtCore.QObject):
+    """
+    Re-queue failed rips and track drive health
+
+    """
+
+    # Dev device and number of the retry
+    RETRY = QtCore.pyqtSignal(str, int)
+    # Dev device and identity of drive marked unhealthy
+    UNHEALTHY = QtCore.pyqtSignal(str, str)
+    # Dev device, disc type, number of the retry and if a disc was found;
+    # carries probe results from the executor back to the GUI thread
+    _PROBED = QtCore.pyqtSignal(str, str, int, bool)
+
+    def __init__(
+        self,
+        watchdog,
+        *args,
+        max_retries: int = MAX_RETRIES,
+        backoff: float = BACKOFF,
+        threshold: float = THRESHOLD,
+        min_attempts: int = MIN_ATTEMPTS,
+        half_life: float = HALF_LIFE,
+        path: str = STATS_FILE,
+        **kwargs,
+    ):
+        """
+        Arguments:
+            watchdog (BaseWatchdog): Watchdog to re-queue rips on
+
+        Keyword arguments:
+            max_retries (int): Retries of a disc before giving up
+            backoff (float): Seconds before first retry
+            threshold (float): Failure rate marking drive unhealthy
+            min_attempts (int): Rips before failure rate is trusted
+            half_life (float): Seconds for a drive's counts to decay by
+                half
+            path (str): File to persist drive statistics in
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+
+        self.watchdog = watchdog
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.threshold = threshold
+        self.min_attempts = min_attempts
+        self.half_life = half_life
+        self.path = path
+
+        self._attempts = {}  # Retries so far of disc in each drive
+        self._identity = {}  # Cache of drive model and serial per dev
+        # Probes read the disc, so they are kept off the GUI thread
+        self._pool = ThreadPoolExecutor(
+            max_workers=PROBE_WORKERS,
+            thread_name_prefix='retry',
+        )
+        self._PROBED.connect(self._probed)
+        # Decaying attempts/failures per physical drive, which gate work,
+        # and lifetime totals per model, which are statistics only
+        self.drives, self.models = self._load()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self) -> tuple[dict, dict]:
+        if not os.path.isfile(self.path):
+            return {}, {}
+        try:
+            with open(self.path, mode='r') as iid:
+                stats = json.load(iid)
+        except (OSError, ValueError) as err:
+            self.log.warning("Failed to load drive stats: %s", err)
+            return {}, {}
+        return stats.get('drives', {}), stats.get('models', {})
+
+    def _save(self) -> None:
+        try:
+            with open(self.path, mode='w') as oid:
+                json.dump(
+                    {'drives': self.drives, 'models': self.models},
+                    oid,
+                    indent=4,
+                )
+        except OSError as err:
+            self.log.warning("Failed to save drive stats: %s", err)
+
+    def identity(self, dev: str) -> tuple[str, str]:
+        """
+        Get model and physical identity of drive; see get_identity()
+
+        """
+
+        ident = self._identity.get(dev, None)
+        if ident is None:
+            if get_identity is None:
+                ident = (dev, dev)
+            else:
+                ident = get_identity(dev)
+            self._identity[dev] = ident
+        return ident
+
+    def _counts(self, dev: str, now: float | None = None) -> list[float]:
+        """
+        Get decayed attempts and failures of a physical drive
+
+        """
+
+        entry = self.drives.get(self.identity(dev)[1], None)
+        if entry is None:
+            return [0.0, 0.0]
+        now = time.time() if now is None else now
+        scale = 0.5 ** (max(now - entry['updated'], 0.0) / self.half_life)
+        return [entry['attempts'] * scale, entry['failures'] * scale]
+
+    def failure_rate(self, dev: str) -> float:
+        attempts, failures = self._counts(dev)
+        return failures / attempts if attempts else 0.0
+
+    def healthy(self, dev: str) -> bool:
+        """
+        Check if drive should be given work
+
+        """
+
+        # Rounded so counts decayed by moments since they were recorded
+        # still add up to whole rips
+        attempts, _ = self._counts(dev)
+        if round(attempts) < self.min_attempts:
+            return True
+        return self.failure_rate(dev) <= self.threshold
+
+    def reset(self, dev: str) -> None:
+        """
+        Forget failures of drive; e.g., after it was repaired
+
+        """
+
+        if self.drives.pop(self.identity(dev)[1], None) is not None:
+            self._save()
+
+    def record(self, dev: str, ok: bool) -> None:
+        model, drive = self.identity(dev)
+        was_healthy = self.healthy(dev)
+
+        now = time.time()
+        attempts, failures = self._counts(dev, now)
+        self.drives[drive] = {
+            'model': model,
+            'attempts': attempts + 1,
+            'failures': failures + (not ok),
+            'updated': now,
+        }
+        attempts, failures = self.models.get(model, (0, 0))
+        self.models[model] = (attempts + 1, failures + (not ok))
+        self._save()
+
+        if was_healthy and not self.healthy(dev):
+            self.log.error(
+                "%s - Drive '%s' failure rate %.0f%% exceeds threshold; "
+                "no longer sending work to it",
+                dev,
+                drive,
+                100 * self.failure_rate(dev),
+            )
+            self.UNHEALTHY.emit(dev, drive)
+
+    def finished(
+        self,
+        dev: str,
+        disc_type: str,
+        ok: bool | None,
+        cancelled: bool = False,
+    ) -> None:
+        """
+        Process the outcome of a rip
+
+        Arguments:
+            dev (str): Dev device
+            disc_type (str): Type of disc, either audio or video
+            ok (bool): If the rip succeeded; None if not known, in
+                which case the rip is neither counted nor retried
+            cancelled (bool): If the rip was cancelled by the user
+
+        """
+
+        if cancelled or ok is None:
+            self._attempts.pop(dev, None)
+            return
+
+        self.record(dev, ok)
+        if ok:
+            self._attempts.pop(dev, None)
+            return
+
+        retry = self._attempts.get(dev, 0) + 1
+        if retry > self.max_retries:
+            self.log.error(
+                "%s - Rip failed after %d retries, giving up",
+                dev,
+                self.max_retries,
+            )
+            self._attempts.pop(dev, None)
+            return
+
+        self._attempts[dev] = retry
+        delay = self.backoff * 2 ** (retry - 1)
+        self.log.warning(
+            "%s - Rip failed; retry %d of %d in %.0f s",
+            dev,
+            retry,
+            self.max_retries,
+            delay,
+        )
+        QtCore.QTimer.singleShot(
+            int(delay * 1000),
+            lambda: self._retry(dev, disc_type, retry),
+        )
+
+    def _retry(self, dev: str, disc_type: str, retry: int) -> None:
+        self._pool.submit(self._probe, dev, disc_type, retry)
+
+    def _probe(self, dev: str, disc_type: str, retry: int) -> None:
+        try:
+            found = self.watchdog.probe(dev) is not None
+        except Exception as err:
+            self.log.warning("%s - Failed to probe drive: %s", dev, err)
+            found = False
+        self._PROBED.emit(dev, disc_type, retry, found)
+
+    @QtCore.pyqtSlot(str, str, int, bool)
+    def _probed(self, dev: str, disc_type: str, retry: int, found: bool):
+        if not found:
+            self.log.warning(
+                "%s - Disc no longer in drive, cancelling retry",
+                dev,
+            )
+            self._attempts.pop(dev, None)
+            return
+
+        if self.healthy(dev):
+            self.log.info("%s - Retrying rip (%d)", dev, retry)
+            self.RETRY.emit(dev, retry)
+            self.watchdog.HANDLE_INSERT.emit(dev, disc_type)
+            return
+
+        self.log.error(
+            "%s - Drive is unhealthy; ejecting disc for retry in another "
+            "drive",
+            dev,
+        )
+        self._attempts.pop(dev, None)
+        self.watchdog.eject(dev)
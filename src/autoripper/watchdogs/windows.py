@@ -4,6 +4,7 @@ Utilities for ripping titles
 """
 
 import logging
+import queue
 
 import win32con
 import win32api
@@ -11,16 +12,25 @@ import win32file
 import win32gui
 import win32gui_struct
 
+from . import RUNNING
+from . import fingerprint
 from .base import BaseWatchdog
+from .classify import DiscClassifier
+
+WINDOW_CLASS = 'AutoRipperDeviceWatch'
+POLL = 0.1  # Seconds between pumping messages when idle
 
 
 class Watchdog(BaseWatchdog):
     """
     Main watchdog for disc monitoring/ripping
 
-    This thread will run a pyudev monitor instance, looking for changes in
-    disc. On change, will spawn the DiscHandler object for handling loading
-    of disc information from the database if exists, or prompting using for
+    This thread creates a hidden window of its own to receive
+    WM_DEVICECHANGE broadcasts, so that unpacking the events and querying
+    the drives never runs in the GUI thread's message pump. On insert of a
+    disc, only the final HANDLE_INSERT is posted back to the GUI thread,
+    which spawns the DiscHandler object for handling loading of disc
+    information from the database if exists, or prompting using for
     information via a GUI.
 
     After information is obtained, a rip of the requested/flagged tracks
@@ -49,16 +59,75 @@ class Watchdog(BaseWatchdog):
 
         super().__init__(*args, **kwargs)
         self.log = logging.getLogger(__name__)
+        self._classifier = DiscClassifier()
+
+        self.hwnd = None
+        self._events = queue.Queue()
+
+    def run(self):
+        """
+        Processing for thread
+
+        Pumps messages for the hidden device window and processes device
+        changes queued by the window procedure
+
+        """
+
+        self.log.info('Watchdog thread started')
+        self.hwnd = self._create_window()
+        self.scan()
+        try:
+            while not RUNNING.is_set():
+                win32gui.PumpWaitingMessages()
+                try:
+                    event = self._events.get(timeout=POLL)
+                except queue.Empty:
+                    continue
+                self.process_device_change(*event)
+        finally:
+            win32gui.DestroyWindow(self.hwnd)
+            self.hwnd = None
+
+    def _create_window(self):
+        """
+        Create hidden top-level window to receive device broadcasts
 
-        # Subclass native winEventProc using the progress widget
-        self.hwnd = int(self.progress.winId())
-        self.old_proc = win32gui.SetWindowLong(
-            self.hwnd,
-            win32con.GWL_WNDPROC,
-            self.event_handler,
+        Message-only windows do not receive broadcasts, so a regular
+        window that is never shown is used.
+
+        """
+
+        hinst = win32api.GetModuleHandle(None)
+        wc = win32gui.WNDCLASS()
+        wc.hInstance = hinst
+        wc.lpszClassName = WINDOW_CLASS
+        wc.lpfnWndProc = {win32con.WM_DEVICECHANGE: self.event_handler}
+        try:
+            win32gui.RegisterClass(wc)
+        except win32gui.error:
+            pass  # Class already registered by earlier instance
+
+        return win32gui.CreateWindowEx(
+            0,
+            WINDOW_CLASS,
+            WINDOW_CLASS,
+            0,
+            0,
+            0,
+            0,
+            0,
+            0,
+            0,
+            hinst,
+            None,
         )
 
     def event_handler(self, hwnd, msg, wparam, lparam):
+        """
+        Window procedure; only unpacks the event and queues it
+
+        """
+
         if msg == win32con.WM_DEVICECHANGE and wparam is not None:
             try:
                 dev_broadcast = win32gui_struct.UnpackDEV_BROADCAST(lparam)
@@ -68,34 +137,66 @@ class Watchdog(BaseWatchdog):
                 device_type = getattr(dev_broadcast, 'devicetype', None)
                 unitmask = getattr(dev_broadcast, 'unitmask', None)
                 arrival = wparam == win32con.DBT_DEVICEARRIVAL
-                self.process_device_change(device_type, unitmask, arrival)
-        return win32gui.CallWindowProc(
-            self.old_proc,
-            hwnd,
-            msg,
-            wparam,
-            lparam,
-        )
+                self._events.put((device_type, unitmask, arrival))
+        return True
 
     def process_device_change(self, device_type, unitmask, arrival: bool):
         if device_type != win32con.DBT_DEVTYP_VOLUME:
             return
 
-        drives = self._mask_to_letters(unitmask)
-        for dev in drives:
-            if not self._is_cdrom(dev):
-                continue
+        # One drive failing (e.g., not ready yet) must neither stop the
+        # others in the mask nor end the watchdog thread
+        for dev in self._mask_to_letters(unitmask):
+            try:
+                self._drive_change(dev, arrival)
+            except Exception as err:
+                self.log.warning(
+                    "%s - Failed to process device change: %s",
+                    dev,
+                    err,
+                )
+
+    def _drive_change(self, dev: str, arrival: bool) -> None:
+        if not self._is_cdrom(dev):
+            return
+
+        if not arrival:
+            self.log.debug("%s - Caught non-insert event", dev)
+            self._classifier.invalidate(dev)
+            return
 
-            if not arrival:
-                self.log.debug("%s - Caught non-insert event", dev)
-                continue
+        self.log.debug("%s - Finished mounting", dev)
+        info = win32api.GetVolumeInformation(dev)
+        disc = self._classifier.classify_volume(dev, info)
+        if disc.handler is None:
+            self.log.info("%s - Nothing to rip on %s", dev, disc.label)
+            self.decline(dev)
+            return
 
-            self.log.debug("%s - Finished mounting", dev)
-            fs = win32api.GetVolumeInformation(dev)[4]
-            self.HANDLE_INSERT.emit(
-                dev,
-                'audio' if fs == "CDFS" else 'video',
-            )
+        self.set_fingerprint(dev, fingerprint.from_volume, info)
+        self.HANDLE_INSERT.emit(dev, disc.handler)
+
+    def probe(self, dev: str) -> str | None:
+        try:
+            info = win32api.GetVolumeInformation(f"{dev}\\")
+        except Exception:
+            return None  # No media in drive
+        disc_type = self._classifier.classify_volume(dev, info).handler
+        if disc_type is not None:
+            self.set_fingerprint(dev, fingerprint.from_volume, info)
+        return disc_type
+
+    def drives(self) -> list[str]:
+        """
+        List drive letters of all optical drives
+
+        """
+
+        return [
+            dev
+            for dev in self._mask_to_letters(win32api.GetLogicalDrives())
+            if self._is_cdrom(dev)
+        ]
 
     def _mask_to_letters(self, mask):
         return [
@@ -112,11 +213,3 @@ class Watchdog(BaseWatchdog):
             )
         except Exception:
             return False
-
-    def start(self):
-        """
-        Overload as do not want the thread to start
-
-        """
-
-        pass
@@ -0,0 +1,401 @@
+"""
+Run disc handlers in worker processes
+
+Each disc handler is started in its own process so a crash in one handler
+cannot take down every rip, and CPU-heavy handler work is spread across
+cores. The supervisor (GUI) process keeps a WorkerProcess object that looks
+like a disc handler to the watchdog, while all progress signals emitted by
+the handler in the worker are sent back over a pipe as compact messages and
+re-emitted on the real progress dialog.
+
+"""
+
+import logging
+import multiprocessing
+import threading
+from subprocess import Popen
+
+from PyQt5 import QtCore
+
+from .. import shared_progress
+
+# Message kinds sent from worker to supervisor
+SIGNAL = 0  # Re-emit a progress dialog signal; name, args
+UPDATE = 1  # Update progress model row; dev, dict
+HANDLER = 2  # Re-emit a handler signal; name, args
+
+# Message kinds sent from supervisor to worker
+CANCEL = 'cancel'
+
+MAX_RESTARTS = 1  # Times to restart a worker that crashed mid rip
+STOP_TIMEOUT = 5.0  # Seconds a worker has to exit after cancel on quit
+
+# Progress dialog signals that are forwarded as-is
+FORWARD = (
+    'MKV_ADD_DISC',
+    'MKV_REMOVE_DISC',
+    'MKV_CUR_TRACK',
+    'MKV_CUR_DISC',
+    'CD_ADD_DISC',
+    'CD_REMOVE_DISC',
+    'CD_GET_METADATA',
+    'CD_SET_TRACKS_INFO',
+    'CD_CUR_TRACK',
+    'CD_TRACK_SIZE',
+)
+
+
+class ProgressProxy(QtCore.QObject):
+    """
+    Stand-in for the ProgressDialog inside a worker process
+
+    """
+
+    MKV_ADD_DISC = QtCore.pyqtSignal(str, dict, bool)
+    MKV_REMOVE_DISC = QtCore.pyqtSignal(str)
+    MKV_NEW_PROCESS = QtCore.pyqtSignal(str, Popen, str)
+    MKV_CUR_TRACK = QtCore.pyqtSignal(str, str)
+    MKV_CUR_DISC = QtCore.pyqtSignal(str, str)
+
+    CD_ADD_DISC = QtCore.pyqtSignal(str)
+    CD_REMOVE_DISC = QtCore.pyqtSignal(str)
+    CD_GET_METADATA = QtCore.pyqtSignal(str)
+    CD_SET_TRACKS_INFO = QtCore.pyqtSignal(str, dict)
+    CD_CUR_TRACK = QtCore.pyqtSignal(str, str)
+    CD_TRACK_SIZE = QtCore.pyqtSignal(str, int)
+
+    CANCEL = QtCore.pyqtSignal(str)
+
+    def __init__(self, conn, *args, slot=None, **kwargs):
+        """
+        Arguments:
+            conn (Connection): Pipe to the supervisor
+
+        Keyword arguments:
+            slot (ProgressSlot): Shared-memory progress record to write
+                progress values to instead of sending them over the pipe
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+        self._conn = conn
+        self._slot = slot
+        self._lock = threading.Lock()
+        self._readers = []
+
+        for name in FORWARD:
+            getattr(self, name).connect(self._forwarder(name))
+        self.MKV_NEW_PROCESS.connect(self.mkv_new_process)
+        if self._slot is not None:
+            self.MKV_CUR_TRACK.connect(self._set_title)
+            self.CD_CUR_TRACK.connect(self._set_title)
+
+    def _forwarder(self, name):
+        def forward(*args):
+            self.send(SIGNAL, name, args)
+        return forward
+
+    def send(self, *msg) -> None:
+        with self._lock:
+            try:
+                self._conn.send(msg)
+            except (OSError, EOFError):
+                self.log.debug("Supervisor pipe closed")
+
+    def update(self, dev: str, **kwargs) -> None:
+        """
+        Mirror of ProgressModel.update() so progress readers can be reused
+
+        """
+
+        if self._slot is not None and 'done' in kwargs:
+            self._slot.write(kwargs.pop('done'), kwargs.pop('total', 0))
+        if kwargs:
+            self.send(UPDATE, dev, kwargs)
+
+    @QtCore.pyqtSlot(str, str)
+    def _set_title(self, dev: str, title: str):
+        try:
+            self._slot.set_title(int(title))
+        except ValueError:
+            pass
+
+    @QtCore.pyqtSlot(str, Popen, str)
+    def mkv_new_process(self, dev: str, proc: Popen, pipe: str):
+        if self._slot is not None:
+            self._slot.set_state(shared_progress.RIPPING)
+        # Process objects cannot cross the pipe, so parse progress here
+        from ..ui.progress_view import MKVProgressReader
+
+        reader = MKVProgressReader(self, dev, proc, pipe)
+        self._readers.append(reader)
+        reader.start()
+
+
+def run_worker(
+    conn,
+    dev: str,
+    disc_type: str,
+    root: str | None,
+    shm_name: str | None = None,
+    index: int | None = None,
+) -> None:
+    """
+    Entry point of a worker process
+
+    Arguments:
+        conn (Connection): Pipe to the supervisor
+        dev (str): Dev device
+        disc_type (str): Type of disc, either audio or video
+        root (str): Location of the 'by-uuid' directory
+        shm_name (str): Name of shared-memory progress table
+        index (int): Index of this drive's record in the table
+
+    """
+
+    from PyQt5 import QtWidgets
+    from .base import AudioDiscHandler, VideoDiscHandler
+
+    log = logging.getLogger(__name__)
+    app = QtWidgets.QApplication([])
+    app.setQuitOnLastWindowClosed(False)
+
+    shared = slot = None
+    if shm_name is not None:
+        shared = shared_progress.SharedProgress(shm_name, create=False)
+        slot = shared.slot(index)
+    proxy = ProgressProxy(conn, slot=slot)
+
+    if disc_type == 'video':
+        obj = VideoDiscHandler(dev, root, proxy)
+        obj.FAILURE.connect(
+            lambda fname: proxy.send(HANDLER, 'FAILURE', (fname,))
+        )
+        obj.SUCCESS.connect(
+            lambda fname: proxy.send(HANDLER, 'SUCCESS', (fname,))
+        )
+    else:
+        obj = AudioDiscHandler(dev, proxy)
+
+    obj.EJECT_DISC.connect(lambda: proxy.send(HANDLER, 'EJECT_DISC', ()))
+
+    def finished():
+        obj.wait()
+        proxy.send(HANDLER, 'FINISHED', ())
+        app.quit()
+
+    obj.FINISHED.connect(finished)
+
+    def listen():
+        while True:
+            try:
+                msg = conn.recv()
+            except (OSError, EOFError):
+                log.info("%s - Supervisor went away, cancelling", dev)
+                proxy.CANCEL.emit(dev)
+                return
+            if msg == CANCEL:
+                proxy.CANCEL.emit(dev)
+
+    threading.Thread(target=listen, daemon=True).start()
+    app.exec_()
+
+    if shared is not None:
+        shared.close()
+
+
+class WorkerProcess(QtCore.QObject):
+    """
+    Supervisor side of a disc handler running in a worker process
+
+    Exposes the same signals and methods the watchdog uses on disc
+    handlers, so it can be tracked and cleaned up the same way.
+
+    """
+
+    FAILURE = QtCore.pyqtSignal(str)
+    SUCCESS = QtCore.pyqtSignal(str)
+    FINISHED = QtCore.pyqtSignal()
+    EJECT_DISC = QtCore.pyqtSignal()
+
+    def __init__(
+        self,
+        dev: str,
+        disc_type: str,
+        root: str | None,
+        progress,
+        *args,
+        shared=None,
+        **kwargs,
+    ):
+        """
+        Arguments:
+            dev (str): Dev device
+            disc_type (str): Type of disc, either audio or video
+            root (str): Location of the 'by-uuid' directory
+            progress (ProgressDialog): Progress dialog to forward to
+
+        Keyword arguments:
+            shared (SharedProgress): Shared-memory progress table the
+                worker writes progress values to
+
+        """
+
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger(__name__)
+
+        self.dev = dev
+        self.disc_type = disc_type
+        self.root = root
+        self.progress = progress
+        self.shared = shared
+
+        self.restarts = 0
+        self._ctx = multiprocessing.get_context('spawn')
+        self._proc = None
+        self._conn = None
+        self._reader = None
+        self._finished = False
+
+        self.progress.CANCEL.connect(self.cancel)
+
+    @property
+    def pid(self) -> int | None:
+        return None if self._proc is None else self._proc.pid
+
+    def start(self) -> None:
+        shm_name = index = None
+        if self.shared is not None:
+            shm_name = self.shared.name
+            index = self.shared.claim(self.dev)
+
+        self._conn, child = self._ctx.Pipe()
+        self._proc = self._ctx.Process(
+            target=run_worker,
+            args=(
+                child,
+                self.dev,
+                self.disc_type,
+                self.root,
+                shm_name,
+                index,
+            ),
+            name=f"autoripper-{self.dev}",
+            daemon=False,
+        )
+        self._proc.start()
+        child.close()
+        self.log.info(
+            "%s - Started worker process %d",
+            self.dev,
+            self._proc.pid,
+        )
+
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self) -> None:
+        """
+        Re-emit messages from the worker until it exits
+
+        """
+
+        model = getattr(self.progress, 'model', None)
+        while True:
+            try:
+                kind, *msg = self._conn.recv()
+            except (OSError, EOFError):
+                break
+
+            if kind == SIGNAL:
+                name, args = msg
+                getattr(self.progress, name).emit(*args)
+            elif kind == UPDATE:
+                if model is not None:
+                    model.update(msg[0], **msg[1])
+            elif kind == HANDLER:
+                name, args = msg
+                if name == 'FINISHED':
+                    self._finished = True
+                getattr(self, name).emit(*args)
+
+        self._proc.join()
+        if not self._finished:
+            self._crashed()
+        elif self.shared is not None:
+            self.shared.release(self.dev)
+
+    def _crashed(self) -> None:
+        self.log.error(
+            "%s - Worker process exited unexpectedly with code %s",
+            self.dev,
+            self._proc.exitcode,
+        )
+
+        # Clear any progress left over from the dead worker
+        if self.disc_type == 'video':
+            self.progress.MKV_REMOVE_DISC.emit(self.dev)
+        else:
+            self.progress.CD_REMOVE_DISC.emit(self.dev)
+
+        if self.restarts < MAX_RESTARTS:
+            self.restarts += 1
+            self.log.info(
+                "%s - Restarting worker (attempt %d)",
+                self.dev,
+                self.restarts,
+            )
+            self.start()
+            return
+
+        self._finished = True
+        if self.shared is not None:
+            self.shared.release(self.dev)
+        self.FINISHED.emit()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait for worker process to exit
+
+        """
+
+        if self._proc is None:
+            return True
+        self._proc.join(timeout)
+        return not self._proc.is_alive()
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """
+        Cancel the rip and make sure the worker exits
+
+        Workers are not daemonic (they start their own child processes),
+        so any still alive would be joined at interpreter exit and hang
+        quitting; terminate any that do not exit after the cancel.
+
+        """
+
+        if self._proc is None or not self._proc.is_alive():
+            return
+        self.restarts = MAX_RESTARTS  # Do not restart after terminate
+        self.cancel(self.dev)
+        self._proc.join(timeout)
+        if self._proc.is_alive():
+            self.log.warning("%s - Terminating worker process", self.dev)
+            self._proc.terminate()
+            self._proc.join(timeout)
+        if self._proc.is_alive():
+            self._proc.kill()
+            self._proc.join()
+
+    @QtCore.pyqtSlot(str)
+    def cancel(self, dev: str) -> None:
+        if dev != self.dev or self._conn is None:
+            return
+        if self._proc is None or not self._proc.is_alive():
+            return
+        self.log.info("%s - Sending cancel to worker", dev)
+        try:
+            self._conn.send(CANCEL)
+        except (OSError, EOFError):
+            pass
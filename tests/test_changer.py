@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from PyQt5 import QtCore  # noqa: E402
+
+from autoripper.changer import ChangerBatch, SimulatedChanger  # noqa: E402
+
+DRIVES = {0: '/dev/sr0', 1: '/dev/sr1'}
+
+
+class FakeWatchdog(QtCore.QObject):
+    """
+    Rips every disc it is told about, and ejects it when done
+
+    """
+
+    HANDLE_INSERT = QtCore.pyqtSignal(str, str)
+    DISC_EJECTED = QtCore.pyqtSignal(str)
+    RIP_FINISHED = QtCore.pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.prompts = True
+        self.ripped = []
+        self.ejected = []
+        self.HANDLE_INSERT.connect(self.handle_insert)
+
+    @QtCore.pyqtSlot(str, str)
+    def handle_insert(self, dev, disc_type):
+        self.ripped.append(dev)
+        # Rip ends (without ejecting) once the changer batch saw the insert
+        QtCore.QTimer.singleShot(0, lambda: self.RIP_FINISHED.emit(dev))
+
+    def decline(self, dev):
+        # As BaseWatchdog.decline() with prompts off
+        self.eject(dev)
+
+    def eject(self, dev):
+        self.ejected.append(dev)
+        self.DISC_EJECTED.emit(dev)
+
+
+@pytest.fixture
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def watchdog():
+    return FakeWatchdog()
+
+
+def run_batch(app, watchdog, on_load, slots, fail=(), **kwargs):
+    driver = SimulatedChanger(on_load=on_load, fail=fail)
+    batch = ChangerBatch(watchdog, driver, DRIVES, slots, **kwargs)
+    done = []
+    finished = []
+    batch.SLOT_DONE.connect(lambda slot, ok: done.append((slot, ok)))
+    batch.FINISHED.connect(lambda: finished.append(True))
+
+    batch.start()
+    assert watchdog.prompts is False
+    deadline = time.monotonic() + 10.0
+    while not finished and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    app.processEvents()
+
+    assert finished, 'Batch did not finish'
+    assert watchdog.prompts is True
+    return driver, sorted(done)
+
+
+def test_cycle(app, watchdog):
+    def on_load(slot, drive):
+        watchdog.HANDLE_INSERT.emit(DRIVES[drive], 'video')
+
+    driver, done = run_batch(app, watchdog, on_load, range(1, 6))
+    assert done == [(slot, True) for slot in range(1, 6)]
+    assert len(watchdog.ripped) == 5
+    # Every disc was ejected after its rip and returned to its slot
+    assert len(watchdog.ejected) == 5
+    assert sorted(
+        slot for action, slot, _ in driver.history if action == 'unload'
+    ) == list(range(1, 6))
+    assert driver.drives == {}
+
+
+def test_declined(app, watchdog):
+    def on_load(slot, drive):
+        if slot == 2:
+            watchdog.decline(DRIVES[drive])
+        else:
+            watchdog.HANDLE_INSERT.emit(DRIVES[drive], 'video')
+
+    driver, done = run_batch(app, watchdog, on_load, range(1, 5))
+    assert done == [(slot, True) for slot in range(1, 5)]
+    assert len(watchdog.ripped) == 3
+    assert driver.drives == {}
+
+
+def test_load_timeout(app, watchdog):
+    def on_load(slot, drive):
+        # Disc in slot 3 is never seen by the watchdog
+        if slot != 3:
+            watchdog.HANDLE_INSERT.emit(DRIVES[drive], 'video')
+
+    driver, done = run_batch(
+        app,
+        watchdog,
+        on_load,
+        range(1, 5),
+        load_timeout=0.2,
+    )
+    assert done == [(slot, True) for slot in range(1, 5)]
+    assert len(watchdog.ripped) == 3
+    assert len(watchdog.ejected) == 4
+    assert driver.drives == {}
+
+
+def test_load_failure(app, watchdog):
+    def on_load(slot, drive):
+        watchdog.HANDLE_INSERT.emit(DRIVES[drive], 'video')
+
+    _, done = run_batch(app, watchdog, on_load, range(1, 4), fail={2})
+    assert done == [(1, True), (2, False), (3, True)]
@@ -0,0 +1,139 @@
+import os
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from autoripper.checksum import (  # noqa: E402
+    HEAD,
+    FileHasher,
+    RipHashes,
+    check_manifest,
+    file_digest,
+)
+
+
+def write(path, data, mode='ab', offset=None):
+    with open(path, mode=mode) as oid:
+        if offset is not None:
+            oid.seek(offset)
+        oid.write(data)
+
+
+def test_incremental(tmp_path):
+    path = tmp_path / 'title.mkv'
+    write(path, os.urandom(3 * HEAD))
+    hasher = FileHasher(str(path), 'sha256')
+    hasher.update()
+    write(path, os.urandom(HEAD // 2))
+    hasher.update()
+
+    assert hasher.verify()
+    assert hasher.hexdigest() == file_digest(str(path), 'sha256')
+
+
+def test_small_file(tmp_path):
+    path = tmp_path / 'track01.flac'
+    write(path, os.urandom(HEAD // 4))
+    hasher = FileHasher(str(path), 'sha256')
+    hasher.update()
+    assert hasher.hexdigest() == file_digest(str(path), 'sha256')
+
+
+@pytest.mark.parametrize('offset', [0, 4, HEAD - 10])
+def test_header_rewrite(tmp_path, monkeypatch, offset):
+    path = tmp_path / 'track01.flac'
+    write(path, os.urandom(2 * HEAD))
+    hasher = FileHasher(str(path), 'sha256')
+    hasher.update()
+
+    # Header updated in place once the file is complete; picked up
+    # without hashing the file again
+    write(path, b'STREAMINFO', mode='r+b', offset=offset)
+    monkeypatch.setattr(FileHasher, 'rehash', None)
+    hasher.update()
+    assert hasher.verify()
+    assert hasher.hexdigest() == file_digest(str(path), 'sha256')
+
+
+def test_truncated(tmp_path):
+    path = tmp_path / 'title.mkv'
+    write(path, os.urandom(3 * HEAD))
+    hasher = FileHasher(str(path), 'sha256')
+    hasher.update()
+
+    os.truncate(path, 2 * HEAD)
+    assert not hasher.verify()
+    hasher.rehash()
+    assert hasher.hexdigest() == file_digest(str(path), 'sha256')
+
+
+def test_manifest(tmp_path):
+    path = tmp_path / 'title.mkv'
+    write(path, os.urandom(2 * HEAD))
+    hasher = FileHasher(str(path), 'sha256')
+    hasher.update()
+    manifest = hasher.write_manifest()
+
+    assert manifest == f"{path}.sha256-split"
+    assert check_manifest(manifest)
+    write(path, b'X', mode='r+b', offset=HEAD + 1)
+    assert not check_manifest(manifest)
+
+
+def test_discover_exclusive(tmp_path):
+    write(tmp_path / 'track01.flac', b'data')
+    rip = RipHashes('/dev/sr0', str(tmp_path), 'sha256')
+    rip.started -= 1
+
+    # Another rip without known processes may own the file
+    claimed = set()
+    rip.discover(claimed, exclusive=False)
+    assert rip.files == {}
+
+    rip.discover(claimed, exclusive=True)
+    assert list(rip.files) == [str(tmp_path / 'track01.flac')]
+    assert claimed == set(rip.files)
+
+
+def test_discover_scoped(tmp_path):
+    path = tmp_path / 'title_t00.mkv'
+    write(path, b'data')
+    rip = RipHashes('/dev/sr0', str(tmp_path), 'sha256')
+    rip.started -= 1
+
+    # Only files the rip's processes have open are claimed, never a scan
+    with open(path, mode='rb'):
+        rip.host = os.getpid()
+        assert rip.scoped
+        rip.discover(set(), exclusive=True)
+    assert list(rip.files) == [str(path)]
+
+    other = tmp_path / 'other.mkv'
+    write(other, b'data')
+    rip.discover(set(), exclusive=True)
+    assert str(other) not in rip.files
+
+
+def test_discover_final(tmp_path):
+    album = tmp_path / 'Artist' / 'Album'
+    album.mkdir(parents=True)
+    other = tmp_path / 'Other'
+    other.mkdir()
+    write(album / 'track01.flac', b'data')
+    rip = RipHashes('/dev/sr0', str(tmp_path), 'sha256')
+    rip.started -= 1
+
+    with open(album / 'track01.flac', mode='rb'):
+        rip.host = os.getpid()
+        rip.discover(set(), exclusive=False)
+
+    # Written between progress updates, so never seen open
+    write(album / 'track02.flac', b'data')
+    write(other / 'track01.flac', b'data')
+    rip.host = None
+    rip.discover(set(), exclusive=False, final=True)
+    assert sorted(rip.files) == [
+        str(album / 'track01.flac'),
+        str(album / 'track02.flac'),
+    ]
@@ -0,0 +1,148 @@
+import pytest
+
+from autoripper.watchdogs.classify import (
+    DiscClassifier,
+    DiscType,
+    from_listing,
+    from_properties,
+    from_tracks,
+)
+
+CD = {'ID_CDROM_MEDIA': '1', 'ID_CDROM_MEDIA_CD': '1'}
+
+
+@pytest.mark.parametrize(
+    'audio, data, expected',
+    [
+        (12, 0, DiscType.AUDIO_CD),
+        (10, 1, DiscType.MIXED_CD),
+        (0, 1, DiscType.DATA_CD),
+        (0, 0, DiscType.UNKNOWN),
+    ],
+)
+def test_from_tracks(audio, data, expected):
+    assert from_tracks(audio, data) is expected
+
+
+@pytest.mark.parametrize(
+    'props, expected',
+    [
+        ({'ID_CDROM_MEDIA_BD': '1'}, DiscType.BLURAY),
+        ({'ID_CDROM_MEDIA_BD_R': '1'}, DiscType.BLURAY),
+        ({'ID_CDROM_MEDIA_BD_RE': '1'}, DiscType.BLURAY),
+        ({'ID_CDROM_MEDIA_DVD': '1'}, DiscType.DVD),
+        ({'ID_CDROM_MEDIA_DVD_PLUS_R_DL': '1'}, DiscType.DVD),
+        ({'ID_CDROM_MEDIA_DVD_R': '0'}, DiscType.UNKNOWN),
+        (
+            {**CD, 'ID_CDROM_MEDIA_TRACK_COUNT_AUDIO': '14'},
+            DiscType.AUDIO_CD,
+        ),
+        (
+            {
+                **CD,
+                'ID_CDROM_MEDIA_TRACK_COUNT_AUDIO': '11',
+                'ID_CDROM_MEDIA_TRACK_COUNT_DATA': '1',
+            },
+            DiscType.MIXED_CD,
+        ),
+        (
+            {**CD, 'ID_CDROM_MEDIA_TRACK_COUNT_DATA': '1'},
+            DiscType.DATA_CD,
+        ),
+        ({**CD, 'ID_CDROM_MEDIA_TRACK_COUNT_AUDIO': ''}, DiscType.UNKNOWN),
+        (CD, DiscType.UNKNOWN),
+        ({}, DiscType.UNKNOWN),
+    ],
+)
+def test_from_properties(props, expected):
+    assert from_properties(props) is expected
+
+
+@pytest.mark.parametrize(
+    'names, fs, expected',
+    [
+        (['BDMV', 'CERTIFICATE'], 'UDF', DiscType.BLURAY),
+        (['VIDEO_TS', 'AUDIO_TS'], 'UDF', DiscType.DVD),
+        (['video_ts'], 'UDF', DiscType.DVD),
+        (['Track01.cda', 'Track02.cda'], 'CDFS', DiscType.AUDIO_CD),
+        (['Track01.cda', 'AUTORUN.INF'], 'CDFS', DiscType.MIXED_CD),
+        (['SETUP.EXE'], 'CDFS', DiscType.DATA_CD),
+        (['PHOTOS'], 'UDF', DiscType.DATA_DVD),
+        ([], 'CDFS', DiscType.UNKNOWN),
+    ],
+)
+def test_from_listing(names, fs, expected):
+    assert from_listing(names, fs) is expected
+
+
+class FakeTOC:
+    def __init__(self, counts):
+        self.counts = counts
+        self.reads = 0
+
+    def __call__(self, dev):
+        self.reads += 1
+        return self.counts
+
+
+@pytest.mark.parametrize(
+    'props, counts, expected, reads',
+    [
+        # Conclusive properties never read the TOC
+        ({'ID_CDROM_MEDIA_BD': '1'}, None, DiscType.BLURAY, 0),
+        ({'ID_CDROM_MEDIA_DVD': '1'}, None, DiscType.DVD, 0),
+        # Empty track counts fall back to the TOC
+        (CD, (9, 0), DiscType.AUDIO_CD, 1),
+        (CD, (9, 1), DiscType.MIXED_CD, 1),
+        (CD, (0, 1), DiscType.DATA_CD, 1),
+        # Unreadable TOC falls back to the media state
+        (CD, None, DiscType.AUDIO_CD, 1),
+        (
+            {**CD, 'ID_CDROM_MEDIA_STATE': 'complete'},
+            None,
+            DiscType.DVD,
+            1,
+        ),
+    ],
+)
+def test_classifier(props, counts, expected, reads):
+    toc = FakeTOC(counts)
+    classifier = DiscClassifier(read_toc=toc)
+    assert classifier.classify('/dev/sr0', props) is expected
+    assert toc.reads == reads
+
+
+def test_classifier_cache():
+    toc = FakeTOC((9, 0))
+    classifier = DiscClassifier(read_toc=toc)
+
+    # Repeated change events for the same media read the TOC once
+    for _ in range(3):
+        assert classifier.classify('/dev/sr0', CD) is DiscType.AUDIO_CD
+    assert toc.reads == 1
+
+    # Drives are cached independently
+    classifier.classify('/dev/sr1', CD)
+    assert toc.reads == 2
+
+    # New media in the drive changes the key
+    toc.counts = (0, 1)
+    props = {**CD, 'ID_FS_UUID': '2020-01-01-00-00-00-00'}
+    assert classifier.classify('/dev/sr0', props) is DiscType.DATA_CD
+    assert toc.reads == 3
+
+
+def test_classifier_invalidate():
+    toc = FakeTOC((9, 0))
+    classifier = DiscClassifier(read_toc=toc)
+    assert classifier.classify('/dev/sr0', CD) is DiscType.AUDIO_CD
+
+    # Same properties after eject and insert of another disc
+    toc.counts = (0, 1)
+    assert classifier.classify('/dev/sr0', CD) is DiscType.AUDIO_CD
+    classifier.invalidate('/dev/sr0')
+    assert classifier.classify('/dev/sr0', CD) is DiscType.DATA_CD
+    assert toc.reads == 2
+
+    # Invalidating an unknown drive is harmless
+    classifier.invalidate('/dev/sr9')
@@ -0,0 +1,173 @@
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from autoripper.control import (  # noqa: E402
+    ControlClient,
+    ControlError,
+    ControlServer,
+    METHOD_NOT_FOUND,
+    RPCError,
+)
+
+CLIENTS = 32
+CALLS = 50
+
+
+class FakeWatchdog:
+    paused = False
+    queued = [('/dev/sr2', 'audio')]
+
+    def __init__(self):
+        self.ejected = []
+
+    def drives(self):
+        return ['/dev/sr0', '/dev/sr1', '/dev/sr2']
+
+    def active(self):
+        return [('/dev/sr0', 'video')]
+
+    def eject(self, dev):
+        self.ejected.append(dev)
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+
+class FakeProgress:
+    def snapshot(self):
+        return {'/dev/sr0': {'type': 'video'}}
+
+    def cancel_rip(self, dev):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    control = ControlServer(
+        FakeWatchdog(),
+        FakeProgress(),
+        path=str(tmp_path / 'control.sock'),
+    )
+    control.start()
+    yield control
+    control.stop()
+
+
+def test_socket_permissions(server):
+    assert os.stat(server.path).st_mode & 0o777 == 0o600
+
+
+def test_live_socket_not_replaced(server):
+    other = ControlServer(FakeWatchdog(), FakeProgress(), path=server.path)
+    with pytest.raises(ControlError):
+        other.start()
+    with ControlClient(server.path) as client:
+        assert client.call('list_drives')
+
+
+def test_stale_socket_replaced(server):
+    path = server.path
+    server._server.server_close()
+    server._server = None
+    assert os.path.exists(path)
+
+    other = ControlServer(FakeWatchdog(), FakeProgress(), path=path)
+    other.start()
+    try:
+        with ControlClient(path) as client:
+            assert client.call('list_drives')
+    finally:
+        other.stop()
+
+
+def test_unknown_method(server):
+    with ControlClient(server.path) as client:
+        with pytest.raises(RPCError) as err:
+            client.call('no_such_method')
+    assert err.value.code == METHOD_NOT_FOUND
+
+
+def test_concurrent_clients(server):
+    errors = []
+
+    def run():
+        try:
+            with ControlClient(server.path) as client:
+                for i in range(CALLS):
+                    if i % 2:
+                        rips = client.call('list_rips')
+                        assert rips['rips'] == {'/dev/sr0': {'type': 'video'}}
+                        assert rips['queued'] == [
+                            {'dev': '/dev/sr2', 'type': 'audio'},
+                        ]
+                    else:
+                        drives = client.call('list_drives')
+                        assert [d['busy'] for d in drives] == [
+                            True, False, False,
+                        ]
+                    # Client ids count up and each response carries the
+                    # id of its request; call() returned in order
+                    assert client._id == i + 1
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=run) for _ in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    assert not errors
+    assert not any(thread.is_alive() for thread in threads)
+
+
+class FakeSettings:
+    def __init__(self):
+        self.version = 1
+        self.values = {}
+
+    def update(self, section, values):
+        self.values.setdefault(section, {}).update(values)
+        self.version += 1
+
+
+def test_set_settings_returns_new_version(tmp_path):
+    from PyQt5 import QtCore
+
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    settings = FakeSettings()
+    control = ControlServer(
+        FakeWatchdog(),
+        FakeProgress(),
+        settings=settings,
+        path=str(tmp_path / 'control.sock'),
+    )
+    control.start()
+
+    result = {}
+
+    def run():
+        with ControlClient(control.path) as client:
+            result['version'] = client.call(
+                'set_settings',
+                section='video',
+                everything=True,
+            )
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    # Settings are applied in this (the GUI) thread
+    while thread.is_alive():
+        app.processEvents()
+        thread.join(timeout=0.01)
+    control.stop()
+
+    assert result['version'] == 2
+    assert settings.values == {'video': {'everything': True}}
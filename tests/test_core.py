@@ -0,0 +1,303 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from autoripper import core  # noqa: E402
+from autoripper.core import (  # noqa: E402
+    DECLINED,
+    EJECTED,
+    FINISHED,
+    INSERT,
+    Core,
+    RipQueue,
+    SimulatedRipper,
+    SimulatedSource,
+    UdevSource,
+    run_command,
+)
+from autoripper.watchdogs import CHANGE, EJECT, KEY, STATUS  # noqa: E402
+
+
+class FakeDevice:
+    def __init__(self, **props):
+        self.properties = props
+
+
+def change(dev):
+    return FakeDevice(**{KEY: dev, CHANGE: '1', STATUS: 'complete'})
+
+
+def eject(dev):
+    return FakeDevice(**{KEY: dev, EJECT: '1'})
+
+
+@pytest.fixture
+def udev(monkeypatch):
+    monkeypatch.setattr(
+        core,
+        'pyudev',
+        types.SimpleNamespace(Context=lambda: None),
+    )
+
+
+async def collect(queue, count, timeout=5.0):
+    return [
+        await asyncio.wait_for(queue.get(), timeout)
+        for _ in range(count)
+    ]
+
+
+def test_udev_probes_concurrently(udev):
+    # Probes block reading the disc; two drives must not take twice as long
+    delay = 0.3
+
+    def probe(dev):
+        time.sleep(delay)
+        return {'/dev/sr0': 'video', '/dev/sr1': None}[dev]
+
+    async def run():
+        source = UdevSource(probe=probe, scan=False)
+        source._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        source._parse(loop, change('/dev/sr0'))
+        source._parse(loop, change('/dev/sr1'))
+        events = await collect(source._queue, 2)
+        return events, time.monotonic() - start, source
+
+    events, elapsed, source = asyncio.run(run())
+    assert elapsed < 2 * delay
+    assert sorted((event.kind, event.dev) for event in events) == [
+        (DECLINED, '/dev/sr1'),
+        (INSERT, '/dev/sr0'),
+    ]
+    assert source._probes == {}
+
+
+def test_udev_eject_cancels_probe(udev):
+    release = threading.Event()
+
+    def probe(dev):
+        release.wait(5.0)
+        return 'video'
+
+    async def run():
+        source = UdevSource(probe=probe, scan=False)
+        source._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        source._parse(loop, change('/dev/sr0'))
+        source._parse(loop, eject('/dev/sr0'))
+        release.set()
+        events = await collect(source._queue, 1)
+        await asyncio.sleep(0.1)
+        return events, source._queue.qsize()
+
+    events, pending = asyncio.run(run())
+    assert [(event.kind, event.dev) for event in events] == [
+        (EJECTED, '/dev/sr0'),
+    ]
+    # No insert reported for the disc ejected while it was probed
+    assert pending == 0
+
+
+# Ignores SIGTERM, so must be killed
+STUBBORN = (
+    "import os, signal, time; "
+    "signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+    "print(os.getpid(), flush=True); "
+    "time.sleep(30)"
+)
+
+
+def test_run_command():
+    lines = []
+    code = asyncio.run(run_command(
+        [sys.executable, '-c', 'print("a"); print("b"); exit(3)'],
+        on_line=lines.append,
+    ))
+    assert code == 3
+    assert lines == ['a', 'b']
+
+
+def test_run_command_timeout_kills():
+    lines = []
+
+    async def run():
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await run_command(
+                [sys.executable, '-c', STUBBORN],
+                on_line=lines.append,
+                timeout=0.5,
+                kill_after=0.2,
+            )
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 5.0
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(lines[0]), 0)
+
+
+def test_run_command_cancel():
+    lines = []
+
+    async def run():
+        task = asyncio.ensure_future(run_command(
+            [sys.executable, '-c', STUBBORN],
+            on_line=lines.append,
+            kill_after=0.2,
+        ))
+        while not lines:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(lines[0]), 0)
+
+
+class Rips:
+    """
+    Rips that run until released, recording what ran and finished
+
+    """
+
+    def __init__(self):
+        self.running = set()
+        self.most = 0
+        self.finished = []
+        self.release = None
+
+    async def __call__(self, dev, disc_type):
+        self.running.add(dev)
+        self.most = max(self.most, len(self.running))
+        try:
+            await self.release.wait()
+        finally:
+            self.running.discard(dev)
+        return True
+
+    async def on_finished(self, dev, ok, cancelled):
+        self.finished.append((dev, ok, cancelled))
+
+
+async def started(queue, rips):
+    rips.release = asyncio.Event()
+    queue.on_finished = rips.on_finished
+    queue.start()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_queue_dedupe_and_concurrency():
+    rips = Rips()
+
+    async def run():
+        queue = RipQueue(rips, concurrency=2)
+        await started(queue, rips)
+        assert queue.put('/dev/sr0', 'video')
+        assert not queue.put('/dev/sr0', 'video')  # Queued
+        for i in range(1, 5):
+            queue.put(f"/dev/sr{i}", 'audio')
+        await settle()
+        assert not queue.put('/dev/sr0', 'video')  # Ripping
+        assert len(queue.active) == 2
+        assert len(queue.queued) == 3
+
+        rips.release.set()
+        while len(rips.finished) < 5:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert rips.most == 2
+    assert sorted(rips.finished) == [
+        (f"/dev/sr{i}", True, False) for i in range(5)
+    ]
+
+
+def test_queue_discard():
+    rips = Rips()
+
+    async def run():
+        queue = RipQueue(rips, concurrency=1)
+        await started(queue, rips)
+        queue.put('/dev/sr0', 'video')
+        queue.put('/dev/sr1', 'video')
+        await settle()
+
+        # Disc ejected while queued, then while ripping
+        queue.discard('/dev/sr1')
+        assert queue.queued == []
+        queue.discard('/dev/sr0')
+        while not rips.finished:
+            await asyncio.sleep(0.01)
+        await settle()
+        await queue.stop()
+
+    asyncio.run(run())
+    assert rips.finished == [('/dev/sr0', False, True)]
+
+
+def test_queue_pause():
+    rips = Rips()
+
+    async def run():
+        queue = RipQueue(rips, concurrency=2)
+        await started(queue, rips)
+        queue.pause()
+        assert queue.paused
+        queue.put('/dev/sr0', 'video')
+        await settle()
+        assert queue.active == []
+        assert queue.queued == [('/dev/sr0', 'video')]
+
+        queue.resume()
+        await settle()
+        assert queue.active == ['/dev/sr0']
+        rips.release.set()
+        while not rips.finished:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert rips.finished == [('/dev/sr0', True, False)]
+
+
+@pytest.mark.parametrize('drives', [8, 2000])
+def test_core_simulated(drives):
+    source = SimulatedSource(drives, delay=(0.01, 0.2), seed=1)
+    ripper = SimulatedRipper(duration=(0.01, 0.1), failure_rate=0.2, seed=1)
+    app = Core(source, rip=ripper, concurrency=64)
+    inserted = set()
+    finished = []
+    app.subscribe(INSERT, lambda dev, disc_type: inserted.add(dev))
+    app.subscribe(FINISHED, lambda dev, ok: finished.append(ok))
+
+    async def run():
+        asyncio.get_running_loop().call_later(1.5, app.stop)
+        await app.run()
+
+    asyncio.run(run())
+    stats = app.stats
+    assert inserted == set(source.devs)
+    assert stats['inserts'] >= drives
+    assert stats['ok'] > 0 and stats['failed'] > 0
+    assert len(finished) == (
+        stats['ok'] + stats['failed'] + stats['cancelled']
+    )
+    if drives < 64:
+        # Discs are ejected after their rip, so drives get more discs
+        assert stats['inserts'] > drives
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from PyQt5 import QtCore  # noqa: E402
+
+from autoripper.watchdogs import base, fingerprint  # noqa: E402
+from autoripper.watchdogs.fingerprint import FingerprintIndex  # noqa: E402
+
+DEV = '/dev/sr0'
+FP = 'abc123'
+
+
+class FakeProgress(QtCore.QObject):
+    CANCEL = QtCore.pyqtSignal(str)
+
+
+class FakeAudioHandler(QtCore.QObject):
+    """
+    Audio handler; like cdripper's, it never signals success or failure
+
+    """
+
+    FINISHED = QtCore.pyqtSignal()
+    EJECT_DISC = QtCore.pyqtSignal()
+
+    def __init__(self, dev, progress):
+        super().__init__()
+        self.dev = dev
+
+    def wait(self):
+        return True
+
+    def cancel(self, dev):
+        pass
+
+
+@pytest.fixture
+def watchdog(tmp_path, monkeypatch):
+    monkeypatch.setattr(base, 'AudioDiscHandler', FakeAudioHandler)
+    watchdog = base.BaseWatchdog(FakeProgress())
+    watchdog.duplicates = fingerprint.SKIP
+    watchdog.fingerprints = FingerprintIndex(str(tmp_path / 'fp.db'))
+    yield watchdog
+    watchdog.fingerprints.close()
+
+
+def rip(watchdog, cancel=False):
+    watchdog._pending_fp[DEV] = FP
+    watchdog.HANDLE_INSERT.emit(DEV, 'audio')
+    handlers = list(watchdog._mounted)
+    if cancel:
+        watchdog.progress.CANCEL.emit(DEV)
+    for handler in handlers:
+        handler.FINISHED.emit()
+    return len(handlers)
+
+
+def test_audio_ripped(watchdog):
+    assert rip(watchdog) == 1
+    assert watchdog.fingerprints.lookup(FP)['status'] == fingerprint.RIPPED
+
+    # Same disc again is a duplicate and is not ripped
+    assert rip(watchdog) == 0
+
+
+def test_audio_cancelled(watchdog):
+    assert rip(watchdog, cancel=True) == 1
+    assert watchdog.fingerprints.lookup(FP) is None
+    assert rip(watchdog) == 1
@@ -0,0 +1,59 @@
+import pytest
+
+from autoripper.history import FAILED, OK, UNKNOWN, HistoryStore
+
+MODEL = 'PIONEER BD-RW BDR-209D'
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(path=str(tmp_path / 'history.db'))
+    # Two drives of the same model
+    store._identity = {
+        '/dev/sr0': (MODEL, f"{MODEL} (SN0)"),
+        '/dev/sr1': (MODEL, f"{MODEL} (SN1)"),
+    }
+    yield store
+    store.close()
+
+
+def flush(store):
+    store._pool.submit(lambda: None).result()
+
+
+def test_per_drive(store, tmp_path):
+    output = tmp_path / 'title.mkv'
+    output.write_bytes(b'x' * 1000)
+
+    for dev in ('/dev/sr0', '/dev/sr1'):
+        store.started(dev)
+        store.finished(dev, 'video', OK, str(output))
+    flush(store)
+
+    rows = store.throughput_by_drive()
+    assert sorted(row['drive'] for row in rows) == [
+        f"{MODEL} (SN0)",
+        f"{MODEL} (SN1)",
+    ]
+    assert all(row['model'] == MODEL for row in rows)
+    assert all(row['bytes'] == 1000 for row in rows)
+
+
+def test_audio_size(store):
+    store.started('/dev/sr0')
+    store.next_file('/dev/sr0')
+    store.file_size('/dev/sr0', 300)
+    store.next_file('/dev/sr0')
+    store.file_size('/dev/sr0', 100)
+    store.file_size('/dev/sr0', 200)
+    store.finished('/dev/sr0', 'audio', UNKNOWN, None)
+
+    store.started('/dev/sr1')
+    store.finished('/dev/sr1', 'audio', FAILED, None)
+    flush(store)
+
+    # Rips of unknown outcome count, failed rips do not
+    rows = store.throughput_by_drive()
+    assert [row['drive'] for row in rows] == [f"{MODEL} (SN0)"]
+    assert rows[0]['bytes'] == 500
+    assert store.recent(1)[0]['model'] == MODEL
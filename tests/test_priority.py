@@ -0,0 +1,183 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from autoripper import priority  # noqa: E402
+from autoripper.priority import POST, RIP  # noqa: E402
+
+# Set to a directory on a real disk (not tmpfs) to run the benchmark
+BENCHMARK = os.environ.get('AUTORIPPER_BENCHMARK', '')
+SECONDS = 10.0  # Duration of each benchmark run
+CONTENDERS = 4  # Post-processing writers competing with the rip
+FILE_SIZE = 256 * 2**20
+
+# Stand-in for a rip: read a file uncached, report bytes per second
+READER = """
+import os, sys, time
+fd = os.open(sys.argv[1], os.O_RDONLY)
+seconds = float(sys.argv[2])
+done = 0
+end = time.monotonic() + seconds
+while time.monotonic() < end:
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    os.lseek(fd, 0, os.SEEK_SET)
+    while time.monotonic() < end:
+        data = os.read(fd, 2**20)
+        if not data:
+            break
+        done += len(data)
+print(done / seconds)
+"""
+
+# Stand-in for post-processing: write and sync a file until killed
+WRITER = """
+import os, sys
+data = os.urandom(2**20)
+while True:
+    with open(sys.argv[1], 'wb') as oid:
+        for _ in range(64):
+            oid.write(data)
+        oid.flush()
+        os.fsync(oid.fileno())
+"""
+
+
+@pytest.mark.parametrize(
+    'procs, hosts, expected',
+    [
+        # Worker process running makemkvcon, and a sibling encoder
+        (
+            {
+                10: ('python3', 1),
+                11: ('makemkvcon', 10),
+                12: ('flac', 1),
+            },
+            (),
+            {10: RIP, 11: RIP, 12: POST},
+        ),
+        # Rip command started through a shell
+        (
+            {
+                10: ('sh', 1),
+                11: ('cdparanoia', 10),
+                12: ('eject', 1),
+            },
+            (),
+            {10: RIP, 11: RIP, 12: POST},
+        ),
+        # Worker that has not started its rip command yet
+        (
+            {10: ('python3', 1), 12: ('flac', 10)},
+            (10,),
+            {10: RIP, 12: POST},
+        ),
+        # Hosts that already exited are ignored
+        ({12: ('flac', 1)}, (10,), {12: POST}),
+    ],
+)
+def test_roles(procs, hosts, expected):
+    assert priority.roles(procs, hosts=hosts) == expected
+
+
+@pytest.mark.parametrize(
+    'role, busy, expected',
+    [
+        (RIP, True, priority.IOPRIO_HIGH),
+        (POST, True, priority.IOPRIO_IDLE),
+        (RIP, False, priority.IOPRIO_DEFAULT),
+        (POST, False, priority.IOPRIO_DEFAULT),
+    ],
+)
+def test_io_priority(role, busy, expected):
+    assert priority.io_priority(role, busy) == expected
+
+
+def _ioprio_supported() -> bool:
+    # Probe on a child so the priority of the test process is untouched
+    child = subprocess.Popen(['sleep', '10'])
+    try:
+        return priority.ioprio_set(child.pid, priority.IOPRIO_DEFAULT)
+    finally:
+        child.kill()
+        child.wait()
+
+
+def _rip_throughput(path, writers=(), policy=False) -> float:
+    reader = subprocess.Popen(
+        [sys.executable, '-c', READER, path, str(SECONDS)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    if policy:
+        priority.ioprio_set(reader.pid, priority.io_priority(RIP, True))
+        for proc in writers:
+            priority.ioprio_set(proc.pid, priority.io_priority(POST, True))
+    out, _ = reader.communicate()
+    return float(out)
+
+
+def _contention(tmpdir) -> dict:
+    path = os.path.join(tmpdir, 'rip.bin')
+    with open(path, 'wb') as oid:
+        for _ in range(FILE_SIZE // 2**20):
+            oid.write(os.urandom(2**20))
+
+    results = {'uncontended': _rip_throughput(path)}
+    for name, policy in (('contended', False), ('contended+policy', True)):
+        writers = [
+            subprocess.Popen([
+                sys.executable,
+                '-c',
+                WRITER,
+                os.path.join(tmpdir, f"post{i}.bin"),
+            ])
+            for i in range(CONTENDERS)
+        ]
+        time.sleep(1.0)  # Let writers fill the queues
+        try:
+            results[name] = _rip_throughput(path, writers, policy)
+        finally:
+            for proc in writers:
+                proc.kill()
+                proc.wait()
+    return results
+
+
+@pytest.mark.skipif(
+    not os.path.isdir(BENCHMARK),
+    reason='Set AUTORIPPER_BENCHMARK to a directory on disk to run',
+)
+@pytest.mark.skipif(
+    not _ioprio_supported(),
+    reason='IO priorities not supported',
+)
+def test_benchmark_contention():
+    """
+    Rip throughput alone, against post-processing, and with the policy
+
+    Differences depend on the IO scheduler of the disk (e.g., BFQ honors
+    IO priorities); run with -s to see the results.
+
+    """
+
+    tmpdir = tempfile.mkdtemp(prefix='autoripper-', dir=BENCHMARK)
+    try:
+        results = _contention(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    base = results['uncontended']
+    print()
+    for name, rate in results.items():
+        print(
+            f"{name:>18}: {rate / 2**20:8.1f} MiB/s "
+            f"({100 * rate / base:5.1f}%)"
+        )
+    assert all(rate > 0 for rate in results.values())
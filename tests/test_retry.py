@@ -0,0 +1,175 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from PyQt5 import QtCore  # noqa: E402
+
+from autoripper.watchdogs.retry import RetryEngine  # noqa: E402
+
+MODEL = 'PIONEER BD-RW BDR-209D'
+BACKOFF = 0.02
+
+
+class FakeWatchdog(QtCore.QObject):
+    HANDLE_INSERT = QtCore.pyqtSignal(str, str)
+
+    def __init__(self):
+        super().__init__()
+        self.discs = {}  # Disc type in each drive
+        self.inserts = []
+        self.ejected = []
+        self.probed_in = []
+        self.HANDLE_INSERT.connect(
+            lambda dev, disc_type: self.inserts.append((dev, disc_type))
+        )
+
+    def probe(self, dev):
+        self.probed_in.append(threading.current_thread())
+        return self.discs.get(dev, None)
+
+    def eject(self, dev):
+        self.ejected.append(dev)
+
+
+@pytest.fixture
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def watchdog():
+    return FakeWatchdog()
+
+
+@pytest.fixture
+def engine(tmp_path, watchdog):
+    engine = RetryEngine(
+        watchdog,
+        min_attempts=3,
+        backoff=BACKOFF,
+        path=tmp_path / 'stats.json',
+    )
+    # Two drives of the same model
+    engine._identity = {
+        '/dev/sr0': (MODEL, f"{MODEL} (SN0)"),
+        '/dev/sr1': (MODEL, f"{MODEL} (SN1)"),
+    }
+    yield engine
+    engine.close()
+
+
+def spin(app, until, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not until() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    app.processEvents()
+
+
+def test_health_per_drive(engine):
+    unhealthy = []
+    engine.UNHEALTHY.connect(lambda dev, drive: unhealthy.append(drive))
+
+    for _ in range(3):
+        engine.record('/dev/sr0', False)
+        engine.record('/dev/sr1', True)
+
+    assert not engine.healthy('/dev/sr0')
+    assert engine.healthy('/dev/sr1')
+    assert unhealthy == [f"{MODEL} (SN0)"]
+    # Model totals are kept, but only as statistics
+    assert engine.models[MODEL] == (6, 3)
+
+
+def test_health_decays(engine):
+    for _ in range(3):
+        engine.record('/dev/sr0', False)
+    assert not engine.healthy('/dev/sr0')
+
+    entry = engine.drives[f"{MODEL} (SN0)"]
+    entry['updated'] = time.time() - engine.half_life
+    assert engine.failure_rate('/dev/sr0') == pytest.approx(1.0)
+    assert engine.healthy('/dev/sr0')
+
+
+def test_reset(engine):
+    for _ in range(3):
+        engine.record('/dev/sr0', False)
+    engine.reset('/dev/sr0')
+    assert engine.healthy('/dev/sr0')
+    assert engine.failure_rate('/dev/sr0') == 0.0
+
+
+def test_persisted(engine):
+    for _ in range(3):
+        engine.record('/dev/sr0', False)
+
+    other = RetryEngine(None, min_attempts=3, path=engine.path)
+    other._identity = engine._identity
+    assert not other.healthy('/dev/sr0')
+    assert other.healthy('/dev/sr1')
+    other.close()
+
+
+def test_retry_backoff(app, watchdog, engine):
+    watchdog.discs['/dev/sr0'] = 'video'
+    retries = []
+    engine.RETRY.connect(lambda dev, retry: retries.append(retry))
+
+    engine.finished('/dev/sr0', 'video', False)
+    spin(app, lambda: retries)
+    assert retries == [1]
+    assert watchdog.inserts == [('/dev/sr0', 'video')]
+    # Disc was probed off the GUI thread
+    assert watchdog.probed_in[0] is not threading.main_thread()
+
+    # Second retry waits twice as long
+    start = time.monotonic()
+    engine.finished('/dev/sr0', 'video', False)
+    spin(app, lambda: len(retries) == 2)
+    assert retries == [1, 2]
+    assert time.monotonic() - start >= 2 * BACKOFF
+
+    # Gives up after max_retries
+    engine.finished('/dev/sr0', 'video', False)
+    assert engine._attempts == {}
+
+
+def test_retry_success_resets(app, watchdog, engine):
+    watchdog.discs['/dev/sr0'] = 'audio'
+    engine.finished('/dev/sr0', 'audio', False)
+    assert engine._attempts == {'/dev/sr0': 1}
+    engine.finished('/dev/sr0', 'audio', True)
+    assert engine._attempts == {}
+
+
+@pytest.mark.parametrize(
+    'ok, cancelled',
+    [(None, False), (False, True)],
+)
+def test_not_counted(engine, ok, cancelled):
+    engine.finished('/dev/sr0', 'audio', ok, cancelled=cancelled)
+    assert engine._attempts == {}
+    assert engine.drives == {}
+
+
+def test_retry_disc_removed(app, watchdog, engine):
+    engine.finished('/dev/sr0', 'video', False)
+    spin(app, lambda: watchdog.probed_in)
+    spin(app, lambda: not engine._attempts)
+    assert engine._attempts == {}
+    assert watchdog.inserts == []
+
+
+def test_retry_unhealthy(app, watchdog, engine):
+    watchdog.discs['/dev/sr0'] = 'video'
+    for _ in range(2):
+        engine.record('/dev/sr0', False)
+
+    engine.finished('/dev/sr0', 'video', False)
+    spin(app, lambda: watchdog.ejected)
+    assert watchdog.ejected == ['/dev/sr0']
+    assert watchdog.inserts == []
@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+
+import pytest
+
+from autoripper.shared_progress import RIPPING, SharedProgress
+
+
+@pytest.fixture
+def table():
+    table = SharedProgress(slots=4)
+    yield table
+    table.close()
+
+
+def _crash(name, index):
+    table = SharedProgress(name=name, create=False)
+    slot = table.slot(index)
+    slot.write(10, 100)
+    # Die between the two halves of a write, leaving the sequence odd
+    slot._begin()
+    os._exit(1)
+
+
+def test_read_write(table):
+    index = table.claim('/dev/sr0')
+    slot = table.slot(index)
+    slot.set_state(RIPPING)
+    slot.set_title(2)
+    slot.write(50, 100)
+
+    state, title, done, total, _ = table.sample()['/dev/sr0']
+    assert (state, title, done, total) == (RIPPING, 2, 50, 100)
+
+    table.release('/dev/sr0')
+    assert table.sample() == {}
+
+
+def test_restart_after_crash(table):
+    index = table.claim('/dev/sr0')
+    proc = multiprocessing.get_context('fork').Process(
+        target=_crash,
+        args=(table.name, index),
+    )
+    proc.start()
+    proc.join()
+    assert proc.exitcode == 1
+    assert table.read(index) is None
+
+    # Restarted worker claims the drive again
+    assert table.claim('/dev/sr0') == index
+    slot = table.slot(index)
+    slot.write(20, 100)
+    _, _, done, total, _ = table.sample()['/dev/sr0']
+    assert (done, total) == (20, 100)
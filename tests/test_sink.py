@@ -0,0 +1,130 @@
+import errno
+import os
+import shutil
+import tempfile
+import time
+from functools import partial
+
+import pytest
+
+from autoripper.sink import (
+    FileSink,
+    SimulatedShare,
+    SinkTimeout,
+)
+
+# Set to a directory (e.g., on a mounted share) to run the benchmark
+BENCHMARK = os.environ.get('AUTORIPPER_BENCHMARK', '')
+BUFFER_SIZES = (4 * 2**10, 64 * 2**10, 2**20, 16 * 2**20)  # Bytes/write
+TOTAL = 256 * 2**20  # Bytes written per benchmark case
+
+
+def test_write_file(tmp_path):
+    sink = FileSink(str(tmp_path))
+    sink.write_file('title.mkv.sha256', 'abc  title.mkv\n')
+    sink.close()
+
+    assert os.listdir(tmp_path) == ['title.mkv.sha256']
+    with open(tmp_path / 'title.mkv.sha256') as iid:
+        assert iid.read() == 'abc  title.mkv\n'
+
+
+def test_retry_transient(tmp_path):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OSError(errno.ESTALE, 'Stale file handle')
+        return 'ok'
+
+    sink = FileSink(str(tmp_path), retries=3, backoff=0.01)
+    assert sink.call(flaky) == 'ok'
+    assert len(calls) == 3
+    sink.close()
+
+
+def test_no_retry_permanent(tmp_path):
+    sink = FileSink(str(tmp_path), retries=3, backoff=0.01)
+    with pytest.raises(FileNotFoundError):
+        sink.remove('missing')
+    sink.close()
+
+
+def test_timeout(tmp_path):
+    sink = SimulatedShare(str(tmp_path), hang=1.0, hang_time=1.0)
+    sink.timeout = 0.1
+    start = time.monotonic()
+    with pytest.raises(SinkTimeout):
+        sink.write_file('title.mkv.sha256', 'abc')
+    assert time.monotonic() - start < 0.5
+    sink.close()
+
+
+def test_failures_exhaust_retries(tmp_path):
+    sink = SimulatedShare(
+        str(tmp_path),
+        failure_rate=1.0,
+        retries=2,
+        backoff=0.01,
+    )
+    with pytest.raises(OSError):
+        sink.write_file('title.mkv.sha256', 'abc')
+    assert sink.calls == 3
+    assert not os.path.exists(tmp_path / 'title.mkv.sha256')
+    sink.close()
+
+
+def _write(path, data, count, sink=None) -> float:
+    """
+    Write data count times with unbuffered writes; bytes per second
+
+    """
+
+    write = os.write if sink is None else partial(sink.call, os.write)
+    start = time.perf_counter()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        for _ in range(count):
+            write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return count * len(data) / (time.perf_counter() - start)
+
+
+@pytest.mark.skipif(
+    not os.path.isdir(BENCHMARK),
+    reason='Set AUTORIPPER_BENCHMARK to a directory to run',
+)
+def test_benchmark_buffer_sizes():
+    """
+    Write throughput to the output directory by buffer (write) size
+
+    Each size is written directly and with every write run through a
+    FileSink, which shows the cost of the sink's timeouts per call. Run
+    with -s to see the results.
+
+    """
+
+    tmpdir = tempfile.mkdtemp(prefix='autoripper-', dir=BENCHMARK)
+    sink = FileSink(tmpdir)
+    try:
+        print()
+        print(f"{'buffer':>10} {'direct':>13} {'sink':>13}")
+        for size in BUFFER_SIZES:
+            data = os.urandom(size)
+            count = max(TOTAL // size, 1)
+            path = os.path.join(tmpdir, 'output.bin')
+            rates = [
+                _write(path, data, count),
+                _write(path, data, count, sink),
+            ]
+            print(f"{size:>10}", end='')
+            for rate in rates:
+                print(f" {rate / 2**20:>8.1f} MiB/s", end='')
+            print()
+            assert all(rate > 0 for rate in rates)
+    finally:
+        sink.close()
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,190 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from PyQt5 import QtCore  # noqa: E402
+
+from autoripper.watchdogs import RUNNING  # noqa: E402
+
+WM_DEVICECHANGE = 0x0219
+CDROM = 5
+VOLUME = 2
+ARRIVAL = 0x8000
+REMOVAL = 0x8004
+
+
+class FakeError(Exception):
+    pass
+
+
+class FakeWin32:
+    """
+    Drives and volumes seen through the fake win32 modules
+
+    """
+
+    def __init__(self):
+        self.cdroms = {'D:', 'E:'}
+        self.volumes = {}
+        self.messages = []  # Pending (msg, wparam, lparam) for window
+        self.arriving = {}  # Volumes mounted when messages are delivered
+        self.wndproc = None
+
+    def RegisterClass(self, wc):
+        self.wndproc = wc.lpfnWndProc
+
+    def PumpWaitingMessages(self):
+        if not self.messages:
+            # Nothing left to deliver; end the watchdog loop
+            RUNNING.set()
+        self.volumes.update(self.arriving)
+        while self.messages:
+            msg, wparam, lparam = self.messages.pop(0)
+            self.wndproc[msg](1, msg, wparam, lparam)
+
+    def UnpackDEV_BROADCAST(self, lparam):
+        if lparam is None:
+            raise FakeError('Bad broadcast')
+        return lparam
+
+    def GetDriveType(self, path):
+        return CDROM if path.rstrip('\\') in self.cdroms else 3
+
+    def GetVolumeInformation(self, path):
+        volume = self.volumes.get(path.rstrip('\\'), None)
+        if volume is None:
+            raise FakeError(21, 'GetVolumeInformation', 'Device not ready')
+        return volume
+
+
+class FakeProgress(QtCore.QObject):
+    CANCEL = QtCore.pyqtSignal(str)
+
+
+def mask(*letters):
+    return sum(1 << (ord(letter[0]) - 65) for letter in letters)
+
+
+@pytest.fixture
+def win32(monkeypatch):
+    fake = FakeWin32()
+    modules = {
+        'win32con': types.SimpleNamespace(
+            WM_DEVICECHANGE=WM_DEVICECHANGE,
+            DBT_DEVICEARRIVAL=ARRIVAL,
+            DBT_DEVICEREMOVECOMPLETE=REMOVAL,
+            DBT_DEVTYP_VOLUME=VOLUME,
+        ),
+        'win32api': types.SimpleNamespace(
+            error=FakeError,
+            GetVolumeInformation=fake.GetVolumeInformation,
+            GetLogicalDrives=lambda: mask(*fake.cdroms, 'C:'),
+            GetModuleHandle=lambda name: 0,
+        ),
+        'win32file': types.SimpleNamespace(
+            DRIVE_CDROM=CDROM,
+            GetDriveType=fake.GetDriveType,
+        ),
+        'win32gui': types.SimpleNamespace(
+            error=FakeError,
+            WNDCLASS=types.SimpleNamespace,
+            RegisterClass=fake.RegisterClass,
+            CreateWindowEx=lambda *args: 1,
+            DestroyWindow=lambda hwnd: None,
+            PumpWaitingMessages=fake.PumpWaitingMessages,
+        ),
+        'win32gui_struct': types.SimpleNamespace(
+            UnpackDEV_BROADCAST=fake.UnpackDEV_BROADCAST,
+        ),
+    }
+    for name, module in modules.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.delitem(
+        sys.modules,
+        'autoripper.watchdogs.windows',
+        raising=False,
+    )
+    yield fake
+    RUNNING.clear()
+
+
+@pytest.fixture
+def watchdog(win32):
+    windows = importlib.import_module('autoripper.watchdogs.windows')
+    watchdog = windows.Watchdog(FakeProgress())
+    watchdog.inserts = []
+    watchdog.HANDLE_INSERT.disconnect()
+    watchdog.HANDLE_INSERT.connect(
+        lambda dev, disc_type: watchdog.inserts.append((dev, disc_type))
+    )
+    return watchdog
+
+
+def test_drives(watchdog):
+    assert watchdog.drives() == ['D:', 'E:']
+
+
+@pytest.mark.parametrize(
+    'fs, disc_type',
+    [('CDFS', 'audio'), ('UDF', 'video')],
+)
+def test_arrival(win32, watchdog, fs, disc_type):
+    win32.volumes['D:'] = ('DISC', 1234, 255, 0, fs)
+    watchdog.process_device_change(VOLUME, mask('D:'), True)
+    assert watchdog.inserts == [('D:', disc_type)]
+
+
+def test_arrival_not_cdrom(win32, watchdog):
+    win32.volumes['F:'] = ('USB', 1, 255, 0, 'FAT32')
+    watchdog.process_device_change(VOLUME, mask('F:'), True)
+    assert watchdog.inserts == []
+
+
+def test_arrival_not_volume(win32, watchdog):
+    win32.volumes['D:'] = ('DISC', 1234, 255, 0, 'CDFS')
+    watchdog.process_device_change(0, mask('D:'), True)
+    assert watchdog.inserts == []
+
+
+def test_not_ready(win32, watchdog):
+    # D: raises; E: in the same event must still be handled
+    win32.volumes['E:'] = ('DISC', 1234, 255, 0, 'CDFS')
+    watchdog.process_device_change(VOLUME, mask('D:', 'E:'), True)
+    assert watchdog.inserts == [('E:', 'audio')]
+
+
+def test_removal(win32, watchdog):
+    win32.volumes['D:'] = ('DISC', 1234, 255, 0, 'CDFS')
+    watchdog.process_device_change(VOLUME, mask('D:'), True)
+    assert 'D:' in watchdog._classifier._cache
+
+    watchdog.process_device_change(VOLUME, mask('D:'), False)
+    assert 'D:' not in watchdog._classifier._cache
+    assert watchdog.inserts == [('D:', 'audio')]
+
+
+def test_probe(win32, watchdog):
+    win32.volumes['D:'] = ('DISC', 1234, 255, 0, 'UDF')
+    assert watchdog.probe('D:') == 'video'
+    assert watchdog.probe('E:') is None
+
+
+def test_event_handler(win32, watchdog):
+    # D: is not ready yet; E: in the same broadcast must still be handled
+    win32.arriving['E:'] = ('DISC', 1234, 255, 0, 'UDF')
+    volume = types.SimpleNamespace(
+        devicetype=VOLUME,
+        unitmask=mask('D:', 'E:'),
+    )
+    win32.messages = [
+        (WM_DEVICECHANGE, ARRIVAL, None),  # Broadcast that fails to unpack
+        (WM_DEVICECHANGE, ARRIVAL, volume),
+    ]
+
+    watchdog.run()
+    assert watchdog.inserts == [('E:', 'video')]
+    assert watchdog.hwnd is None